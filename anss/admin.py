@@ -1,12 +1,156 @@
+import calendar
+from datetime import MAXYEAR, MINYEAR, datetime, timedelta, timezone
+
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
 from django.contrib.gis.admin import GeoModelAdmin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Min
+from django.utils.functional import cached_property
+
+from anss import cache
+from anss.models import AlertDelivery, AlertSubscription, Feed, FeedEarthquake, Region
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    A paginator that estimates the size of huge, unfiltered tables instead of counting every row.
+    """
+
+    # Tables smaller than this are counted exactly
+    threshold = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == "postgresql" and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row and row[0] >= self.threshold:
+                return int(row[0])
+        return super().count
+
+
+class CachedChoicesListFilter(admin.SimpleListFilter):
+    """
+    Filters on an earthquake field using cached choices instead of a scan of the whole table.
+
+    Subclasses set the field with parameter_name. Like Django's own filters, nulls get a choice of their own.
+    """
+
+    # The parameter value that selects nulls
+    null_value = "__null__"
+
+    def __init__(self, request, params, model, model_admin):
+        self.title = model._meta.get_field(self.parameter_name).verbose_name
+        self.empty_value_display = model_admin.get_empty_value_display()
+        super().__init__(request, params, model, model_admin)
+
+    def lookups(self, request, model_admin):
+        return [
+            (self.null_value, self.empty_value_display) if v is None else (str(v), str(v) or "(blank)")
+            for v in cache.get_filter_choices(self.parameter_name)
+        ]
 
-from anss.models import Feed, FeedEarthquake
+    def queryset(self, request, queryset):
+        if self.value() is None:
+            return queryset
+        if self.value() == self.null_value:
+            return queryset.filter(**{f"{self.parameter_name}__isnull": True})
+        return queryset.filter(**{self.parameter_name: self.value()})
+
+
+def cached_choices_filter(field_name):
+    """
+    Returns a CachedChoicesListFilter for the provided field.
+    """
+    return type(
+        f"{field_name}CachedChoicesListFilter",
+        (CachedChoicesListFilter,),
+        {"parameter_name": field_name},
+    )
+
+
+class OccurredListFilter(admin.SimpleListFilter):
+    """
+    Drills down by the year, month and day earthquakes occurred.
+
+    Choices come from the range of the indexed occurred_datetime field, so no distinct dates are computed.
+    """
+
+    title = "occurred at"
+    parameter_name = "occurred"
+
+    def get_parts(self):
+        """
+        Returns the year, month and day selected, with None for any that were not.
+        """
+        try:
+            parts = [int(p) for p in self.value().split("-")]
+            if len(parts) > 3:
+                raise ValueError
+            # The range filtered on ends at the start of the next year, which must exist too
+            if not MINYEAR <= parts[0] < MAXYEAR:
+                raise ValueError
+            # Make sure the parts form a real date
+            datetime(*parts, *[1] * (3 - len(parts)))
+        except ValueError:
+            raise IncorrectLookupParameters(f"Invalid date {self.value()}")
+        return parts + [None] * (3 - len(parts))
+
+    def lookups(self, request, model_admin):
+        if self.value() is None:
+            bounds = model_admin.model.objects.aggregate(
+                first=Min("occurred_datetime"), last=Max("occurred_datetime")
+            )
+            if bounds["first"] is None:
+                return []
+            years = range(bounds["last"].year, bounds["first"].year - 1, -1)
+            return [(str(y), str(y)) for y in years]
+
+        year, month, day = self.get_parts()
+        choices = [(str(year), str(year))]
+        if month is None:
+            choices += [
+                (f"{year}-{m:02d}", calendar.month_name[m]) for m in range(1, 13)
+            ]
+            return choices
+        choices.append((f"{year}-{month:02d}", f"{calendar.month_name[month]} {year}"))
+        days = calendar.monthrange(year, month)[1]
+        choices += [
+            (f"{year}-{month:02d}-{d:02d}", f"{calendar.month_abbr[month]} {d}")
+            for d in range(1, days + 1)
+        ]
+        return choices
+
+    def queryset(self, request, queryset):
+        if self.value() is None:
+            return queryset
+        year, month, day = self.get_parts()
+        if month is None:
+            start = datetime(year, 1, 1, tzinfo=timezone.utc)
+            end = datetime(year + 1, 1, 1, tzinfo=timezone.utc)
+        elif day is None:
+            start = datetime(year, month, 1, tzinfo=timezone.utc)
+            end = datetime(year + (month == 12), month % 12 + 1, 1, tzinfo=timezone.utc)
+        else:
+            start = datetime(year, month, day, tzinfo=timezone.utc)
+            end = start + timedelta(days=1)
+        return queryset.filter(occurred_datetime__gte=start, occurred_datetime__lt=end)
 
 
 @admin.register(FeedEarthquake)
 class FeedEarthquakeAdmin(GeoModelAdmin):
     point_zoom = 5
+    list_select_related = ("feed",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     list_display = (
         "usgs_id",
         "title",
@@ -47,14 +191,11 @@ class FeedEarthquakeAdmin(GeoModelAdmin):
         "types",
     )
     list_filter = (
-        "alert",
-        "net",
-        "status",
-        "tsunami",
-        "magType",
-        "type",
+        OccurredListFilter,
+        *(cached_choices_filter(f) for f in cache.FILTER_FIELDS),
     )
-    search_fields = ("usgs_id", "title", "ids")
+    # An exact match on the ID uses the btree index. The others use trigram indexes.
+    search_fields = ("usgs_id__exact", "title", "ids")
     fieldsets = (
         (
             "Identifiers",
@@ -122,6 +263,37 @@ class FeedEarthquakeAdmin(GeoModelAdmin):
         return False
 
 
+class LagListFilter(admin.SimpleListFilter):
+    """
+    Filters feeds by how long after USGS generated them they were archived.
+    """
+
+    title = "lag"
+    parameter_name = "lag"
+    buckets = {
+        "1": ("Under a minute", None, timedelta(minutes=1)),
+        "5": ("1 to 5 minutes", timedelta(minutes=1), timedelta(minutes=5)),
+        "15": ("5 to 15 minutes", timedelta(minutes=5), timedelta(minutes=15)),
+        "more": ("Over 15 minutes", timedelta(minutes=15), None),
+    }
+
+    def lookups(self, request, model_admin):
+        return [(k, v[0]) for k, v in self.buckets.items()]
+
+    def queryset(self, request, queryset):
+        if self.value() is None:
+            return queryset
+        try:
+            label, low, high = self.buckets[self.value()]
+        except KeyError:
+            raise IncorrectLookupParameters(f"Invalid lag {self.value()}")
+        if low is not None:
+            queryset = queryset.filter(lag__gte=low)
+        if high is not None:
+            queryset = queryset.filter(lag__lt=high)
+        return queryset
+
+
 @admin.register(Feed)
 class FeedAdmin(admin.ModelAdmin):
     list_display = (
@@ -129,13 +301,13 @@ class FeedAdmin(admin.ModelAdmin):
         "format",
         "type",
         "timeframe",
-        "get_generated_datetime",
+        "generated_datetime",
         "api",
         "count",
         "status",
-        "get_lag",
+        "lag",
     )
-    list_filter = ("format", "type", "timeframe", "api", "status")
+    list_filter = ("format", "type", "timeframe", "api", "status", LagListFilter)
     date_hierarchy = "archived_datetime"
     fieldsets = (
         (
@@ -160,6 +332,9 @@ class FeedAdmin(admin.ModelAdmin):
                     "archived_datetime",
                     "get_lag",
                     "content",
+                    "segment",
+                    "segment_offset",
+                    "segment_length",
                 )
             },
         ),
@@ -173,3 +348,42 @@ class FeedAdmin(admin.ModelAdmin):
 
     def has_change_permission(self, *args):
         return False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_lag()
+
+    @admin.display(description="time generated", ordering="generated_datetime")
+    def generated_datetime(self, obj):
+        return obj.generated_datetime
+
+    @admin.display(ordering="lag")
+    def lag(self, obj):
+        return obj.lag
+
+
+@admin.register(AlertSubscription)
+class AlertSubscriptionAdmin(admin.ModelAdmin):
+    list_display = ("name", "url", "active", "min_mag", "min_sig", "min_alert", "tsunami")
+    list_filter = ("active",)
+
+
+@admin.register(AlertDelivery)
+class AlertDeliveryAdmin(admin.ModelAdmin):
+    list_display = ("usgs_id", "subscription", "status", "attempts", "created_datetime", "sent_datetime")
+    list_filter = ("status", "subscription")
+    list_select_related = ("subscription",)
+    raw_id_fields = ("earthquake",)
+    date_hierarchy = "created_datetime"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, *args):
+        return False
+
+
+@admin.register(Region)
+class RegionAdmin(GeoModelAdmin):
+    list_display = ("name", "kind", "updated_datetime")
+    list_filter = ("kind",)
+    search_fields = ("name",)
@@ -0,0 +1,174 @@
+"""
+Notifies webhooks of earthquakes that cross the thresholds of an AlertSubscription.
+
+Ingest only queues an AlertDelivery for each matching earthquake revision, so a slow receiver can never hold
+up the archive. The deliveranssalerts command then sends the queue, batching each subscription's earthquakes
+into as few requests as possible and sending to many receivers at once from a bounded pool. Failed requests
+are retried with a growing delay until they run out of attempts.
+"""
+import asyncio
+import itertools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.dispatch import receiver
+from django.utils import timezone
+
+from anss import transports
+from anss.models import AlertDelivery, AlertSubscription, FeedEarthquake
+from anss.signals import feed_archived
+
+logger = logging.getLogger(__name__)
+
+# How many webhook requests are in flight at once
+CONCURRENCY = getattr(settings, "ANSS_ALERT_CONCURRENCY", 10)
+
+# Seconds to wait for a webhook to respond
+TIMEOUT = getattr(settings, "ANSS_ALERT_TIMEOUT", 10)
+
+# How many times a delivery is tried before it's marked failed
+MAX_ATTEMPTS = getattr(settings, "ANSS_ALERT_MAX_ATTEMPTS", 5)
+
+# Seconds before the first retry, doubled after each failure
+RETRY_SECONDS = getattr(settings, "ANSS_ALERT_RETRY_SECONDS", 30)
+
+
+def enqueue(feed):
+    """
+    Queues a delivery of each earthquake in the feed to every active subscription it matches.
+
+    Revisions already queued for a subscription are skipped. Earthquakes without an updated time are too,
+    since the database treats every null as a new revision and they would be queued again from every feed.
+    """
+    earthquakes = FeedEarthquake.objects.filter(feed=feed, updated__isnull=False).exclude(usgs_id="").order_by()
+    objects = []
+    for subscription in AlertSubscription.objects.filter(active=True):
+        rows = earthquakes.filter(subscription.get_filter()).values_list("pk", "usgs_id", "updated")
+        objects.extend(
+            AlertDelivery(subscription=subscription, earthquake_id=pk, usgs_id=usgs_id, updated=updated)
+            for pk, usgs_id, updated in rows
+        )
+    if not objects:
+        return
+    AlertDelivery.objects.bulk_create(objects, ignore_conflicts=True)
+    logger.debug(f"Queued alerts for {feed}")
+
+
+@receiver(feed_archived)
+def queue(sender, feed, replay=False, **kwargs):
+    """
+    Queues the alerts for a newly archived feed. Replayed feeds are old or synthetic, so they send nothing.
+    """
+    if replay:
+        return
+    enqueue(feed)
+
+
+def get_payload(delivery):
+    """
+    Returns the earthquake of a delivery as a dictionary ready to send.
+    """
+    earthquake = delivery.earthquake
+    return {
+        "usgs_id": delivery.usgs_id,
+        "updated": delivery.updated,
+        "time": earthquake.time,
+        "mag": earthquake.mag,
+        "sig": earthquake.sig,
+        "alert": earthquake.alert,
+        "tsunami": earthquake.tsunami,
+        "place": earthquake.place,
+        "longitude": earthquake.point.x if earthquake.point else None,
+        "latitude": earthquake.point.y if earthquake.point else None,
+        "url": earthquake.url,
+    }
+
+
+def get_batches(deliveries):
+    """
+    Groups deliveries into lists bound for the same subscription, no longer than its batch_size.
+    """
+    batches = []
+    ordered = sorted(deliveries, key=lambda d: d.subscription_id)
+    for _, group in itertools.groupby(ordered, key=lambda d: d.subscription_id):
+        first = next(group)
+        group = itertools.chain([first], group)
+        # A batch size of zero would never empty the group
+        size = max(1, first.subscription.batch_size)
+        while batch := list(itertools.islice(group, size)):
+            batches.append(batch)
+    return batches
+
+
+async def send_batches(batches, concurrency=CONCURRENCY, session=None, timeout=TIMEOUT):
+    """
+    Posts each batch to its subscription's webhook, at most `concurrency` at a time.
+
+    Returns an error message for each batch, or None for those that were received.
+    """
+    session = session or transports.get_session()
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    def post(url, body):
+        response = session.post(url, json=body, timeout=timeout)
+        response.raise_for_status()
+
+    async def send(batch, executor):
+        subscription = batch[0].subscription
+        body = {"subscription": subscription.name, "earthquakes": [get_payload(d) for d in batch]}
+        async with semaphore:
+            try:
+                await loop.run_in_executor(executor, post, subscription.url, body)
+            except requests.RequestException as e:
+                logger.warning(f"Alert to {subscription} failed: {e}")
+                return str(e)
+        return None
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return await asyncio.gather(*(send(batch, executor) for batch in batches))
+
+
+def get_retry_datetime(attempts, now):
+    """
+    Returns when a delivery that failed the provided number of times is tried again.
+    """
+    return now + timedelta(seconds=RETRY_SECONDS * 2 ** (attempts - 1))
+
+
+def deliver(concurrency=CONCURRENCY, limit=1000):
+    """
+    Sends up to `limit` of the deliveries that are due and returns how many were attempted.
+    """
+    now = timezone.now()
+    due = list(
+        AlertDelivery.objects.filter(status=AlertDelivery.PENDING, next_attempt_datetime__lte=now)
+        .select_related("subscription", "earthquake")
+        .order_by("id")[:limit]
+    )
+    if not due:
+        return 0
+    batches = get_batches(due)
+    errors = asyncio.run(send_batches(batches, concurrency=concurrency))
+
+    now = timezone.now()
+    for batch, error in zip(batches, errors):
+        for delivery in batch:
+            delivery.attempts += 1
+            if error is None:
+                delivery.status = AlertDelivery.SENT
+                delivery.sent_datetime = now
+                delivery.last_error = ""
+            else:
+                delivery.last_error = error
+                delivery.next_attempt_datetime = get_retry_datetime(delivery.attempts, now)
+                if delivery.attempts >= MAX_ATTEMPTS:
+                    delivery.status = AlertDelivery.FAILED
+    AlertDelivery.objects.bulk_update(
+        due, ["status", "attempts", "sent_datetime", "next_attempt_datetime", "last_error"]
+    )
+    logger.debug(f"Sent {len(due)} alerts in {len(batches)} requests")
+    return len(due)
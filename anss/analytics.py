@@ -0,0 +1,370 @@
+"""
+Statistics over the archived earthquake catalog, computed with NumPy.
+
+The latest copy of each earthquake is loaded straight from the database into columnar arrays,
+so the statistics below run as vectorized operations rather than loops over model instances.
+
+    >>> from anss import analytics
+    >>> catalog = analytics.load_catalog(start=datetime(2024, 1, 1, tzinfo=timezone.utc))
+    >>> analytics.b_value(catalog)
+"""
+import math
+from collections import namedtuple
+
+from django.contrib.gis.geos import Polygon
+from django.db import models
+
+from anss.functions import Latitude, Longitude
+from anss.models import Feed, FeedEarthquake, FirstSighting
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    raise ImportError(
+        "anss.analytics requires NumPy. Install it with `pip install django-anss-archive[analytics]`."
+    )
+
+# The columns loaded into a Catalog, in order
+COLUMNS = ("usgs_id", "net", "time", "mag", "depth", "longitude", "latitude")
+
+MILLISECONDS_PER_DAY = 24 * 60 * 60 * 1000
+
+# The percentiles included in latency reports by default
+PERCENTILES = (50, 90, 99)
+
+BValue = namedtuple("BValue", ("b", "a", "mc", "count", "error"))
+
+Latencies = namedtuple("Latencies", ("net", "mag", "latency"))
+
+Report = namedtuple("Report", ("groups", "counts", "percentiles"))
+
+
+class Catalog:
+    """
+    A set of earthquakes stored as one NumPy array per column.
+
+    Times are UNIX milliseconds. Missing magnitudes, depths and coordinates are NaN.
+    """
+
+    def __init__(self, usgs_id, net, time, mag, depth, longitude, latitude):
+        self.usgs_id = usgs_id
+        self.net = net
+        self.time = time
+        self.mag = mag
+        self.depth = depth
+        self.longitude = longitude
+        self.latitude = latitude
+
+    def __len__(self):
+        return len(self.time)
+
+    def __repr__(self):
+        return f"<Catalog: {len(self)} earthquakes>"
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Creates a catalog from a list of tuples with values in the order of COLUMNS.
+        """
+        if not rows:
+            return cls.empty()
+        usgs_id, net, time, mag, depth, longitude, latitude = zip(*rows)
+        return cls(
+            np.array(usgs_id, dtype=object),
+            np.array(net, dtype=object),
+            np.array(time, dtype=np.int64),
+            # NumPy converts None to NaN in float arrays
+            np.array(mag, dtype=np.float64),
+            np.array(depth, dtype=np.float64),
+            np.array(longitude, dtype=np.float64),
+            np.array(latitude, dtype=np.float64),
+        )
+
+    @classmethod
+    def empty(cls):
+        """
+        Creates a catalog without any earthquakes.
+        """
+        return cls(
+            np.array([], dtype=object),
+            np.array([], dtype=object),
+            np.array([], dtype=np.int64),
+            *[np.array([], dtype=np.float64) for i in range(4)],
+        )
+
+    @classmethod
+    def concatenate(cls, catalogs):
+        """
+        Combines a list of catalogs into one.
+        """
+        if not catalogs:
+            return cls.empty()
+        return cls(*[np.concatenate([getattr(c, n) for c in catalogs]) for n in COLUMNS])
+
+    def filter(self, mask):
+        """
+        Returns a new catalog with only the earthquakes where the provided boolean array is true.
+        """
+        return Catalog(*[getattr(self, n)[mask] for n in COLUMNS])
+
+    def within(self, bbox=None, start=None, end=None, min_mag=None, max_mag=None):
+        """
+        Returns a new catalog limited to a region, time span or magnitude range.
+
+        The bbox is a (west, south, east, north) tuple in degrees. A west edge greater than
+        the east edge wraps around the antimeridian. Times are timezone-aware datetimes.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if bbox is not None:
+            west, south, east, north = bbox
+            if west <= east:
+                mask &= (self.longitude >= west) & (self.longitude <= east)
+            else:
+                mask &= (self.longitude >= west) | (self.longitude <= east)
+            mask &= (self.latitude >= south) & (self.latitude <= north)
+        if start is not None:
+            mask &= self.time >= to_unix(start)
+        if end is not None:
+            mask &= self.time < to_unix(end)
+        if min_mag is not None:
+            mask &= self.mag >= min_mag
+        if max_mag is not None:
+            mask &= self.mag < max_mag
+        return self.filter(mask)
+
+
+def to_unix(dt):
+    """
+    Converts a timezone-aware datetime to UNIX milliseconds.
+    """
+    return int(dt.timestamp() * 1000)
+
+
+def get_catalog_queryset(queryset=None, bbox=None, start=None, end=None):
+    """
+    Returns the latest copy of each earthquake, optionally limited to a region and time span.
+
+    Filters are applied in the database, using the spatial and event time indexes. An earthquake is only
+    included when its latest copy matches them, not just an earlier revision.
+    """
+    if queryset is None:
+        queryset = FeedEarthquake.objects.all()
+    queryset = queryset.filter(time__isnull=False)
+    filtered = queryset
+    if bbox is not None:
+        west, south, east, north = bbox
+        if west <= east:
+            filtered = filtered.filter(point__bboverlaps=Polygon.from_bbox(bbox))
+        else:
+            filtered = filtered.filter(
+                point__bboverlaps=Polygon.from_bbox((west, south, 180, north))
+            ) | filtered.filter(
+                point__bboverlaps=Polygon.from_bbox((-180, south, east, north))
+            )
+    if start is not None:
+        filtered = filtered.filter(occurred_datetime__gte=start)
+    if end is not None:
+        filtered = filtered.filter(occurred_datetime__lt=end)
+    if filtered is queryset:
+        return queryset.latest_versions()
+    # Any matching copy nominates an earthquake, and its latest copy must match too
+    latest = queryset.filter(usgs_id__in=filtered.values("usgs_id")).latest_versions().values("pk")
+    return filtered.filter(pk__in=models.Subquery(latest))
+
+
+def load_catalog(queryset=None, bbox=None, start=None, end=None, chunk_size=50000):
+    """
+    Loads the latest copy of each earthquake into a Catalog.
+
+    Rows are streamed from a server-side cursor and converted to arrays one chunk at a time.
+    """
+    queryset = get_catalog_queryset(queryset, bbox=bbox, start=start, end=end)
+    rows = queryset.annotate(
+        longitude=Longitude("point"), latitude=Latitude("point")
+    ).values_list(*COLUMNS)
+
+    chunks = []
+    chunk = []
+    for row in rows.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            chunks.append(Catalog.from_rows(chunk))
+            chunk = []
+    chunks.append(Catalog.from_rows(chunk))
+    return Catalog.concatenate(chunks)
+
+
+def magnitude_frequency(catalog, bin_width=0.1):
+    """
+    Returns the magnitude bins of the catalog, the count in each and the cumulative count at or above each.
+    """
+    mag = catalog.mag[~np.isnan(catalog.mag)]
+    if not len(mag):
+        return np.array([]), np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    index = np.round(mag / bin_width).astype(np.int64)
+    low = index.min()
+    counts = np.bincount(index - low)
+    bins = np.round((np.arange(len(counts)) + low) * bin_width, 10)
+    cumulative = np.cumsum(counts[::-1])[::-1]
+    return bins, counts, cumulative
+
+
+def magnitude_of_completeness(catalog, bin_width=0.1):
+    """
+    Estimates the magnitude above which the catalog is complete using the maximum curvature method.
+    """
+    bins, counts, cumulative = magnitude_frequency(catalog, bin_width=bin_width)
+    if not len(bins):
+        return None
+    return float(bins[np.argmax(counts)])
+
+
+def b_value(catalog, mc=None, bin_width=0.1):
+    """
+    Estimates the Gutenberg-Richter a and b values of the catalog with Aki's maximum likelihood method.
+
+    The magnitude of completeness is estimated when it is not provided. The error is Shi and Bolt's standard error.
+    """
+    if mc is None:
+        mc = magnitude_of_completeness(catalog, bin_width=bin_width)
+    if mc is None:
+        return None
+    mag = catalog.mag[catalog.mag >= mc - bin_width / 2]
+    count = len(mag)
+    if count < 2:
+        return None
+    mean = float(mag.mean())
+    b = math.log10(math.e) / (mean - (mc - bin_width / 2))
+    a = math.log10(count) + b * mc
+    error = 2.3 * b**2 * math.sqrt(float(((mag - mean) ** 2).sum()) / (count * (count - 1)))
+    return BValue(b=b, a=a, mc=mc, count=count, error=error)
+
+
+def daily_rates(catalog):
+    """
+    Returns each UTC day from the catalog's first earthquake to its last, and how many occurred on it.
+    """
+    if not len(catalog):
+        return np.array([], dtype="datetime64[D]"), np.array([], dtype=np.int64)
+    days = catalog.time // MILLISECONDS_PER_DAY
+    first = days.min()
+    counts = np.bincount(days - first)
+    dates = (np.arange(len(counts)) + first).astype("datetime64[D]")
+    return dates, counts
+
+
+def depth_distribution(catalog, bin_width=5):
+    """
+    Returns the edges of depth bins, in kilometers, and how many earthquakes fall in each.
+    """
+    depth = catalog.depth[~np.isnan(catalog.depth)]
+    if not len(depth):
+        return np.array([]), np.array([], dtype=np.int64)
+    low = math.floor(depth.min() / bin_width) * bin_width
+    high = math.floor(depth.max() / bin_width) * bin_width + bin_width
+    counts, edges = np.histogram(depth, bins=np.arange(low, high + bin_width / 2, bin_width))
+    return edges, counts
+
+
+def to_seconds(durations):
+    """
+    Converts a sequence of timedeltas to an array of seconds. Missing durations are NaN.
+    """
+    return np.array(durations, dtype="timedelta64[us]") / np.timedelta64(1, "s")
+
+
+def grouped_percentiles(values, groups, percentiles=PERCENTILES):
+    """
+    Returns each distinct group, how many values are in it and the requested percentiles of those values.
+
+    Percentiles are linearly interpolated, like numpy.percentile, but all groups are computed at once
+    from a single sort. NaN values are ignored.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    groups = np.asarray(groups)
+    keep = ~np.isnan(values)
+    values, groups = values[keep], groups[keep]
+    if not len(values):
+        return Report(groups[:0], np.array([], dtype=np.int64), np.empty((0, len(percentiles))))
+
+    keys, codes = np.unique(groups, return_inverse=True)
+    order = np.lexsort((values, codes))
+    values = values[order]
+    counts = np.bincount(codes, minlength=len(keys))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    position = (counts - 1)[:, np.newaxis] * (np.asarray(percentiles) / 100)
+    low = np.floor(position).astype(np.int64)
+    high = np.ceil(position).astype(np.int64)
+    fraction = position - low
+    first = starts[:, np.newaxis]
+    result = values[first + low] * (1 - fraction) + values[first + high] * fraction
+    return Report(keys, counts, result)
+
+
+def load_latencies(queryset=None, start=None, end=None):
+    """
+    Loads the network, magnitude and detection latency, in seconds, of each earthquake's first sighting.
+    """
+    if queryset is None:
+        queryset = FirstSighting.objects.all()
+    if start is not None:
+        queryset = queryset.filter(occurred_datetime__gte=start)
+    if end is not None:
+        queryset = queryset.filter(occurred_datetime__lt=end)
+    rows = list(queryset.order_by().values_list("net", "mag", "latency"))
+    if not rows:
+        return Latencies(np.array([], dtype=object), np.array([]), np.array([]))
+    net, mag, latency = zip(*rows)
+    return Latencies(
+        np.array(net, dtype=object), np.array(mag, dtype=np.float64), to_seconds(latency)
+    )
+
+
+def latency_by_network(latencies, percentiles=PERCENTILES):
+    """
+    Returns percentiles of the detection latency of earthquakes reported by each network.
+    """
+    return grouped_percentiles(latencies.latency, latencies.net, percentiles=percentiles)
+
+
+def latency_by_magnitude(latencies, bin_width=1.0, percentiles=PERCENTILES):
+    """
+    Returns percentiles of the detection latency of earthquakes in magnitude bins, labeled by their lower edge.
+
+    Earthquakes without a magnitude are left out.
+    """
+    keep = ~np.isnan(latencies.mag)
+    bins = np.round(np.floor(latencies.mag[keep] / bin_width) * bin_width, 10)
+    return grouped_percentiles(latencies.latency[keep], bins, percentiles=percentiles)
+
+
+def load_feed_lags(queryset=None, start=None, end=None):
+    """
+    Loads the lag, in seconds, between when USGS generated each feed and when it was archived,
+    along with how many earthquakes each feed held.
+    """
+    if queryset is None:
+        queryset = Feed.objects.all()
+    if start is not None:
+        queryset = queryset.filter(archived_datetime__gte=start)
+    if end is not None:
+        queryset = queryset.filter(archived_datetime__lt=end)
+    rows = list(
+        queryset.with_lag().filter(lag__isnull=False).order_by().values_list("lag", "count")
+    )
+    if not rows:
+        return np.array([]), np.array([], dtype=np.int64)
+    lag, count = zip(*rows)
+    return to_seconds(lag), np.array([c or 0 for c in count], dtype=np.int64)
+
+
+def lag_by_count(lags, counts, edges=(0, 10, 25, 50, 100), percentiles=PERCENTILES):
+    """
+    Returns percentiles of feed lag in bins of how many earthquakes were in the feed, labeled by their lower edge.
+
+    Shows whether the archive falls behind during busy periods.
+    """
+    edges = np.asarray(edges)
+    bins = edges[np.digitize(counts, edges) - 1]
+    return grouped_percentiles(lags, bins, percentiles=percentiles)
@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class AnssConfig(AppConfig):
     name = "anss"
     verbose_name = "Advanced National Seismic System"
+
+    def ready(self):
+        # Connect the receivers that act on newly archived feeds
+        from anss import alerts, cache, sightings, tiles  # noqa: F401
+
+        # Clustering needs optional dependencies, so it only runs at ingest when asked
+        if getattr(settings, "ANSS_CLUSTER_ON_INGEST", False):
+            from anss import clustering  # noqa: F401
@@ -0,0 +1,230 @@
+"""
+Decides where archived feeds are saved in storage.
+
+Files are spread over one directory per day, so no directory grows past a day of feeds, and named with
+compact UTC timestamps that are safe on every filesystem and sync tool. The "content" layout names files
+for the SHA-256 hash of their content instead, spread over directories by the start of the hash.
+
+    anss/m1/geojson/one-hour/2024/01/31/20240131T235959.123456Z.json
+    anss/m1/geojson/one-hour/3f/a2/3fa2...e9.json
+
+The "packed" layout appends feeds to large segment files instead, as described in anss.segments.
+"""
+import hashlib
+import itertools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from anss import segments
+from anss.models import ArchiveSegment, Feed
+
+logger = logging.getLogger(__name__)
+
+# How new feeds are saved. Either "dated", "content" or "packed".
+LAYOUT = getattr(settings, "ANSS_ARCHIVE_LAYOUT", "dated")
+
+# The layouts that save each feed to its own file
+FILE_LAYOUTS = ("dated", "content")
+
+LAYOUTS = FILE_LAYOUTS + ("packed",)
+
+# How many files are copied at once when relocating the archive
+WORKERS = getattr(settings, "ANSS_ARCHIVE_WORKERS", 8)
+
+# How many Feeds are updated with each query when relocating the archive
+BATCH_SIZE = 500
+
+# How files are named in the dated layout
+FILE_NAME_FORMAT = "%Y%m%dT%H%M%S.%fZ"
+
+
+def get_file_path(feed_type, feed_format, timeframe, archived_datetime, content=None, layout=None):
+    """
+    Returns where a feed archived at the provided time is saved in storage.
+
+    The content is required by the content layout.
+    """
+    layout = layout or LAYOUT
+    if layout not in FILE_LAYOUTS:
+        raise ValueError(f"The {layout} layout has no file paths. Choose from {', '.join(FILE_LAYOUTS)}.")
+    prefix = f"anss/{feed_type}/{feed_format}/{timeframe}"
+    if layout == "content":
+        digest = hashlib.sha256(content).hexdigest()
+        return f"{prefix}/{digest[:2]}/{digest[2:4]}/{digest}.json"
+    utc = archived_datetime.astimezone(timezone.utc)
+    return f"{prefix}/{utc:%Y/%m/%d}/{utc:{FILE_NAME_FORMAT}}.json"
+
+
+def parse_file_name(name):
+    """
+    Returns the UTC archive time in the name of a file saved in the dated layout, or None for other files.
+    """
+    stem = name.rsplit("/", 1)[-1].rsplit(".", 1)[0] if name.endswith(".json") else ""
+    try:
+        return datetime.strptime(stem, FILE_NAME_FORMAT).replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+def save_content(storage, name, content):
+    """
+    Saves the content under the provided name and returns the name it was saved with.
+
+    When a file with the same name and content already exists, as happens in the content layout, it is reused.
+    Otherwise the storage picks a free name.
+    """
+    if storage.exists(name):
+        with storage.open(name, "rb") as f:
+            if f.read() == content:
+                return name
+    return storage.save(name, ContentFile(content))
+
+
+def get_feed_file_path(feed, content=None, layout=None):
+    """
+    Returns where an archived Feed's file belongs in the provided layout.
+    """
+    return get_file_path(feed.type, feed.format, feed.timeframe, feed.archived_datetime, content, layout)
+
+
+def copy_feed(storage, feed, layout=None, dry_run=False):
+    """
+    Copies a Feed's file to where it belongs in the layout and returns its new name.
+
+    Runs in worker threads, so it doesn't touch the database. The original file is left in place.
+    """
+    old_name = feed.content.name
+    if (layout or LAYOUT) == "dated":
+        new_name = get_feed_file_path(feed, layout=layout)
+        if new_name == old_name or dry_run:
+            return new_name
+    if not storage.exists(old_name):
+        logger.warning(f"Feed {feed.id} file {old_name} is missing. Leaving it be.")
+        return old_name
+    with storage.open(old_name, "rb") as f:
+        content = f.read()
+    new_name = get_feed_file_path(feed, content, layout)
+    if new_name == old_name or dry_run:
+        return new_name
+    return save_content(storage, new_name, content)
+
+
+def relocate_feeds(queryset=None, layout=None, workers=WORKERS, batch_size=BATCH_SIZE, dry_run=False):
+    """
+    Moves the files of archived feeds into the provided layout and returns how many were moved.
+
+    Files are copied by a pool of threads, then the batch's Feeds are updated with a single query and only
+    then are the old files deleted, so an interrupted run loses nothing and can be started again.
+    """
+    if (layout or LAYOUT) == "packed":
+        return pack_feeds(queryset, workers=workers, batch_size=batch_size, dry_run=dry_run)
+    if queryset is None:
+        queryset = Feed.objects.all()
+    storage = Feed._meta.get_field("content").storage
+    feeds = (
+        queryset.exclude(content="")
+        .only("id", "content", "type", "format", "timeframe", "archived_datetime")
+        .order_by("id")
+        .iterator(chunk_size=batch_size)
+    )
+
+    moved = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while batch := list(itertools.islice(feeds, batch_size)):
+            names = pool.map(lambda feed: copy_feed(storage, feed, layout, dry_run), batch)
+            changed, old_names = [], set()
+            for feed, name in zip(batch, names):
+                if name != feed.content.name:
+                    old_names.add(feed.content.name)
+                    feed.content.name = name
+                    changed.append(feed)
+            moved += len(changed)
+            if dry_run or not changed:
+                continue
+            Feed.objects.bulk_update(changed, ["content"])
+            delete_unused(storage, old_names)
+            logger.debug(f"Moved {moved} files")
+    return moved
+
+
+def pack_feeds(queryset=None, workers=WORKERS, batch_size=BATCH_SIZE, dry_run=False):
+    """
+    Packs the files of archived feeds into segments and returns how many were packed.
+
+    Files are read by a pool of threads and appended to segments in the order the feeds were archived.
+    """
+    if queryset is None:
+        queryset = Feed.objects.all()
+    storage = Feed._meta.get_field("content").storage
+    feeds = (
+        queryset.exclude(content="")
+        .filter(segment=None)
+        .only("id", "content", "type", "format", "timeframe", "archived_datetime")
+        .order_by("archived_datetime", "id")
+        .iterator(chunk_size=batch_size)
+    )
+
+    def read(feed):
+        if not storage.exists(feed.content.name):
+            logger.warning(f"Feed {feed.id} file {feed.content.name} is missing. Leaving it be.")
+            return None
+        with storage.open(feed.content.name, "rb") as f:
+            return f.read()
+
+    packed = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while batch := list(itertools.islice(feeds, batch_size)):
+            changed, old_names = [], set()
+            for feed, content in zip(batch, pool.map(read, batch)):
+                if content is None:
+                    continue
+                changed.append(feed)
+                if dry_run:
+                    continue
+                pack_feed(storage, feed, content)
+                old_names.add(feed.content.name)
+                feed.content.name = ""
+            packed += len(changed)
+            if dry_run or not changed:
+                continue
+            Feed.objects.bulk_update(changed, ["content", "segment", "segment_offset", "segment_length"])
+            delete_unused(storage, old_names)
+            logger.debug(f"Packed {packed} files")
+    return packed
+
+
+def pack_feed(storage, feed, content):
+    """
+    Appends a feed's content to its segment and points the unsaved Feed at it.
+    """
+    packed = segments.append(
+        storage, feed.type, feed.format, feed.timeframe, feed.archived_datetime, content
+    )
+    feed.segment = get_segment(packed.segment_name, feed)
+    feed.segment_offset = packed.offset
+    feed.segment_length = packed.length
+
+
+def get_segment(name, feed):
+    """
+    Returns the ArchiveSegment with the provided name, creating it for the feed's type when it's new.
+    """
+    return ArchiveSegment.objects.get_or_create(
+        name=name,
+        defaults=dict(type=feed.type, format=feed.format, timeframe=feed.timeframe),
+    )[0]
+
+
+def delete_unused(storage, names):
+    """
+    Deletes the files with the provided names that no Feed points to anymore.
+
+    Content-addressed files can be shared, so a file that was moved for one feed may still belong to another.
+    """
+    in_use = set(Feed.objects.filter(content__in=names).values_list("content", flat=True))
+    for name in set(names) - in_use:
+        storage.delete(name)
@@ -0,0 +1,211 @@
+"""
+Caches the output of the archive's JSON views and the choices offered by the admin's filters.
+
+Everything the views return is derived from the latest archived feed, so responses are stored
+under a key that includes its id. The ingest command publishes each new id as soon as a feed is
+saved, which retires the old keys and, by default, renders the new responses before anyone asks.
+
+Filter choices are the distinct values of a few columns across every archived earthquake. They are
+computed once and then extended with whatever new values each feed brings.
+
+Anything stored in the cache is read from the primary database, since a replica that hasn't caught up
+with the latest feed would leave stale copies behind for as long as they're kept.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+from django.dispatch import receiver
+
+from anss import routers
+from anss.models import Feed, FeedEarthquake
+from anss.signals import feed_archived
+
+logger = logging.getLogger(__name__)
+
+# The cache backend to use. Use a shared backend, like Redis or Memcached,
+# so that the ingest command and the web processes see the same keys.
+CACHE_ALIAS = getattr(settings, "ANSS_CACHE_ALIAS", "default")
+
+# How long, in seconds, rendered responses are kept
+TIMEOUT = getattr(settings, "ANSS_CACHE_TIMEOUT", 60 * 60 * 24)
+
+# How long, in seconds, a process can trust the latest feed id before asking the database again
+LATEST_FEED_TIMEOUT = getattr(settings, "ANSS_CACHE_LATEST_FEED_TIMEOUT", 60)
+
+# Whether the ingest command should render fresh responses after each feed
+WARM = getattr(settings, "ANSS_CACHE_WARM", True)
+
+LATEST_FEED_KEY = "anss:latest-feed-id"
+
+# The earthquake fields the admin offers filters for
+FILTER_FIELDS = ("alert", "net", "status", "tsunami", "magType", "type")
+
+
+def get_cache():
+    """
+    Returns the cache backend configured for the archive.
+    """
+    return caches[CACHE_ALIAS]
+
+
+def get_response_key(name, feed_id):
+    """
+    Returns the key where the named response for the provided feed is stored.
+    """
+    return f"anss:response:{name}:{feed_id}"
+
+
+def get_latest_feed_id():
+    """
+    Returns the id of the most recently archived feed, consulting the database only on a cache miss.
+
+    Feeds still being downloaded, or that failed, have no content and are skipped.
+    """
+    cache = get_cache()
+    feed_id = cache.get(LATEST_FEED_KEY)
+    if feed_id is None:
+        try:
+            with routers.use_primary():
+                feed_id = Feed.objects.archived().only("id").latest().id
+        except Feed.DoesNotExist:
+            return None
+        cache.set(LATEST_FEED_KEY, feed_id, LATEST_FEED_TIMEOUT)
+    return feed_id
+
+
+def get_or_render(name, render):
+    """
+    Returns the named response for the latest feed, calling render(feed_id) to create it on a cache miss.
+    """
+    feed_id = get_latest_feed_id()
+    if feed_id is None:
+        return render(None)
+    cache = get_cache()
+    key = get_response_key(name, feed_id)
+    content = cache.get(key)
+    if content is None:
+        with routers.use_primary():
+            content = render(feed_id)
+        cache.set(key, content, TIMEOUT)
+    return content
+
+
+async def aget_latest_feed_id():
+    """
+    Returns the id of the most recently archived feed without blocking the event loop.
+    """
+    cache = get_cache()
+    feed_id = await cache.aget(LATEST_FEED_KEY)
+    if feed_id is None:
+        try:
+            with routers.use_primary():
+                feed = await Feed.objects.archived().only("id").alatest()
+        except Feed.DoesNotExist:
+            return None
+        feed_id = feed.id
+        await cache.aset(LATEST_FEED_KEY, feed_id, LATEST_FEED_TIMEOUT)
+    return feed_id
+
+
+async def aget_or_render(name, arender):
+    """
+    Returns the named response for the latest feed, awaiting arender(feed_id) to create it on a cache miss.
+    """
+    feed_id = await aget_latest_feed_id()
+    if feed_id is None:
+        return await arender(None)
+    cache = get_cache()
+    key = get_response_key(name, feed_id)
+    content = await cache.aget(key)
+    if content is None:
+        with routers.use_primary():
+            content = await arender(feed_id)
+        await cache.aset(key, content, TIMEOUT)
+    return content
+
+
+def set_latest_feed(feed):
+    """
+    Publishes the provided feed as the latest one, which retires every response cached for its predecessor.
+    """
+    get_cache().set(LATEST_FEED_KEY, feed.id, LATEST_FEED_TIMEOUT)
+
+
+def warm(feed):
+    """
+    Renders and stores every cached view for the provided feed.
+    """
+    # Imported here to avoid a circular import with the views
+    from anss.views import FeedListView, LatestFeedView
+
+    cache = get_cache()
+    for view_class in (LatestFeedView, FeedListView):
+        view = view_class()
+        key = get_response_key(view.cache_name, feed.id)
+        cache.set(key, view.render_content(feed.id), TIMEOUT)
+        logger.debug(f"Warmed {key}")
+
+
+def get_filter_choices_key(field_name):
+    """
+    Returns the key where the distinct values of the provided earthquake field are stored.
+    """
+    return f"anss:filter-choices:{field_name}"
+
+
+def sort_filter_choices(values):
+    """
+    Returns the provided field values in order, with a single None at the end if any were null.
+    """
+    values = set(values)
+    ordered = sorted(v for v in values if v is not None)
+    if None in values:
+        ordered.append(None)
+    return ordered
+
+
+def get_filter_choices(field_name):
+    """
+    Returns every distinct value of the provided earthquake field, scanning the table only on a cache miss.
+    """
+    cache = get_cache()
+    key = get_filter_choices_key(field_name)
+    choices = cache.get(key)
+    if choices is None:
+        qs = FeedEarthquake.objects.order_by().values_list(field_name, flat=True)
+        with routers.use_primary():
+            choices = sort_filter_choices(qs.distinct())
+        cache.set(key, choices, None)
+    return choices
+
+
+def update_filter_choices(feed):
+    """
+    Adds any new values brought by the provided feed to the cached filter choices.
+    """
+    cache = get_cache()
+    qs = FeedEarthquake.objects.filter(feed=feed).order_by().values_list(*FILTER_FIELDS)
+    rows = list(qs.distinct())
+    for i, field_name in enumerate(FILTER_FIELDS):
+        key = get_filter_choices_key(field_name)
+        choices = cache.get(key)
+        # Nothing to extend. The full list will be built the next time it's needed.
+        if choices is None:
+            continue
+        new_values = {r[i] for r in rows} - set(choices)
+        if new_values:
+            cache.set(key, sort_filter_choices([*choices, *new_values]), None)
+            logger.debug(f"Added {new_values} to {key}")
+
+
+@receiver(feed_archived)
+def refresh(sender, feed, **kwargs):
+    """
+    Points the response cache at a newly archived feed and extends the filter choices.
+    """
+    with routers.use_primary():
+        update_filter_choices(feed)
+        if WARM:
+            warm(feed)
+    set_latest_feed(feed)
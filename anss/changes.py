@@ -0,0 +1,97 @@
+"""
+Records what changed between consecutive archived feeds of the same type.
+
+When a feed is archived, its earthquakes are compared with those in the previous feed by usgs_id and updated
+time. Earthquakes that are new, were updated or were dropped are stored on the FeedChange model, which
+consumers can page through with an increasing cursor instead of diffing whole feeds themselves.
+
+The cursor is the FeedChange id, so ids must become visible in the order they're handed out, even when
+several workers ingest at once. Each transaction that records changes takes a lock first and holds it until it
+commits, so a consumer that has read up to an id can never miss a lower one committed later.
+"""
+import logging
+
+from django.db import router, transaction
+
+from anss import locks
+from anss.models import Feed, FeedChange, FeedEarthquake
+
+# The lock held by each transaction that records changes
+LOCK_NAME = "anss:changes"
+
+logger = logging.getLogger(__name__)
+
+
+def get_state(features):
+    """
+    Returns the updated time of each earthquake in a list of GeoJSON features, keyed by usgs_id.
+    """
+    state = {}
+    for f in features:
+        # Stripped like the usgs_id saved on FeedEarthquake
+        usgs_id = (f.get("id") or "").strip()
+        if usgs_id:
+            state[usgs_id] = f["properties"].get("updated")
+    return state
+
+
+def load_state(feed):
+    """
+    Returns the updated time of each earthquake in the feed archived before the provided one, keyed by usgs_id.
+
+    Returns None when there is no earlier feed of the same type.
+    """
+    previous = (
+        Feed.objects.archived()
+        .filter(
+            type=feed.type,
+            timeframe=feed.timeframe,
+            archived_datetime__lt=feed.archived_datetime,
+            status=200,
+        )
+        .only("id")
+        .order_by("-archived_datetime")
+        .first()
+    )
+    if previous is None:
+        return None
+    rows = FeedEarthquake.objects.filter(feed=previous).exclude(usgs_id="").values_list("usgs_id", "updated")
+    return dict(rows)
+
+
+def diff(previous, current):
+    """
+    Returns the changes from one state to the next as a list of (usgs_id, change, updated) tuples.
+    """
+    changes = []
+    for usgs_id, updated in current.items():
+        if usgs_id not in previous:
+            changes.append((usgs_id, FeedChange.NEW, updated))
+        elif previous[usgs_id] != updated:
+            changes.append((usgs_id, FeedChange.UPDATED, updated))
+    for usgs_id, updated in previous.items():
+        if usgs_id not in current:
+            changes.append((usgs_id, FeedChange.REMOVED, updated))
+    return changes
+
+
+def record_changes(feed, current, previous=None):
+    """
+    Saves the changes since the previous feed of the same type and returns how many there were.
+
+    Pass the previous state when it's already in memory, like during a run that archived the feed before.
+    Call it last in the transaction that saves the feed, since the lock it takes is held until that commits.
+    """
+    if previous is None:
+        previous = load_state(feed) or {}
+    changes = diff(previous, current)
+    using = router.db_for_write(FeedChange)
+    # No savepoint is needed, since a failure here should undo the feed's whole transaction anyway
+    with transaction.atomic(using=using, savepoint=False):
+        locks.lock_transaction(LOCK_NAME, using=using)
+        FeedChange.objects.bulk_create(
+            FeedChange(feed=feed, usgs_id=usgs_id, change=change, updated=updated)
+            for usgs_id, change, updated in changes
+        )
+    logger.debug(f"Recorded {len(changes)} changes in {feed}")
+    return len(changes)
@@ -0,0 +1,272 @@
+"""
+Groups archived earthquakes into mainshock and aftershock sequences.
+
+Sequences are found with the Gardner and Knopoff (1974) windowing method. Earthquakes are visited from
+the largest to the smallest, and any unclaimed earthquake that falls inside the space and time window of a
+larger one joins its sequence. Neighbors in time come from a sweep over the sorted event times and
+neighbors in space from a k-d tree, so no pair of earthquakes is compared unless both windows overlap.
+
+Results are stored on the ClusteredEarthquake model, one row per event, and can be updated incrementally
+as new feeds arrive.
+"""
+import itertools
+import logging
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models
+from django.dispatch import receiver
+
+from anss import analytics
+from anss.functions import Latitude, Longitude
+from anss.models import ClusteredEarthquake, FeedEarthquake
+from anss.signals import feed_archived
+
+try:
+    import numpy as np
+    from scipy.spatial import cKDTree
+except ImportError:  # pragma: no cover
+    raise ImportError(
+        "anss.clustering requires NumPy and SciPy. "
+        "Install them with `pip install django-anss-archive[clustering]`."
+    )
+
+logger = logging.getLogger(__name__)
+
+# How far before the earliest new earthquake to look for the mainshocks of incremental updates.
+# It should exceed the time window of the largest earthquakes you expect.
+LOOKBACK = timedelta(days=getattr(settings, "ANSS_CLUSTER_LOOKBACK_DAYS", 365))
+
+EARTH_RADIUS_KM = 6371.0088
+
+MILLISECONDS_PER_DAY = 24 * 60 * 60 * 1000
+
+# Time windows with more candidates than this are narrowed with the k-d tree instead of brute force
+TREE_THRESHOLD = 256
+
+
+def gardner_knopoff_window(mag):
+    """
+    Returns the distance, in kilometers, and the time, in days, of the aftershock window for the provided magnitudes.
+    """
+    mag = np.asarray(mag, dtype=np.float64)
+    distance = 10 ** (0.1238 * mag + 0.983)
+    time = np.where(mag >= 6.5, 10 ** (0.032 * mag + 2.7389), 10 ** (0.5409 * mag - 0.547))
+    return distance, time
+
+
+def to_cartesian(longitude, latitude):
+    """
+    Converts coordinates in degrees to points in kilometers on a spherical Earth.
+    """
+    lng = np.radians(longitude)
+    lat = np.radians(latitude)
+    return EARTH_RADIUS_KM * np.column_stack(
+        (np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat))
+    )
+
+
+def chord_length(distance):
+    """
+    Converts a distance in kilometers along the Earth's surface to the straight line between its ends.
+    """
+    angle = np.minimum(distance / EARTH_RADIUS_KM, math.pi)
+    return 2 * EARTH_RADIUS_KM * np.sin(angle / 2)
+
+
+def decluster(time, mag, longitude, latitude, foreshock_fraction=0.0, locked=None):
+    """
+    Labels the sequence of each earthquake with the Gardner and Knopoff windowing method.
+
+    Accepts arrays of UNIX millisecond times, magnitudes and coordinates in degrees. Returns an array with,
+    for each earthquake, the index of the mainshock of its sequence. Independent earthquakes are their own
+    mainshock. Set foreshock_fraction to also claim earlier earthquakes within that share of the time window.
+
+    Earthquakes where the optional boolean locked mask is true are mainshocks whose sequence is already
+    settled. They can claim others but are never claimed themselves.
+    """
+    time = np.asarray(time, dtype=np.int64)
+    mag = np.nan_to_num(np.asarray(mag, dtype=np.float64), nan=-10)
+    count = len(time)
+    labels = np.full(count, -1, dtype=np.int64)
+    if not count:
+        return labels
+    claimable = np.ones(count, dtype=bool) if locked is None else ~np.asarray(locked, dtype=bool)
+
+    xyz = to_cartesian(longitude, latitude)
+    tree = cKDTree(xyz)
+    distance, window = gardner_knopoff_window(mag)
+    radius = chord_length(distance)
+    window_ms = window * MILLISECONDS_PER_DAY
+
+    time_order = np.argsort(time, kind="stable")
+    sorted_time = time[time_order]
+
+    # Largest first, with ties going to the earliest
+    for i in np.lexsort((time, -mag)):
+        if labels[i] != -1:
+            continue
+        labels[i] = i
+
+        # Sweep the sorted times for candidates inside the time window
+        start = time[i] - int(window_ms[i] * foreshock_fraction)
+        lo, hi = np.searchsorted(sorted_time, (start, time[i] + window_ms[i]), side="left")
+        candidates = time_order[lo:hi]
+        if len(candidates) > TREE_THRESHOLD:
+            nearby = np.asarray(tree.query_ball_point(xyz[i], radius[i]), dtype=np.int64)
+            candidates = nearby[(time[nearby] >= start) & (time[nearby] < time[i] + window_ms[i])]
+        else:
+            gap = np.linalg.norm(xyz[candidates] - xyz[i], axis=1)
+            candidates = candidates[gap <= radius[i]]
+
+        members = candidates[(labels[candidates] == -1) & claimable[candidates]]
+        labels[members] = i
+    return labels
+
+
+def save_clusters(ids, usgs_ids, labels, mask=None, batch_size=5000):
+    """
+    Stores the sequences found by decluster() on the ClusteredEarthquakes with the provided ids.
+
+    Only the earthquakes where the optional boolean mask is true are saved.
+    """
+    indexes = np.arange(len(ids))
+    if mask is not None:
+        indexes = indexes[mask]
+    objects = [
+        ClusteredEarthquake(
+            id=int(ids[i]), cluster=usgs_ids[labels[i]], is_mainshock=bool(labels[i] == i)
+        )
+        for i in indexes
+    ]
+    ClusteredEarthquake.objects.bulk_update(
+        objects, ["cluster", "is_mainshock"], batch_size=batch_size
+    )
+
+
+def load_clustered_earthquakes(queryset):
+    """
+    Returns arrays of the ids, USGS ids, times, magnitudes and coordinates of the provided ClusteredEarthquakes.
+    """
+    rows = list(
+        queryset.annotate(longitude=Longitude("point"), latitude=Latitude("point"))
+        .order_by()
+        .values_list("id", "usgs_id", "time", "mag", "longitude", "latitude")
+    )
+    if not rows:
+        return [np.array([]) for i in range(6)]
+    ids, usgs_ids, time, mag, longitude, latitude = zip(*rows)
+    return (
+        np.array(ids, dtype=np.int64),
+        np.array(usgs_ids, dtype=object),
+        np.array(time, dtype=np.int64),
+        np.array(mag, dtype=np.float64),
+        np.array(longitude, dtype=np.float64),
+        np.array(latitude, dtype=np.float64),
+    )
+
+
+def upsert_earthquakes(rows, batch_size=5000):
+    """
+    Creates or refreshes ClusteredEarthquakes from (usgs_id, time, mag, point) tuples.
+
+    New earthquakes start out as their own mainshock until they are clustered.
+    """
+    rows = iter(rows)
+    while batch := list(itertools.islice(rows, batch_size)):
+        objects = [
+            ClusteredEarthquake(
+                usgs_id=usgs_id,
+                time=time,
+                mag=mag,
+                point=point,
+                cluster=usgs_id,
+                is_mainshock=True,
+            )
+            for usgs_id, time, mag, point in batch
+        ]
+        ClusteredEarthquake.objects.bulk_create(
+            objects,
+            update_conflicts=True,
+            unique_fields=["usgs_id"],
+            update_fields=["time", "mag", "point"],
+        )
+
+
+def rebuild_clusters():
+    """
+    Clusters every earthquake in the archive from scratch.
+    """
+    queryset = analytics.get_catalog_queryset().filter(point__isnull=False)
+    upsert_earthquakes(
+        queryset.values_list("usgs_id", "time", "mag", "point").iterator(chunk_size=5000)
+    )
+    ids, usgs_ids, time, mag, longitude, latitude = load_clustered_earthquakes(
+        ClusteredEarthquake.objects.all()
+    )
+    labels = decluster(time, mag, longitude, latitude)
+    save_clusters(ids, usgs_ids, labels)
+    logger.debug(f"Clustered {len(ids)} earthquakes")
+    return len(ids)
+
+
+def get_reach_filter(since):
+    """
+    Returns a Q object matching the earlier earthquakes whose time windows could reach the provided UNIX time.
+
+    Larger earthquakes have longer windows, so the further back an earthquake is, the larger it must be.
+    The lookback is split into bands that double in length, each with the smallest magnitude whose window
+    spans the start of the band. That's a little more than needed, but only the large earthquakes of the
+    whole lookback are matched, instead of every one of them.
+    """
+    grid = np.arange(-2, 10, 0.1)
+    windows = gardner_knopoff_window(grid)[1] * MILLISECONDS_PER_DAY
+    lookback = int(LOOKBACK.total_seconds() * 1000)
+    q = models.Q(time__gte=since - min(MILLISECONDS_PER_DAY, lookback))
+    near = MILLISECONDS_PER_DAY
+    while near < lookback:
+        far = min(near * 2, lookback)
+        # One step below the smallest magnitude reaching this far back, so none are missed between steps
+        reaching = np.flatnonzero(windows >= near)
+        if not len(reaching):
+            break
+        min_mag = round(float(grid[max(reaching[0] - 1, 0)]), 1)
+        q |= models.Q(time__gte=since - far, time__lt=since - near, mag__gte=min_mag)
+        near = far
+    return q
+
+
+def update_clusters(since):
+    """
+    Reclusters the earthquakes that occurred after the provided UNIX millisecond time.
+
+    Earlier mainshocks whose windows reach that time, as far back as the lookback, can claim the reclustered
+    earthquakes. Their own sequences are left as they are, so nothing saved before is contradicted.
+    """
+    recent = models.Q(time__gte=since)
+    earlier = models.Q(time__lt=since, is_mainshock=True) & get_reach_filter(since)
+    ids, usgs_ids, time, mag, longitude, latitude = load_clustered_earthquakes(
+        ClusteredEarthquake.objects.filter(recent | earlier)
+    )
+    changed = time >= since
+    labels = decluster(time, mag, longitude, latitude, locked=~changed)
+    save_clusters(ids, usgs_ids, labels, mask=changed)
+    logger.debug(f"Reclustered {changed.sum()} earthquakes")
+    return int(changed.sum())
+
+
+@receiver(feed_archived)
+def cluster_feed(sender, feed, **kwargs):
+    """
+    Adds the earthquakes in a newly archived feed to the stored sequences.
+    """
+    rows = list(
+        FeedEarthquake.objects.filter(feed=feed, time__isnull=False, point__isnull=False)
+        .order_by()
+        .values_list("usgs_id", "time", "mag", "point")
+    )
+    if not rows:
+        return
+    upsert_earthquakes(rows)
+    update_clusters(min(r[1] for r in rows))
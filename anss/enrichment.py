@@ -0,0 +1,165 @@
+"""
+Fetches the detail GeoJSON of archived earthquakes, which holds the products the summary feeds leave out.
+
+Detail documents are fetched by a pool of threads sharing one pooled HTTP session, while the results are
+saved to the database from the calling thread. An earthquake is only fetched again when the updated time
+USGS reports for it changes. Each document is also kept in storage, named for that updated time, so
+rebuilding the database doesn't require fetching everything again.
+"""
+import itertools
+import json
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import models
+from django.utils import timezone
+
+from anss import transports
+from anss.functions import IsDistinctFrom
+from anss.models import EventDetail, FeedEarthquake
+
+logger = logging.getLogger(__name__)
+
+# How many detail documents are fetched at once
+WORKERS = getattr(settings, "ANSS_ENRICH_WORKERS", 8)
+
+# How many earthquakes are fetched and then saved together
+CHUNK_SIZE = 500
+
+# The product types pulled out of each document, and the EventDetail fields they go in
+PRODUCTS = {
+    "moment-tensor": "moment_tensor",
+    "shakemap": "shakemap",
+    "losspager": "pager",
+}
+
+Fetched = namedtuple("Fetched", ("usgs_id", "url", "updated", "status", "content_name", "products"))
+
+
+def get_pending(queryset=None):
+    """
+    Returns the latest copy of each earthquake whose detail was never fetched or has been updated since.
+    """
+    if queryset is None:
+        queryset = FeedEarthquake.objects.all()
+    latest = queryset.exclude(detail="").latest_versions().values("pk")
+    stored = EventDetail.objects.filter(usgs_id=models.OuterRef("usgs_id")).order_by().values("updated")
+    return (
+        FeedEarthquake.objects.filter(pk__in=models.Subquery(latest))
+        .annotate(stored_updated=models.Subquery(stored))
+        .filter(IsDistinctFrom("stored_updated", "updated"))
+        .order_by()
+    )
+
+
+def get_content_name(usgs_id, updated):
+    """
+    Returns where the detail document of an earthquake at the provided update is kept in storage.
+    """
+    return f"anss/detail/{usgs_id}/{updated}.json"
+
+
+def get_products(document):
+    """
+    Returns the properties of the preferred product of each type in PRODUCTS, keyed by EventDetail field.
+    """
+    products = document.get("properties", {}).get("products", {})
+    found = {}
+    for product_type, field in PRODUCTS.items():
+        # USGS lists the preferred product first
+        versions = products.get(product_type) or [{}]
+        found[field] = versions[0].get("properties")
+    return found
+
+
+def fetch(usgs_id, url, updated, session=None, timeout=transports.TIMEOUT):
+    """
+    Returns the detail document of an earthquake as a Fetched tuple, from storage when it's there.
+
+    Runs in worker threads, so it doesn't touch the database. Returns None when the request fails or the
+    document can't be read, so the earthquake stays pending and is tried again on the next run.
+    """
+    name = get_content_name(usgs_id, updated)
+    stored = default_storage.exists(name)
+    if stored:
+        with default_storage.open(name, "rb") as f:
+            content = f.read()
+    else:
+        session = session or transports.get_session()
+        try:
+            response = session.get(url, timeout=timeout)
+        except requests.RequestException as e:
+            logger.warning(f"Request for {url} failed: {e}")
+            return None
+        if response.status_code != 200:
+            logger.warning(f"Request for {url} failed with code {response.status_code}")
+            return None
+        content = response.content
+    try:
+        products = get_products(json.loads(content))
+    except ValueError as e:
+        logger.warning(f"Detail of {usgs_id} is not valid JSON: {e}")
+        return None
+    if not stored:
+        name = default_storage.save(name, ContentFile(content))
+    return Fetched(usgs_id, url, updated, 200, name, products)
+
+
+def save_details(results):
+    """
+    Creates or refreshes the EventDetails for a list of Fetched tuples with a single query.
+    """
+    now = timezone.now()
+    objects = [
+        EventDetail(
+            usgs_id=r.usgs_id,
+            url=r.url,
+            updated=r.updated,
+            fetched_datetime=now,
+            status=r.status,
+            content=r.content_name,
+            **r.products,
+        )
+        for r in results
+    ]
+    EventDetail.objects.bulk_create(
+        objects,
+        update_conflicts=True,
+        unique_fields=["usgs_id"],
+        update_fields=[
+            "url",
+            "updated",
+            "fetched_datetime",
+            "status",
+            "content",
+            *PRODUCTS.values(),
+        ],
+    )
+
+
+def enrich(queryset=None, workers=WORKERS, limit=None):
+    """
+    Fetches and saves the detail of every pending earthquake in the queryset. Returns how many were saved.
+
+    At most `workers` requests are in flight at once.
+    """
+    pending = get_pending(queryset).values_list("usgs_id", "detail", "updated")
+    if limit is not None:
+        pending = pending[:limit]
+    rows = pending.iterator(chunk_size=CHUNK_SIZE)
+
+    saved = 0
+    session = transports.get_session()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while chunk := list(itertools.islice(rows, CHUNK_SIZE)):
+            results = pool.map(lambda row: fetch(*row, session=session), chunk)
+            results = [r for r in results if r is not None]
+            save_details(results)
+            saved += len(results)
+            logger.debug(f"Saved the detail of {saved} earthquakes")
+    return saved
@@ -0,0 +1,77 @@
+from django.contrib.gis.db import models
+
+
+class UnixDateTime(models.Func):
+    """
+    Converts a UNIX time in milliseconds, the way USGS publishes them, to a datetime in the database.
+    """
+
+    function = "TO_TIMESTAMP"
+    template = "%(function)s(%(expressions)s / 1000.0)"
+    output_field = models.DateTimeField()
+
+
+class Longitude(models.Func):
+    """
+    Returns the longitude of a point.
+    """
+
+    function = "ST_X"
+    output_field = models.FloatField()
+
+
+class Latitude(models.Func):
+    """
+    Returns the latitude of a point.
+    """
+
+    function = "ST_Y"
+    output_field = models.FloatField()
+
+
+class IsDistinctFrom(models.Func):
+    """
+    Tests whether two values differ, treating nulls as comparable values.
+    """
+
+    arity = 2
+    arg_joiner = " IS DISTINCT FROM "
+    template = "(%(expressions)s)"
+    output_field = models.BooleanField()
+
+
+class KNNDistance(models.Func):
+    """
+    Orders geometries by their distance from another using PostGIS's index-assisted <-> operator.
+
+    Distances are planar, in the units of the geometries' coordinate system,
+    so use it to rank candidates, not to measure them.
+    """
+
+    arity = 2
+    arg_joiner = " <-> "
+    template = "(%(expressions)s)"
+    output_field = models.FloatField()
+
+
+class TileEnvelope(models.Func):
+    """
+    Returns the Web Mercator bounds of a tile from its zoom, x and y.
+    """
+
+    function = "ST_TileEnvelope"
+    arity = 3
+    output_field = models.GeometryField(srid=3857)
+
+
+class MVTGeom(models.Func):
+    """
+    Converts a Web Mercator geometry to the coordinates of a vector tile, clipping it to the tile's buffer.
+
+    Expects the geometry, the tile's envelope, its extent and its buffer. Only meant to be passed to ST_AsMVT,
+    so the result isn't converted to a GEOS geometry.
+    """
+
+    function = "ST_AsMVTGeom"
+    arity = 4
+    output_field = models.BinaryField()
@@ -0,0 +1,140 @@
+"""
+Splits the feeds to archive among worker processes on any number of hosts.
+
+Each feed type and timeframe is a slot in the IngestLease table. A worker claims a slot by writing its name and
+an expiry time into the row, renews its leases while it runs, and archives only the feeds it holds. A lease
+that isn't renewed in time, because its worker died or lost its connection, expires and is claimed by another.
+
+Workers also record a heartbeat, so each can tell how many are alive and hold no more than its fair share
+of the slots. Starting another worker is all it takes to spread the feeds further.
+"""
+import logging
+import math
+import os
+import socket
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+from anss.models import IngestLease, IngestWorker
+
+logger = logging.getLogger(__name__)
+
+# Seconds a lease, or a worker's heartbeat, lasts without being renewed
+LEASE_SECONDS = getattr(settings, "ANSS_LEASE_SECONDS", 180)
+
+
+def get_worker_name():
+    """
+    Returns a name for the current process that is unique across hosts.
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def ensure_slots(slots):
+    """
+    Creates the lease rows for a list of (type, timeframe) slots that don't have one yet.
+    """
+    IngestLease.objects.bulk_create(
+        [IngestLease(type=t, timeframe=tf) for t, tf in slots],
+        ignore_conflicts=True,
+    )
+
+
+def heartbeat(name, lease_seconds=LEASE_SECONDS):
+    """
+    Records that the named worker is alive and returns how many workers are, counting it.
+    """
+    now = timezone.now()
+    IngestWorker.objects.update_or_create(name=name, defaults=dict(heartbeat_datetime=now))
+    # Forget workers that stopped without saying goodbye
+    IngestWorker.objects.filter(heartbeat_datetime__lt=now - timedelta(seconds=lease_seconds * 10)).delete()
+    return IngestWorker.objects.filter(heartbeat_datetime__gte=now - timedelta(seconds=lease_seconds)).count()
+
+
+def get_fair_share(slot_count, worker_count):
+    """
+    Returns the most slots one worker should hold.
+    """
+    return math.ceil(slot_count / max(worker_count, 1))
+
+
+def get_slot_filter(slots):
+    """
+    Returns a Q object matching the lease rows of a list of (type, timeframe) slots.
+    """
+    q = models.Q(pk__in=[])
+    for feed_type, timeframe in slots:
+        q |= models.Q(type=feed_type, timeframe=timeframe)
+    return q
+
+
+def renew(name, slots, lease_seconds=LEASE_SECONDS):
+    """
+    Extends the named worker's leases on the slots and returns the slots it still holds, in order.
+    """
+    held = IngestLease.objects.filter(get_slot_filter(slots), holder=name)
+    # Expired leases no one has taken yet are still the worker's to renew
+    held.update(expires_datetime=timezone.now() + timedelta(seconds=lease_seconds))
+    found = set(held.values_list("type", "timeframe"))
+    return [slot for slot in slots if slot in found]
+
+
+def claim(name, slot, lease_seconds=LEASE_SECONDS):
+    """
+    Tries to take the lease on a slot for the named worker and returns whether it did.
+
+    Only a free or expired lease can be taken. The check and the claim are a single UPDATE, so when several
+    workers try at once only one succeeds.
+    """
+    now = timezone.now()
+    feed_type, timeframe = slot
+    claimed = (
+        IngestLease.objects.filter(type=feed_type, timeframe=timeframe)
+        .filter(models.Q(holder="") | models.Q(expires_datetime__lte=now))
+        .update(
+            holder=name,
+            acquired_datetime=now,
+            expires_datetime=now + timedelta(seconds=lease_seconds),
+        )
+    )
+    if claimed:
+        logger.info(f"{name} took the lease on {feed_type} {timeframe}")
+    return bool(claimed)
+
+
+def release(name, slots):
+    """
+    Gives up the named worker's leases on the slots, so other workers can take them right away.
+    """
+    IngestLease.objects.filter(get_slot_filter(slots), holder=name).update(holder="", expires_datetime=None)
+
+
+def balance(name, slots, lease_seconds=LEASE_SECONDS):
+    """
+    Renews, releases and claims leases so the named worker holds its fair share of the slots.
+
+    Returns the slots it holds afterward.
+    """
+    ensure_slots(slots)
+    share = get_fair_share(len(slots), heartbeat(name, lease_seconds))
+    held = renew(name, slots, lease_seconds)
+    if len(held) > share:
+        release(name, held[share:])
+        return held[:share]
+    for slot in slots:
+        if len(held) >= share:
+            break
+        if slot not in held and claim(name, slot, lease_seconds):
+            held.append(slot)
+    return held
+
+
+def leave(name, slots):
+    """
+    Releases all of the named worker's leases and forgets it.
+    """
+    release(name, slots)
+    IngestWorker.objects.filter(name=name).delete()
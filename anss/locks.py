@@ -0,0 +1,58 @@
+"""
+Advisory locks that keep overlapping runs of the archive command from repeating, or reordering, each other's work.
+"""
+import hashlib
+import logging
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+
+def get_lock_key(name):
+    """
+    Returns the signed 64-bit integer PostgreSQL uses to identify the advisory lock with the provided name.
+    """
+    digest = hashlib.blake2b(name.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+@contextmanager
+def advisory_lock(name, using=DEFAULT_DB_ALIAS):
+    """
+    Tries to take a session-level advisory lock without waiting and yields whether it was acquired.
+
+    The lock is released when the block exits, or by the database if the process dies. Databases
+    other than PostgreSQL have no advisory locks, so the lock is always acquired on them.
+    """
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        yield True
+        return
+
+    key = get_lock_key(name)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", [key])
+        acquired = cursor.fetchone()[0]
+    logger.debug(f"{'Acquired' if acquired else 'Could not acquire'} lock {name}")
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", [key])
+
+
+def lock_transaction(name, using=DEFAULT_DB_ALIAS):
+    """
+    Waits for a transaction-level advisory lock, which the database releases when the current transaction ends.
+
+    Call it inside transaction.atomic. Databases other than PostgreSQL have no advisory locks, so it does nothing.
+    """
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", [get_lock_key(name)])
+    logger.debug(f"Acquired transaction lock {name}")
@@ -0,0 +1,33 @@
+import logging
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand
+
+from anss import clustering
+from anss.profiling import ProfileMixin
+
+logger = logging.getLogger(__name__)
+
+
+class Command(ProfileMixin, BaseCommand):
+    help = "Group archived earthquakes into mainshock and aftershock sequences"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since",
+            type=datetime.fromisoformat,
+            help="Only recluster earthquakes that occurred after this ISO date. By default, everything is rebuilt.",
+        )
+        self.add_profile_arguments(parser)
+
+    def handle(self, *args, **options):
+        self.set_profile_options(**options)
+        since = options["since"]
+        if since is not None and since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        with self.profile(lambda: self.get_run_profile_name("clusters")):
+            if since is None:
+                count = clustering.rebuild_clusters()
+            else:
+                count = clustering.update_clusters(int(since.timestamp() * 1000))
+        logger.debug(f"Clustered {count} earthquakes")
@@ -0,0 +1,44 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from anss import alerts, locks
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Send queued earthquake alerts to their subscribers' webhooks"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=alerts.CONCURRENCY,
+            help=f"How many webhook requests to make at once. Defaults to {alerts.CONCURRENCY}.",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=1000,
+            help="How many alerts to take from the queue at a time. Defaults to 1000.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            help="Keep running, checking the queue this many seconds apart. By default, it's emptied once.",
+        )
+
+    def handle(self, *args, **options):
+        # Only one worker sends at a time, so no alert goes out twice
+        with locks.advisory_lock("anss:deliveranssalerts") as acquired:
+            if not acquired:
+                logger.info("Another run is delivering alerts. Exiting.")
+                return
+            while True:
+                while alerts.deliver(concurrency=options["concurrency"], limit=options["limit"]):
+                    pass
+                if not options["interval"]:
+                    return
+                time.sleep(options["interval"])
@@ -0,0 +1,44 @@
+import logging
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from anss import enrichment
+from anss.models import FeedEarthquake
+from anss.profiling import ProfileMixin
+
+logger = logging.getLogger(__name__)
+
+
+class Command(ProfileMixin, BaseCommand):
+    help = "Fetch the detail GeoJSON of archived earthquakes that are new or were updated by USGS"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            help="Only fetch earthquakes that occurred in this many recent days. By default, all are fetched.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=enrichment.WORKERS,
+            help=f"How many documents to fetch at once. Defaults to {enrichment.WORKERS}.",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            help="Fetch at most this many earthquakes.",
+        )
+        self.add_profile_arguments(parser)
+
+    def handle(self, *args, **options):
+        self.set_profile_options(**options)
+        queryset = FeedEarthquake.objects.all()
+        if options["days"]:
+            since = timezone.now() - timedelta(days=options["days"])
+            queryset = queryset.filter(occurred_datetime__gte=since)
+        with self.profile(lambda: self.get_run_profile_name("enrich")):
+            count = enrichment.enrich(queryset, workers=options["workers"], limit=options["limit"])
+        logger.debug(f"Fetched the detail of {count} earthquakes")
@@ -1,77 +1,287 @@
 # Django helpers
 # Logging
+import itertools
 import logging
+import time
+from datetime import datetime, timezone as dt_timezone
 
-# Files
-import requests
+from django.conf import settings
 from django.contrib.gis.geos import Point
-from django.core.files.base import ContentFile
 from django.core.management.base import BaseCommand, CommandError
+from django.db import router, transaction
 from django.utils import timezone
 
+from anss import archive, changes, locks, parse_unix_datetime, segments, transports
 from anss.models import Feed, FeedEarthquake
+from anss.pipeline import Pipeline
+from anss.profiling import ProfileMixin
+from anss.signals import feed_archived
 
 logger = logging.getLogger(__name__)
 
+# Whether new earthquakes are tagged with the regions containing them, which requires Shapely
+TAG_REGIONS = getattr(settings, "ANSS_TAG_REGIONS", False)
 
-class Command(BaseCommand):
+
+def parse_datetime(value):
+    """
+    Parses an ISO date from the command line. Dates without a timezone are UTC.
+    """
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=dt_timezone.utc)
+    return dt
+
+
+class Command(ProfileMixin, BaseCommand):
     help = (
         "Archive the latest real-time earthquake notifications "
         "from the USGS's Advanced National Seismic System"
     )
 
+    # The kind of feed archived
+    feed_type = "m1"
+    feed_format = "geojson"
+    feed_timeframe = "one-hour"
+
+    # How many earthquakes are inserted with each query
+    batch_size = 1000
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--type",
+            choices=[c[0] for c in Feed.TYPE_CHOICES],
+            help=f"The type of feed to archive. Defaults to {self.feed_type}.",
+        )
+        parser.add_argument(
+            "--timeframe",
+            choices=[c[0] for c in Feed.TIMEFRAME_CHOICES],
+            help=f"The timeframe of feed to archive. Defaults to {self.feed_timeframe}.",
+        )
+        source = parser.add_mutually_exclusive_group()
+        source.add_argument(
+            "--url",
+            help="The feed to archive. Defaults to the USGS feed of that type and timeframe.",
+        )
+        source.add_argument(
+            "--directory",
+            help="Replay the feeds saved as files in this directory instead.",
+        )
+        source.add_argument(
+            "--replay-archive",
+            action="store_true",
+            help="Replay the feeds already in the archive instead.",
+        )
+        parser.add_argument(
+            "--start",
+            type=parse_datetime,
+            help="Only replay archived feeds pulled on or after this ISO date.",
+        )
+        parser.add_argument(
+            "--end",
+            type=parse_datetime,
+            help="Only replay archived feeds pulled before this ISO date.",
+        )
+        parser.add_argument(
+            "--speed",
+            type=float,
+            help=(
+                "Replay feeds this many times faster than they were originally pulled. "
+                "By default, they go as fast as the database allows."
+            ),
+        )
+        self.add_profile_arguments(parser)
+
     def set_options(self, *args, **options):
         self.now = timezone.now()
-        self.url = (
-            "https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/1.0_hour.geojson"
-        )
-        self.feed = Feed.objects.create(
-            archived_datetime=self.now,
-            type="m1",
-            format="geojson",
-            timeframe="one-hour",
+        self.feed_type = options.get("type") or self.feed_type
+        self.feed_timeframe = options.get("timeframe") or self.feed_timeframe
+        self.url = options.get("url") or transports.get_feed_url(
+            self.feed_type, self.feed_timeframe, self.feed_format
         )
+        self.speed = options.get("speed")
+        self.transport = self.get_transport(**options)
+        # Feeds read from anywhere but the USGS are history or test data, not news
+        self.replay = not isinstance(self.transport, transports.HTTPTransport)
+        self.set_profile_options(**options)
+        # Every feed replayed from the archive is already in it, so only other sources are checked
+        self.skip_archived = not options.get("replay_archive")
+        # The generated times of the feeds this run has let through, which may not be saved yet
+        self.generated = set()
+        # Repeats are checked against the database that's written to, which can't lag behind
+        self.using = router.db_for_write(Feed)
+        # The earthquakes in the last feed archived by this run, to compare with the next one
+        self.previous_state = None
         self.feedearthquake_model = self.get_feedearthquake_model()
 
     def handle(self, *args, **options):
         # Set options
         self.set_options(*args, **options)
 
-        # Get the feed
-        raw_feed = self.get_usgs_feed()
+        # Only one run at a time archives each type of feed. Later runs leave right away.
+        with locks.advisory_lock(self.get_lock_name()) as acquired:
+            if not acquired:
+                logger.info(f"Another run is archiving {self.feed_type} {self.feed_timeframe} feeds. Exiting.")
+                return
+            self.archive_all()
 
+    def archive_all(self):
+        """
+        Archives every feed from the transport.
+        """
+        start = time.perf_counter()
+        feeds = earthquakes = 0
+        previous = None
+        # Download and store the next feeds in the background while this thread saves each one
+        pipeline = Pipeline(
+            self.transport,
+            storage=Feed._meta.get_field("content").storage,
+            get_file_path=self.get_file_path,
+            pack=self.pack_content if archive.LAYOUT == "packed" else None,
+            skip=self.is_repeat if self.skip_archived else None,
+            using=self.using,
+        )
+        for staged in pipeline:
+            if self.speed and previous:
+                self.wait(previous, staged.archived_datetime)
+            previous = staged.archived_datetime
+            self.feed = None
+            with self.profile(self.get_profile_name):
+                self.archive(staged)
+            if self.feed is not None:
+                feeds += 1
+                earthquakes += self.feed.count or 0
+
+        seconds = time.perf_counter() - start
+        msg = f"Archived {feeds} feeds with {earthquakes} earthquakes in {seconds:.2f} seconds"
+        logger.debug(msg)
+        # Report the throughput of replays, which are run for load testing
+        if self.replay and seconds:
+            self.stdout.write(f"{msg} ({earthquakes / seconds:.1f} earthquakes per second)")
+
+    def get_lock_name(self):
+        """
+        Returns the name of the advisory lock held while archiving.
+        """
+        return f"anss:getlatestanssfeed:{self.feed_type}:{self.feed_timeframe}"
+
+    def get_transport(self, **options):
+        """
+        Returns the transport the feeds will be read from.
+        """
+        if options.get("directory"):
+            return transports.DirectoryTransport(options["directory"])
+        if options.get("replay_archive"):
+            return transports.ArchiveTransport(start=options.get("start"), end=options.get("end"))
+        return transports.HTTPTransport(self.url)
+
+    def get_profile_name(self):
+        """
+        Returns the name the profile of the current feed is saved under.
+        """
+        return f"feed-{self.feed.id}" if self.feed else f"feed-skipped-{int(time.time())}"
+
+    def wait(self, previous, archived_datetime):
+        """
+        Sleeps for the gap between two replayed feeds, shortened by the replay speed.
+        """
+        gap = (archived_datetime - previous).total_seconds() / self.speed
+        if gap > 0:
+            time.sleep(gap)
+
+    def archive(self, staged):
+        """
+        Saves a StagedFeed from the pipeline to the database, along with its earthquakes.
+
+        Feeds that were already archived are skipped, leaving self.feed empty.
+        """
         # Check the response
-        logger.debug(f"Response code: {raw_feed.status_code}")
-        if not raw_feed.status_code == 200:
-            msg = f"Request for {self.url} failed with code {raw_feed.status_code}"
+        item = staged.item
+        logger.debug(f"Response code: {item.status}")
+        if not item.status == 200:
+            msg = f"Request for {item.source} failed with " + (item.error or f"code {item.status}")
             logger.error(msg)
-            self.feed.status = raw_feed.status_code
-            self.feed.save()
+            self.feed = self.create_feed(staged.archived_datetime, status=item.status)
             raise CommandError(msg)
+        geojson = staged.geojson
+        if self.timings is not None:
+            self.timings.add("decode", staged.decode_seconds)
+
+        # Skip feeds USGS has not regenerated since the last run, which the pipeline didn't store
+        metadata = geojson["metadata"]
+        if staged.skipped:
+            logger.info(f"Feed generated at {metadata['generated']} is already archived. Skipping.")
+            self.previous_state = None
+            return
+
+        # Save the feed, its earthquakes and its changes together, so a run that dies midway leaves nothing
+        # behind that would look archived to the next one
+        with transaction.atomic(using=self.using):
+            # Link the file or segment the pipeline stored
+            self.feed = self.create_feed(staged.archived_datetime)
+            if staged.packed is None:
+                self.feed.content.name = staged.content_name
+                logger.debug(f"Archived at {self.feed.content.url}")
+            else:
+                self.feed.segment = archive.get_segment(staged.packed.segment_name, self.feed)
+                self.feed.segment_offset = staged.packed.offset
+                self.feed.segment_length = staged.packed.length
+                logger.debug(f"Archived in {self.feed.segment} at byte {self.feed.segment_offset}")
+
+            # Save the metadata to the database
+            logger.debug(f"Logging metadata {metadata}")
+            self.feed.generated = metadata["generated"]
+            self.feed.url = metadata["url"]
+            self.feed.title = metadata["title"]
+            self.feed.api = metadata["api"]
+            self.feed.count = metadata["count"]
+            self.feed.status = metadata["status"]
+            self.feed.save()
+
+            # Save the earthquakes
+            self.create_feedearthquakes(geojson["features"])
+
+            # Log what changed since the previous feed
+            state = changes.get_state(geojson["features"])
+            changes.record_changes(self.feed, state, previous=self.previous_state)
+        self.previous_state = state
+
+        # Let the rest of the app know there's a new feed
+        feed_archived.send(sender=self.__class__, feed=self.feed, replay=self.replay)
 
-        # Save the file
-        logger.debug("Archiving data")
-        self.feed.content.save(
-            self.get_file_path(), ContentFile(raw_feed.content), save=True
+    def create_feed(self, archived_datetime, **kwargs):
+        """
+        Creates the Feed record for a feed archived at the provided time.
+        """
+        return Feed.objects.create(
+            archived_datetime=archived_datetime,
+            type=self.feed_type,
+            format=self.feed_format,
+            timeframe=self.feed_timeframe,
+            **kwargs,
         )
-        logger.debug(f"Archived at {self.feed.content.url}")
 
-        # Read in the GeoJSON as a Python dictionary
-        geojson = raw_feed.json()
+    def is_archived(self, generated):
+        """
+        Returns whether a feed of this type generated at the provided UNIX time is already in the archive.
+        """
+        return (
+            Feed.objects.using(self.using)
+            .filter(type=self.feed_type, timeframe=self.feed_timeframe, generated=generated)
+            .exists()
+        )
 
-        # Save the metadata to the database
-        metadata = geojson["metadata"]
-        logger.debug(f"Logging metadata {metadata}")
-        self.feed.generated = metadata["generated"]
-        self.feed.url = metadata["url"]
-        self.feed.title = metadata["title"]
-        self.feed.api = metadata["api"]
-        self.feed.count = metadata["count"]
-        self.feed.status = metadata["status"]
-        self.feed.save()
-
-        # Save each earthquake
-        [self.create_feedearthquake(d) for d in geojson["features"]]
+    def is_repeat(self, geojson):
+        """
+        Returns whether a decoded feed was already archived, by an earlier run or earlier in this one.
+
+        The pipeline calls it from its storage thread, so repeats are dropped before they're written anywhere.
+        """
+        generated = geojson["metadata"]["generated"]
+        if generated in self.generated:
+            return True
+        self.generated.add(generated)
+        return self.is_archived(generated)
 
     def safestr(self, v):
         """
@@ -85,30 +295,79 @@ class Command(BaseCommand):
         """
         return FeedEarthquake
 
-    def get_usgs_feed(self):
+    def get_file_path(self, archived_datetime, content=None):
         """
-        Returns a real-time feed from ANSS.
+        Returns the file path where the content archived at the provided time will be saved in the MEDIA_ROOT
         """
-        # Request the URL
-        logger.debug(f"Requesting {self.url}")
-        return requests.get(self.url)
+        return archive.get_file_path(
+            self.feed_type, self.feed_format, self.feed_timeframe, archived_datetime, content=content
+        )
+
+    def pack_content(self, archived_datetime, content):
+        """
+        Packs the content archived at the provided time into a segment and returns where it went.
+        """
+        return segments.append(
+            Feed._meta.get_field("content").storage,
+            self.feed_type,
+            self.feed_format,
+            self.feed_timeframe,
+            archived_datetime,
+            content,
+        )
 
-    def get_file_path(self):
+    def create_feedearthquakes(self, features):
         """
-        Returns the file path where the archived content will be saved in the MEDIA_ROOT
+        Accepts a list of raw GeoJSON feature dictionaries and saves them to the database in batches.
         """
-        return f"anss/{self.feed.type}/{self.feed.format}/{self.feed.timeframe}/{self.feed.archived_datetime}.json"
+        if self.timings is None:
+            objects = (self.build_feedearthquake(d) for d in features)
+        else:
+            objects = (self.timings.time("parse", self.build_feedearthquake, d) for d in features)
+        tagger = self.get_region_tagger()
+        while batch := list(itertools.islice(objects, self.batch_size)):
+            if tagger is not None:
+                start = time.perf_counter()
+                tagger.tag_earthquakes(batch)
+                if self.timings is not None:
+                    self.timings.add("tag", time.perf_counter() - start, count=len(batch))
+            start = time.perf_counter()
+            self.feedearthquake_model.objects.bulk_create(batch)
+            if self.timings is not None:
+                self.timings.add("insert", time.perf_counter() - start, count=len(batch))
+            logger.debug(f"Saved {len(batch)} earthquakes")
+
+    def get_region_tagger(self):
+        """
+        Returns the RegionTagger new earthquakes are tagged with, or None when tagging is off.
+        """
+        if not TAG_REGIONS:
+            return None
+        # Shapely is optional, so it's only imported when asked for
+        from anss import regions
+
+        return regions.get_tagger()
 
     def create_feedearthquake(self, d):
         """
         Accepts a raw GeoJSON feature dictionary from the an ANSS real-time feed and creates a database record.
         """
+        obj = self.build_feedearthquake(d)
+        obj.save()
+        logger.debug(f"Saved {obj}")
+        return obj
+
+    def build_feedearthquake(self, d):
+        """
+        Accepts a raw GeoJSON feature dictionary from the an ANSS real-time feed and returns an unsaved record.
+        """
         p = d["properties"]
         obj = self.feedearthquake_model(
             feed=self.feed,
             mag=p["mag"],
             place=self.safestr(p["place"]),
             time=p["time"],
+            occurred_datetime=parse_unix_datetime(p["time"]) if p["time"] else None,
             updated=p["updated"],
             tz=p["tz"],
             url=self.safestr(p["url"]),
@@ -137,6 +396,4 @@ class Command(BaseCommand):
         lng, lat, depth = d["geometry"]["coordinates"]
         obj.point = Point(lng, lat)
         obj.depth = depth
-        obj.save()
-        logger.debug(f"Saved {obj}")
         return obj
@@ -0,0 +1,58 @@
+import logging
+
+from django.contrib.gis.gdal import DataSource
+from django.contrib.gis.geos import MultiPolygon
+from django.core.management.base import BaseCommand, CommandError
+
+from anss.models import Region
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Load region boundaries from a shapefile, GeoJSON or any other file GDAL can read"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="The file to load")
+        parser.add_argument(
+            "--name-field",
+            default="name",
+            help="The attribute holding each region's name. Defaults to name.",
+        )
+        parser.add_argument(
+            "--srid",
+            type=int,
+            help="The spatial reference of the boundaries, for files that don't say. Defaults to the file's own.",
+        )
+        parser.add_argument(
+            "--kind",
+            default="",
+            help="The kind of region in the file, like state or county.",
+        )
+
+    def handle(self, *args, **options):
+        layer = DataSource(options["path"])[0]
+        if options["name_field"] not in layer.fields:
+            raise CommandError(f"{options['path']} has no {options['name_field']} field")
+        if options["srid"] is None and layer.srs is None:
+            raise CommandError(f"{options['path']} doesn't say what spatial reference it uses. Pass --srid.")
+        count = 0
+        for feature in layer:
+            geom = feature.geom
+            if options["srid"] is not None:
+                geom.srid = options["srid"]
+            # GDAL reprojects from the file's own reference, even ones without an EPSG code
+            geom.transform(4326)
+            geom = geom.geos
+            if geom.geom_type == "Polygon":
+                geom = MultiPolygon(geom, srid=4326)
+            elif geom.geom_type != "MultiPolygon":
+                logger.warning(f"Skipping {feature.get(options['name_field'])}, a {geom.geom_type}")
+                continue
+            Region.objects.update_or_create(
+                kind=options["kind"],
+                name=feature.get(options["name_field"]),
+                defaults=dict(boundary=geom),
+            )
+            count += 1
+        logger.debug(f"Loaded {count} regions. Run taganssregions to tag archived earthquakes with them.")
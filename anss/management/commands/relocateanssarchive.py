@@ -0,0 +1,50 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from anss import archive
+from anss.profiling import ProfileMixin
+
+logger = logging.getLogger(__name__)
+
+
+class Command(ProfileMixin, BaseCommand):
+    help = "Move the files of archived feeds into the current archive layout"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--layout",
+            choices=archive.LAYOUTS,
+            default=archive.LAYOUT,
+            help=f"The layout to move files into. Defaults to the ANSS_ARCHIVE_LAYOUT setting, {archive.LAYOUT}.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=archive.WORKERS,
+            help=f"How many files to copy at once. Defaults to {archive.WORKERS}.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=archive.BATCH_SIZE,
+            help=f"How many feeds to update with each query. Defaults to {archive.BATCH_SIZE}.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Count the files that would move without moving them.",
+        )
+        self.add_profile_arguments(parser)
+
+    def handle(self, *args, **options):
+        self.set_profile_options(**options)
+        with self.profile(lambda: self.get_run_profile_name("relocate")):
+            count = archive.relocate_feeds(
+                layout=options["layout"],
+                workers=options["workers"],
+                batch_size=options["batch_size"],
+                dry_run=options["dry_run"],
+            )
+        verb = "Would move" if options["dry_run"] else "Moved"
+        self.stdout.write(f"{verb} {count} files into the {options['layout']} layout")
@@ -0,0 +1,69 @@
+import logging
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from anss import analytics
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Report how long after they occur earthquakes are first archived"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            help="Only include earthquakes and feeds from this many recent days. By default, everything is included.",
+        )
+        parser.add_argument(
+            "--bin-width",
+            type=float,
+            default=1.0,
+            help="The width of the magnitude bins. Defaults to 1.",
+        )
+
+    def handle(self, *args, **options):
+        start = None
+        if options["days"]:
+            start = timezone.now() - timedelta(days=options["days"])
+
+        latencies = analytics.load_latencies(start=start)
+        logger.debug(f"Loaded {len(latencies.latency)} first sightings")
+        self.write_report(
+            "Detection latency by network",
+            "Network",
+            analytics.latency_by_network(latencies),
+        )
+        self.write_report(
+            "Detection latency by magnitude",
+            "Magnitude",
+            analytics.latency_by_magnitude(latencies, bin_width=options["bin_width"]),
+        )
+
+        lags, counts = analytics.load_feed_lags(start=start)
+        self.write_report(
+            "Feed lag by earthquakes in the feed",
+            "Earthquakes",
+            analytics.lag_by_count(lags, counts),
+        )
+
+    def write_report(self, title, label, report):
+        """
+        Writes a report from anss.analytics as a table of durations.
+        """
+        self.stdout.write(title)
+        header = [label, "Count", *[f"p{p}" for p in analytics.PERCENTILES]]
+        self.stdout.write("".join(f"{h:>14}" for h in header))
+        for group, count, percentiles in zip(*report):
+            row = [group if group != "" else "-", count, *[self.format_seconds(p) for p in percentiles]]
+            self.stdout.write("".join(f"{str(v):>14}" for v in row))
+        self.stdout.write("")
+
+    def format_seconds(self, seconds):
+        """
+        Formats a number of seconds as hours, minutes and seconds.
+        """
+        return str(timedelta(seconds=round(float(seconds))))
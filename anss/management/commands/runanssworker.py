@@ -0,0 +1,98 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from anss import leases
+from anss.models import Feed
+
+logger = logging.getLogger(__name__)
+
+# The feeds workers archive, as "type:timeframe"
+FEEDS = getattr(settings, "ANSS_WORKER_FEEDS", ("m1:one-hour",))
+
+
+def parse_slot(value):
+    """
+    Parses a "type:timeframe" feed from the command line.
+    """
+    feed_type, _, timeframe = value.partition(":")
+    if feed_type not in dict(Feed.TYPE_CHOICES) or timeframe not in dict(Feed.TIMEFRAME_CHOICES):
+        raise CommandError(f"{value} is not a feed type and timeframe, like m1:one-hour")
+    return feed_type, timeframe
+
+
+class Command(BaseCommand):
+    help = "Archive feeds continuously, sharing them with the workers running on other hosts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--feed",
+            action="append",
+            dest="feeds",
+            help=(
+                "A feed to archive, as type:timeframe. Repeat for more. "
+                "Defaults to the ANSS_WORKER_FEEDS setting. Every worker should be given the same feeds."
+            ),
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=60,
+            help="Seconds between archive runs. Defaults to 60.",
+        )
+        parser.add_argument(
+            "--lease-seconds",
+            type=int,
+            default=leases.LEASE_SECONDS,
+            help=(
+                "Seconds a lease lasts without being renewed, after which other workers take over. "
+                f"Defaults to {leases.LEASE_SECONDS}."
+            ),
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Archive the feeds this worker holds once, then exit.",
+        )
+
+    def handle(self, *args, **options):
+        slots = [parse_slot(f) for f in options["feeds"] or FEEDS]
+        if options["lease_seconds"] <= options["interval"]:
+            raise CommandError("--lease-seconds must be longer than --interval, or leases expire between runs")
+        self.name = leases.get_worker_name()
+        logger.info(f"Starting worker {self.name}")
+        try:
+            while True:
+                start = time.monotonic()
+                # Replace a connection lost to a database restart or failover, as Django does between requests
+                close_old_connections()
+                self.run(slots, options["lease_seconds"])
+                if options["once"]:
+                    return
+                time.sleep(max(0, options["interval"] - (time.monotonic() - start)))
+        finally:
+            close_old_connections()
+            leases.leave(self.name, slots)
+            logger.info(f"Stopped worker {self.name}")
+
+    def run(self, slots, lease_seconds):
+        """
+        Balances the leases, then archives each feed this worker holds.
+        """
+        held = leases.balance(self.name, slots, lease_seconds)
+        logger.debug(f"{self.name} holds {held}")
+        for feed_type, timeframe in held:
+            # Renew between feeds, and skip any lost while the last one was archived
+            if (feed_type, timeframe) not in leases.renew(self.name, held, lease_seconds):
+                continue
+            try:
+                call_command("getlatestanssfeed", type=feed_type, timeframe=timeframe)
+            except CommandError as e:
+                # One failed feed shouldn't stop the others
+                logger.error(f"Archiving {feed_type} {timeframe} failed: {e}")
+            except Exception:
+                logger.exception(f"Archiving {feed_type} {timeframe} failed")
@@ -0,0 +1,34 @@
+import logging
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from anss import regions
+from anss.models import FeedEarthquake
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Tag archived earthquakes with the regions that contain them, after regions are loaded or changed"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            help="Only retag earthquakes that occurred within this many days. By default, everything is retagged.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=regions.CHUNK_SIZE,
+            help=f"How many earthquakes to tag and save at a time. Defaults to {regions.CHUNK_SIZE}.",
+        )
+
+    def handle(self, *args, **options):
+        qs = FeedEarthquake.objects.all()
+        if options["days"] is not None:
+            qs = qs.filter(occurred_datetime__gte=timezone.now() - timedelta(days=options["days"]))
+        count = regions.retag(qs, chunk_size=options["chunk_size"])
+        logger.debug(f"Retagged {count} earthquakes")
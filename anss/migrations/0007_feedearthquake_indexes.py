@@ -0,0 +1,50 @@
+# Generated by Django 4.2 on 2026-10-19 15:23
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # Build the indexes without locking out the archive command
+    atomic = False
+
+    dependencies = [
+        ("anss", "0006_auto_20190709_1147"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddIndexConcurrently(
+            model_name="feedearthquake",
+            index=models.Index(
+                fields=["-feed", "-time"], name="anss_feedeq_feed_time_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="feedearthquake",
+            index=models.Index(
+                fields=["usgs_id", "-feed"], name="anss_feedeq_usgs_id_feed_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="feedearthquake",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("title"), name="gin_trgm_ops"
+                ),
+                name="anss_feedeq_title_trgm_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="feedearthquake",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("ids"), name="gin_trgm_ops"
+                ),
+                name="anss_feedeq_ids_trgm_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2 on 2026-10-19 16:02
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+BATCH_SIZE = 100000
+
+
+def fill_occurred_datetime(apps, schema_editor):
+    """
+    Converts the UNIX time of every archived earthquake, one block of ids at a time.
+    """
+    FeedEarthquake = apps.get_model("anss", "FeedEarthquake")
+    bounds = FeedEarthquake.objects.aggregate(
+        first=models.Min("id"), last=models.Max("id")
+    )
+    if bounds["first"] is None:
+        return
+    table = schema_editor.quote_name(FeedEarthquake._meta.db_table)
+    with schema_editor.connection.cursor() as cursor:
+        for start in range(bounds["first"], bounds["last"] + 1, BATCH_SIZE):
+            cursor.execute(
+                f"UPDATE {table} SET occurred_datetime = to_timestamp(time / 1000.0) "
+                "WHERE id >= %s AND id < %s AND time IS NOT NULL",
+                [start, start + BATCH_SIZE],
+            )
+
+
+class Migration(migrations.Migration):
+
+    # Commit each batch of the backfill and build the index without locking out the archive command
+    atomic = False
+
+    dependencies = [
+        ("anss", "0007_feedearthquake_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="feedearthquake",
+            name="occurred_datetime",
+            field=models.DateTimeField(
+                help_text="Time when the event occurred as a UTC datetime. Derived from the time field.",
+                null=True,
+                verbose_name="occurred at",
+            ),
+        ),
+        migrations.RunPython(fill_occurred_datetime, migrations.RunPython.noop),
+        AddIndexConcurrently(
+            model_name="feedearthquake",
+            index=models.Index(
+                fields=["occurred_datetime"], name="anss_feedeq_occurred_idx"
+            ),
+        ),
+    ]
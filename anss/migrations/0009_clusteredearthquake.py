@@ -0,0 +1,68 @@
+# Generated by Django 4.2 on 2026-10-19 17:10
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("anss", "0008_feedearthquake_occurred_datetime"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ClusteredEarthquake",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "usgs_id",
+                    models.CharField(
+                        max_length=5000, unique=True, verbose_name="USGS ID"
+                    ),
+                ),
+                (
+                    "time",
+                    models.BigIntegerField(
+                        db_index=True, verbose_name="occurred at (UNIX)"
+                    ),
+                ),
+                ("mag", models.FloatField(null=True, verbose_name="magnitude")),
+                (
+                    "point",
+                    django.contrib.gis.db.models.fields.PointField(
+                        srid=4326, verbose_name="epicenter"
+                    ),
+                ),
+                (
+                    "cluster",
+                    models.CharField(
+                        db_index=True,
+                        help_text="The USGS ID of the mainshock of the earthquake's sequence",
+                        max_length=5000,
+                        verbose_name="sequence",
+                    ),
+                ),
+                (
+                    "is_mainshock",
+                    models.BooleanField(
+                        default=True,
+                        help_text="Whether the earthquake is the largest in its sequence. "
+                        "Independent earthquakes are their own mainshock.",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Clustered earthquake",
+                "ordering": ("-time",),
+            },
+        ),
+    ]
@@ -0,0 +1,114 @@
+# Generated by Django 4.2 on 2026-10-19 18:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_first_sightings(apps, schema_editor):
+    """
+    Finds the first copy of every earthquake already in the archive.
+    """
+    FirstSighting = apps.get_model("anss", "FirstSighting")
+    FeedEarthquake = apps.get_model("anss", "FeedEarthquake")
+    Feed = apps.get_model("anss", "Feed")
+    sighting = schema_editor.quote_name(FirstSighting._meta.db_table)
+    earthquake = schema_editor.quote_name(FeedEarthquake._meta.db_table)
+    feed = schema_editor.quote_name(Feed._meta.db_table)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {sighting} "
+            "(usgs_id, feed_id, first_seen, occurred_datetime, net, mag, latency) "
+            "SELECT DISTINCT ON (e.usgs_id) e.usgs_id, e.feed_id, f.archived_datetime, "
+            "e.occurred_datetime, e.net, e.mag, f.archived_datetime - e.occurred_datetime "
+            f"FROM {earthquake} e JOIN {feed} f ON f.id = e.feed_id "
+            "WHERE e.usgs_id <> '' AND f.archived_datetime IS NOT NULL "
+            "ORDER BY e.usgs_id, f.archived_datetime, e.feed_id"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("anss", "0009_clusteredearthquake"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FirstSighting",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "usgs_id",
+                    models.CharField(
+                        max_length=5000, unique=True, verbose_name="USGS ID"
+                    ),
+                ),
+                (
+                    "first_seen",
+                    models.DateTimeField(
+                        help_text="The time the first feed including the earthquake was pulled.",
+                        verbose_name="first archived at",
+                    ),
+                ),
+                (
+                    "occurred_datetime",
+                    models.DateTimeField(
+                        help_text="Time when the event occurred, as first reported.",
+                        null=True,
+                        verbose_name="occurred at",
+                    ),
+                ),
+                (
+                    "net",
+                    models.CharField(
+                        blank=True,
+                        help_text="As first reported",
+                        max_length=5000,
+                        verbose_name="network ID",
+                    ),
+                ),
+                (
+                    "mag",
+                    models.FloatField(
+                        help_text="As first reported",
+                        null=True,
+                        verbose_name="magnitude",
+                    ),
+                ),
+                (
+                    "latency",
+                    models.DurationField(
+                        help_text="The time from when the event occurred until it was first archived.",
+                        null=True,
+                    ),
+                ),
+                (
+                    "feed",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="anss.feed",
+                        verbose_name="first archived source",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "First sighting",
+                "ordering": ("-first_seen",),
+                "get_latest_by": "first_seen",
+                "indexes": [
+                    models.Index(
+                        fields=["occurred_datetime"], name="anss_sighting_occurred_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(fill_first_sightings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2 on 2026-10-19 19:20
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # Build the index without locking out the archive command
+    atomic = False
+
+    dependencies = [
+        ("anss", "0010_firstsighting"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="feed",
+            index=models.Index(
+                fields=["type", "timeframe", "generated"],
+                name="anss_feed_generated_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 4.2 on 2026-10-19 19:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("anss", "0011_feed_generated_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EventDetail",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "usgs_id",
+                    models.CharField(
+                        max_length=5000, unique=True, verbose_name="USGS ID"
+                    ),
+                ),
+                (
+                    "url",
+                    models.CharField(
+                        max_length=5000, verbose_name="detail GeoJSON URL"
+                    ),
+                ),
+                (
+                    "updated",
+                    models.BigIntegerField(
+                        help_text="The time the event was updated when its detail was fetched.",
+                        null=True,
+                        verbose_name="updated at (UNIX)",
+                    ),
+                ),
+                ("fetched_datetime", models.DateTimeField(verbose_name="fetched at")),
+                (
+                    "status",
+                    models.IntegerField(null=True, verbose_name="response status"),
+                ),
+                (
+                    "content",
+                    models.FileField(
+                        blank=True,
+                        upload_to="",
+                        verbose_name="archived detail GeoJSON",
+                    ),
+                ),
+                ("moment_tensor", models.JSONField(blank=True, null=True)),
+                (
+                    "shakemap",
+                    models.JSONField(blank=True, null=True, verbose_name="ShakeMap"),
+                ),
+                (
+                    "pager",
+                    models.JSONField(blank=True, null=True, verbose_name="PAGER"),
+                ),
+            ],
+            options={
+                "verbose_name": "Event detail",
+                "ordering": ("-fetched_datetime",),
+                "get_latest_by": "fetched_datetime",
+            },
+        ),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 4.2 on 2026-10-19 20:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("anss", "0012_eventdetail"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchiveSegment",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(
+                        help_text="The segment's name in storage.",
+                        max_length=5000,
+                        unique=True,
+                    ),
+                ),
+                (
+                    "type",
+                    models.CharField(
+                        choices=[("m1", "Magnitude > 1.0")], max_length=500
+                    ),
+                ),
+                (
+                    "format",
+                    models.CharField(choices=[("geojson", "GeoJSON")], max_length=500),
+                ),
+                (
+                    "timeframe",
+                    models.CharField(
+                        choices=[("one-hour", "One hour")], max_length=500
+                    ),
+                ),
+                (
+                    "created_datetime",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="created at"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Archive segment",
+                "ordering": ("-created_datetime",),
+                "get_latest_by": "created_datetime",
+            },
+        ),
+        migrations.AddField(
+            model_name="feed",
+            name="segment_length",
+            field=models.BigIntegerField(
+                blank=True, help_text="Compressed bytes in the segment.", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="feed",
+            name="segment_offset",
+            field=models.BigIntegerField(
+                blank=True, help_text="Bytes into the segment.", null=True
+            ),
+        ),
+        migrations.AlterField(
+            model_name="feed",
+            name="content",
+            field=models.FileField(
+                blank=True, upload_to="", verbose_name="archived GeoJSON"
+            ),
+        ),
+        migrations.AddField(
+            model_name="feed",
+            name="segment",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                to="anss.archivesegment",
+            ),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2 on 2026-10-19 21:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("anss", "0013_archivesegment"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FeedChange",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("usgs_id", models.CharField(max_length=5000, verbose_name="USGS ID")),
+                (
+                    "change",
+                    models.CharField(
+                        choices=[
+                            ("new", "New"),
+                            ("updated", "Updated"),
+                            ("removed", "Removed"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "updated",
+                    models.BigIntegerField(
+                        help_text="The time the event was updated, as of the feed. Removed events keep their last update.",
+                        null=True,
+                        verbose_name="updated at (UNIX)",
+                    ),
+                ),
+                (
+                    "feed",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="anss.feed",
+                        verbose_name="archived source",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Feed change",
+                "ordering": ("id",),
+            },
+        ),
+    ]
@@ -0,0 +1,169 @@
+# Generated by Django 4.2 on 2026-10-19 22:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("anss", "0014_feedchange"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AlertSubscription",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=500, unique=True)),
+                (
+                    "url",
+                    models.URLField(max_length=5000, verbose_name="webhook URL"),
+                ),
+                ("active", models.BooleanField(default=True)),
+                (
+                    "min_mag",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="minimum magnitude"
+                    ),
+                ),
+                (
+                    "min_sig",
+                    models.IntegerField(
+                        blank=True, null=True, verbose_name="minimum significance"
+                    ),
+                ),
+                (
+                    "min_alert",
+                    models.CharField(
+                        blank=True,
+                        choices=[
+                            ("green", "Green"),
+                            ("yellow", "Yellow"),
+                            ("orange", "Orange"),
+                            ("red", "Red"),
+                        ],
+                        max_length=10,
+                        verbose_name="minimum PAGER alert",
+                    ),
+                ),
+                (
+                    "tsunami",
+                    models.BooleanField(
+                        default=False,
+                        help_text="Notify of earthquakes with a tsunami warning.",
+                    ),
+                ),
+                (
+                    "batch_size",
+                    models.PositiveIntegerField(
+                        default=100,
+                        help_text="The most earthquakes sent with each request.",
+                    ),
+                ),
+                (
+                    "created_datetime",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="created at"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Alert subscription",
+                "ordering": ("name",),
+            },
+        ),
+        migrations.CreateModel(
+            name="AlertDelivery",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("usgs_id", models.CharField(max_length=5000, verbose_name="USGS ID")),
+                (
+                    "updated",
+                    models.BigIntegerField(null=True, verbose_name="updated at (UNIX)"),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("sent", "Sent"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=10,
+                    ),
+                ),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                (
+                    "created_datetime",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="queued at"
+                    ),
+                ),
+                (
+                    "next_attempt_datetime",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        verbose_name="next attempt at",
+                    ),
+                ),
+                (
+                    "sent_datetime",
+                    models.DateTimeField(blank=True, null=True, verbose_name="sent at"),
+                ),
+                ("last_error", models.TextField(blank=True)),
+                (
+                    "earthquake",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="anss.feedearthquake",
+                        verbose_name="first archived copy",
+                    ),
+                ),
+                (
+                    "subscription",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="anss.alertsubscription",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Alert delivery",
+                "verbose_name_plural": "Alert deliveries",
+                "ordering": ("-created_datetime",),
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("status", "pending")),
+                        fields=["next_attempt_datetime"],
+                        name="anss_alert_pending_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="alertdelivery",
+            constraint=models.UniqueConstraint(
+                fields=("subscription", "usgs_id", "updated"),
+                name="anss_alert_revision_unique",
+            ),
+        ),
+    ]
@@ -0,0 +1,168 @@
+# Generated by Django 4.2 on 2026-10-19 22:55
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("anss", "0015_alerts"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IngestLease",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "type",
+                    models.CharField(
+                        choices=[
+                            ("significant", "Significant"),
+                            ("m4.5", "Magnitude > 4.5"),
+                            ("m2.5", "Magnitude > 2.5"),
+                            ("m1", "Magnitude > 1.0"),
+                            ("all", "All"),
+                        ],
+                        max_length=500,
+                    ),
+                ),
+                (
+                    "timeframe",
+                    models.CharField(
+                        choices=[
+                            ("one-hour", "One hour"),
+                            ("one-day", "One day"),
+                            ("one-week", "One week"),
+                            ("one-month", "One month"),
+                        ],
+                        max_length=500,
+                    ),
+                ),
+                (
+                    "holder",
+                    models.CharField(
+                        blank=True,
+                        help_text="The name of the worker holding the lease.",
+                        max_length=500,
+                    ),
+                ),
+                (
+                    "acquired_datetime",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="acquired at"
+                    ),
+                ),
+                (
+                    "expires_datetime",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="expires at"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Ingest lease",
+                "ordering": ("type", "timeframe"),
+            },
+        ),
+        migrations.CreateModel(
+            name="IngestWorker",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=500, unique=True)),
+                (
+                    "started_datetime",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="started at"
+                    ),
+                ),
+                (
+                    "heartbeat_datetime",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="last seen at"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Ingest worker",
+                "ordering": ("name",),
+            },
+        ),
+        migrations.AlterField(
+            model_name="archivesegment",
+            name="timeframe",
+            field=models.CharField(
+                choices=[
+                    ("one-hour", "One hour"),
+                    ("one-day", "One day"),
+                    ("one-week", "One week"),
+                    ("one-month", "One month"),
+                ],
+                max_length=500,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="archivesegment",
+            name="type",
+            field=models.CharField(
+                choices=[
+                    ("significant", "Significant"),
+                    ("m4.5", "Magnitude > 4.5"),
+                    ("m2.5", "Magnitude > 2.5"),
+                    ("m1", "Magnitude > 1.0"),
+                    ("all", "All"),
+                ],
+                max_length=500,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="feed",
+            name="timeframe",
+            field=models.CharField(
+                choices=[
+                    ("one-hour", "One hour"),
+                    ("one-day", "One day"),
+                    ("one-week", "One week"),
+                    ("one-month", "One month"),
+                ],
+                max_length=500,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="feed",
+            name="type",
+            field=models.CharField(
+                choices=[
+                    ("significant", "Significant"),
+                    ("m4.5", "Magnitude > 4.5"),
+                    ("m2.5", "Magnitude > 2.5"),
+                    ("m1", "Magnitude > 1.0"),
+                    ("all", "All"),
+                ],
+                max_length=500,
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="ingestlease",
+            constraint=models.UniqueConstraint(
+                fields=("type", "timeframe"), name="anss_lease_slot_unique"
+            ),
+        ),
+    ]
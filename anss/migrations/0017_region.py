@@ -0,0 +1,71 @@
+# Generated by Django 4.2 on 2026-10-19 23:05
+
+import django.contrib.gis.db.models.fields
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("anss", "0016_ingestlease"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Region",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=500)),
+                (
+                    "kind",
+                    models.CharField(
+                        blank=True,
+                        help_text="The kind of area, like state or county.",
+                        max_length=500,
+                    ),
+                ),
+                (
+                    "boundary",
+                    django.contrib.gis.db.models.fields.MultiPolygonField(srid=4326),
+                ),
+                (
+                    "updated_datetime",
+                    models.DateTimeField(auto_now=True, verbose_name="updated at"),
+                ),
+            ],
+            options={
+                "verbose_name": "Region",
+                "ordering": ("kind", "name"),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="region",
+            constraint=models.UniqueConstraint(
+                fields=("kind", "name"), name="anss_region_unique"
+            ),
+        ),
+        migrations.AddField(
+            model_name="feedearthquake",
+            name="region_ids",
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.IntegerField(),
+                blank=True,
+                default=list,
+                help_text=(
+                    "The ids of the regions containing the epicenter, "
+                    "tagged when the earthquake was archived."
+                ),
+                size=None,
+                verbose_name="regions",
+            ),
+        ),
+    ]
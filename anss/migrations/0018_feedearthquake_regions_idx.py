@@ -0,0 +1,24 @@
+# Generated by Django 4.2 on 2026-10-19 23:05
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    # Build the index without locking out the archive command
+    atomic = False
+
+    dependencies = [
+        ("anss", "0017_region"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="feedearthquake",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["region_ids"], name="anss_feedeq_regions_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2 on 2026-10-20 09:15
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("anss", "0018_feedearthquake_regions_idx"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="alertsubscription",
+            name="batch_size",
+            field=models.PositiveIntegerField(
+                default=100,
+                help_text="The most earthquakes sent with each request.",
+                validators=[django.core.validators.MinValueValidator(1)],
+            ),
+        ),
+    ]
@@ -1,9 +1,34 @@
 from datetime import timedelta
 
 from django.contrib.gis.db import models
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.core.validators import MinValueValidator
+from django.db.models.functions import Abs, Lag, Upper
 from django.utils import timezone
 
-from anss import parse_unix_datetime
+from anss import parse_unix_datetime, segments
+from anss.functions import IsDistinctFrom, UnixDateTime
+
+
+class FeedQuerySet(models.QuerySet):
+    def with_lag(self):
+        """
+        Annotates each feed with generated_datetime and lag.
+
+        They are computed by the database, so feeds can be sorted and filtered by them.
+        """
+        generated_datetime = UnixDateTime("generated")
+        return self.annotate(
+            generated_datetime=generated_datetime,
+            lag=models.F("archived_datetime") - generated_datetime,
+        )
+
+    def archived(self):
+        """
+        Filters to feeds whose content was saved, either to its own file or packed into a segment.
+        """
+        return self.exclude(content="", segment=None)
 
 
 class Feed(models.Model):
@@ -15,13 +40,29 @@ class Feed(models.Model):
     archived_datetime = models.DateTimeField(
         help_text="The time the feed was pulled.", null=True
     )
-    TYPE_CHOICES = (("m1", "Magnitude > 1.0"),)
+    TYPE_CHOICES = (
+        ("significant", "Significant"),
+        ("m4.5", "Magnitude > 4.5"),
+        ("m2.5", "Magnitude > 2.5"),
+        ("m1", "Magnitude > 1.0"),
+        ("all", "All"),
+    )
     type = models.CharField(max_length=500, choices=TYPE_CHOICES)
     FORMAT_CHOICES = (("geojson", "GeoJSON"),)
     format = models.CharField(max_length=500, choices=FORMAT_CHOICES)
-    TIMEFRAME_CHOICES = (("one-hour", "One hour"),)
+    TIMEFRAME_CHOICES = (
+        ("one-hour", "One hour"),
+        ("one-day", "One day"),
+        ("one-week", "One week"),
+        ("one-month", "One month"),
+    )
     timeframe = models.CharField(max_length=500, choices=TIMEFRAME_CHOICES)
-    content = models.FileField(verbose_name="archived GeoJSON")
+    content = models.FileField(verbose_name="archived GeoJSON", blank=True)
+
+    # Where the content is, when it's packed into a segment instead of its own file
+    segment = models.ForeignKey("ArchiveSegment", null=True, blank=True, on_delete=models.PROTECT)
+    segment_offset = models.BigIntegerField(null=True, blank=True, help_text="Bytes into the segment.")
+    segment_length = models.BigIntegerField(null=True, blank=True, help_text="Compressed bytes in the segment.")
 
     # The metadata in the feed
     generated = models.BigIntegerField(null=True, verbose_name="time generated (UNIX)")
@@ -31,10 +72,16 @@ class Feed(models.Model):
     count = models.IntegerField(null=True, verbose_name="earthquake count")
     status = models.IntegerField(null=True, verbose_name="response status")
 
+    objects = FeedQuerySet.as_manager()
+
     class Meta:
         ordering = ("-archived_datetime",)
         get_latest_by = "archived_datetime"
         verbose_name = "Archived feed"
+        indexes = (
+            # Serves the check for feeds that were already archived. Not unique, since older archives have repeats.
+            models.Index(fields=["type", "timeframe", "generated"], name="anss_feed_generated_idx"),
+        )
 
     def __str__(self):
         return f"{self.title} ({self.archived_datetime})"
@@ -62,6 +109,105 @@ class Feed(models.Model):
 
     get_lag.short_description = "lag"
 
+    def read_content(self):
+        """
+        Returns the archived GeoJSON as bytes, from its own file or its segment.
+        """
+        if self.segment_id is not None:
+            storage = Feed._meta.get_field("content").storage
+            return segments.read(storage, self.segment.name, self.segment_offset, self.segment_length)
+        with self.content.open("rb") as f:
+            return f.read()
+
+
+class ArchiveSegment(models.Model):
+    """
+    A file of archived feeds packed together.
+
+    Table includes one row per segment. Maintained by the archive command.
+    """
+
+    name = models.CharField(max_length=5000, unique=True, help_text="The segment's name in storage.")
+    type = models.CharField(max_length=500, choices=Feed.TYPE_CHOICES)
+    format = models.CharField(max_length=500, choices=Feed.FORMAT_CHOICES)
+    timeframe = models.CharField(max_length=500, choices=Feed.TIMEFRAME_CHOICES)
+    created_datetime = models.DateTimeField(default=timezone.now, verbose_name="created at")
+
+    class Meta:
+        ordering = ("-created_datetime",)
+        get_latest_by = "created_datetime"
+        verbose_name = "Archive segment"
+
+    def __str__(self):
+        return self.name
+
+
+class FeedEarthquakeQuerySet(models.QuerySet):
+    # The fields tracked from one copy of an earthquake to the next
+    REVISION_FIELDS = ("mag", "point", "depth", "status")
+
+    def latest_versions(self):
+        """
+        Returns only the most recently archived copy of each earthquake.
+        """
+        return self.order_by("usgs_id", "-feed_id").distinct("usgs_id")
+
+    def revisions(self):
+        """
+        Returns the first copy of each earthquake and every later copy where a revision field changed.
+
+        Each copy is annotated with the values from the copy before it, as previous_feed_id, previous_mag
+        and so on, using LAG() window functions. Call get_changes() on the results to see what changed.
+
+        Filters applied before this method limit which copies are compared.
+        """
+        window = {
+            "partition_by": [models.F("usgs_id")],
+            "order_by": models.F("feed_id").asc(),
+        }
+        annotations = {"previous_feed_id": models.Window(Lag("feed_id"), **window)}
+        changed = models.Q(previous_feed_id__isnull=True)
+        for field in self.REVISION_FIELDS:
+            annotations[f"previous_{field}"] = models.Window(Lag(field), **window)
+            changed |= models.Q(IsDistinctFrom(field, f"previous_{field}"))
+        return self.annotate(**annotations).filter(changed).order_by("usgs_id", "feed_id")
+
+    def magnitude_revisions(self, threshold=0.5):
+        """
+        Returns every copy of an earthquake whose magnitude moved more than the threshold from the copy before it.
+        """
+        return (
+            self.revisions()
+            .annotate(mag_change=Abs(models.F("mag") - models.F("previous_mag")))
+            .filter(mag_change__gt=threshold)
+        )
+
+    def in_region(self, region):
+        """
+        Filters to earthquakes tagged with the provided region, or region id, using the GIN index.
+        """
+        region_id = getattr(region, "pk", region)
+        return self.filter(region_ids__contains=[region_id])
+
+
+class Region(models.Model):
+    """
+    A named area, like a state or county, that archived earthquakes are tagged with.
+    """
+
+    name = models.CharField(max_length=500)
+    kind = models.CharField(max_length=500, blank=True, help_text="The kind of area, like state or county.")
+    boundary = models.MultiPolygonField(srid=4326)
+    updated_datetime = models.DateTimeField(auto_now=True, verbose_name="updated at")
+
+    class Meta:
+        ordering = ("kind", "name")
+        verbose_name = "Region"
+        constraints = (models.UniqueConstraint(fields=["kind", "name"], name="anss_region_unique"),)
+
+    def __str__(self):
+        return f"{self.name} ({self.kind})" if self.kind else self.name
+
 
 class FeedEarthquake(models.Model):
     """
@@ -193,6 +339,13 @@ class FeedEarthquake(models.Model):
     )
     point = models.PointField(srid=4326, null=True, verbose_name="epicenter")
     depth = models.FloatField(null=True, help_text="Depth of the event in kilometers")
+    region_ids = ArrayField(
+        models.IntegerField(),
+        default=list,
+        blank=True,
+        verbose_name="regions",
+        help_text="The ids of the regions containing the epicenter, tagged when the earthquake was archived.",
+    )
 
     # When
     time = models.BigIntegerField(
@@ -207,6 +360,11 @@ class FeedEarthquake(models.Model):
         null=True,
         help_text="Timezone offset from UTC in minutes at the event epicenter",
     )
+    occurred_datetime = models.DateTimeField(
+        null=True,
+        verbose_name="occurred at",
+        help_text="Time when the event occurred as a UTC datetime. Derived from the time field.",
+    )
 
     # References
     url = models.CharField(max_length=5000, blank=True, verbose_name="Summary page")
@@ -275,10 +433,31 @@ class FeedEarthquake(models.Model):
         help_text="A comma-separated list of product types associated to this event",
     )
 
+    objects = FeedEarthquakeQuerySet.as_manager()
+
     class Meta:
         ordering = ("-feed_id", "-time")
         get_latest_by = ("-feed_id", "-time")
         verbose_name = "Archived earthquake"
+        indexes = (
+            # Serves the default ordering
+            models.Index(fields=["-feed", "-time"], name="anss_feedeq_feed_time_idx"),
+            # Serves exact lookups of an event, newest copy first
+            models.Index(fields=["usgs_id", "-feed"], name="anss_feedeq_usgs_id_feed_idx"),
+            # Serves the date drill-down in the admin
+            models.Index(fields=["occurred_datetime"], name="anss_feedeq_occurred_idx"),
+            # Serve the case-insensitive substring searches in the admin
+            GinIndex(
+                OpClass(Upper("title"), name="gin_trgm_ops"),
+                name="anss_feedeq_title_trgm_idx",
+            ),
+            GinIndex(
+                OpClass(Upper("ids"), name="gin_trgm_ops"),
+                name="anss_feedeq_ids_trgm_idx",
+            ),
+            # Serves filters by region
+            GinIndex(fields=["region_ids"], name="anss_feedeq_regions_idx"),
+        )
 
     def __str__(self):
         return f"{self.title}"
@@ -306,8 +485,306 @@ class FeedEarthquake(models.Model):
 
     get_updated_datetime.short_description = "updated at"
 
+    def get_changes(self):
+        """
+        Returns the revision fields that differ from the previous copy of the earthquake, as (old, new) tuples.
+
+        Only works on copies returned by FeedEarthquake.objects.revisions().
+        """
+        changes = {}
+        for field in FeedEarthquakeQuerySet.REVISION_FIELDS:
+            old, new = getattr(self, f"previous_{field}"), getattr(self, field)
+            if old != new:
+                changes[field] = (old, new)
+        return changes
+
     def is_last_hour(self):
         """
         Returns whether an earthquake happened in the last hour.
         """
         return self.get_time_datetime() >= timezone.now() - timedelta(hours=1)
+
+
+class ClusteredEarthquake(models.Model):
+    """
+    The latest time, size and location of an earthquake, and the mainshock sequence it belongs to.
+
+    Table includes one row per earthquake. Maintained by anss.clustering.
+    """
+
+    usgs_id = models.CharField(max_length=5000, unique=True, verbose_name="USGS ID")
+    time = models.BigIntegerField(db_index=True, verbose_name="occurred at (UNIX)")
+    mag = models.FloatField(null=True, verbose_name="magnitude")
+    point = models.PointField(srid=4326, verbose_name="epicenter")
+    cluster = models.CharField(
+        max_length=5000,
+        db_index=True,
+        verbose_name="sequence",
+        help_text="The USGS ID of the mainshock of the earthquake's sequence",
+    )
+    is_mainshock = models.BooleanField(
+        default=True,
+        help_text=(
+            "Whether the earthquake is the largest in its sequence. "
+            "Independent earthquakes are their own mainshock."
+        ),
+    )
+
+    class Meta:
+        ordering = ("-time",)
+        verbose_name = "Clustered earthquake"
+
+    def __str__(self):
+        return self.usgs_id
+
+
+class FirstSighting(models.Model):
+    """
+    The first time an earthquake appeared in an archived feed.
+
+    Table includes one row per earthquake. Maintained by the archive command.
+    """
+
+    usgs_id = models.CharField(max_length=5000, unique=True, verbose_name="USGS ID")
+    feed = models.ForeignKey(
+        "Feed", on_delete=models.CASCADE, verbose_name="first archived source"
+    )
+    first_seen = models.DateTimeField(
+        verbose_name="first archived at",
+        help_text="The time the first feed including the earthquake was pulled.",
+    )
+    occurred_datetime = models.DateTimeField(
+        null=True,
+        verbose_name="occurred at",
+        help_text="Time when the event occurred, as first reported.",
+    )
+    net = models.CharField(
+        max_length=5000, blank=True, verbose_name="network ID", help_text="As first reported"
+    )
+    mag = models.FloatField(null=True, verbose_name="magnitude", help_text="As first reported")
+    latency = models.DurationField(
+        null=True,
+        help_text="The time from when the event occurred until it was first archived.",
+    )
+
+    class Meta:
+        ordering = ("-first_seen",)
+        get_latest_by = "first_seen"
+        verbose_name = "First sighting"
+        indexes = (
+            # Serves reports limited to a time span
+            models.Index(fields=["occurred_datetime"], name="anss_sighting_occurred_idx"),
+        )
+
+    def __str__(self):
+        return self.usgs_id
+
+
+class FeedChange(models.Model):
+    """
+    An earthquake added, updated or dropped by an archived feed, compared with the feed of its type before it.
+
+    Table includes one row per change, in the order they were recorded. Maintained by the archive command.
+    """
+
+    NEW = "new"
+    UPDATED = "updated"
+    REMOVED = "removed"
+    CHANGE_CHOICES = (
+        (NEW, "New"),
+        (UPDATED, "Updated"),
+        (REMOVED, "Removed"),
+    )
+
+    feed = models.ForeignKey("Feed", on_delete=models.CASCADE, verbose_name="archived source")
+    usgs_id = models.CharField(max_length=5000, verbose_name="USGS ID")
+    change = models.CharField(max_length=10, choices=CHANGE_CHOICES)
+    updated = models.BigIntegerField(
+        null=True,
+        verbose_name="updated at (UNIX)",
+        help_text="The time the event was updated, as of the feed. Removed events keep their last update.",
+    )
+
+    class Meta:
+        ordering = ("id",)
+        verbose_name = "Feed change"
+
+    def __str__(self):
+        return f"{self.usgs_id} {self.change}"
+
+
+class AlertSubscription(models.Model):
+    """
+    A webhook notified of earthquakes that cross any of its thresholds.
+
+    Subscriptions without thresholds are notified of every earthquake.
+    """
+
+    ALERT_LEVELS = ("green", "yellow", "orange", "red")
+    ALERT_CHOICES = tuple((level, level.title()) for level in ALERT_LEVELS)
+
+    name = models.CharField(max_length=500, unique=True)
+    url = models.URLField(max_length=5000, verbose_name="webhook URL")
+    active = models.BooleanField(default=True)
+    min_mag = models.FloatField(null=True, blank=True, verbose_name="minimum magnitude")
+    min_sig = models.IntegerField(null=True, blank=True, verbose_name="minimum significance")
+    min_alert = models.CharField(
+        max_length=10,
+        blank=True,
+        choices=ALERT_CHOICES,
+        verbose_name="minimum PAGER alert",
+    )
+    tsunami = models.BooleanField(default=False, help_text="Notify of earthquakes with a tsunami warning.")
+    batch_size = models.PositiveIntegerField(
+        default=100, validators=[MinValueValidator(1)], help_text="The most earthquakes sent with each request."
+    )
+    created_datetime = models.DateTimeField(default=timezone.now, verbose_name="created at")
+
+    class Meta:
+        ordering = ("name",)
+        verbose_name = "Alert subscription"
+
+    def __str__(self):
+        return self.name
+
+    def get_filter(self):
+        """
+        Returns a Q object matching the earthquakes that cross any of the thresholds.
+        """
+        q = models.Q()
+        if self.min_mag is not None:
+            q |= models.Q(mag__gte=self.min_mag)
+        if self.min_sig is not None:
+            q |= models.Q(sig__gte=self.min_sig)
+        if self.min_alert:
+            start = self.ALERT_LEVELS.index(self.min_alert)
+            q |= models.Q(alert__in=self.ALERT_LEVELS[start:])
+        if self.tsunami:
+            q |= models.Q(tsunami__gt=0)
+        return q
+
+
+class AlertDelivery(models.Model):
+    """
+    An earthquake revision queued for, or sent to, an alert subscription.
+
+    Table includes one row per subscription, earthquake and updated time. Maintained by anss.alerts.
+    """
+
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (PENDING, "Pending"),
+        (SENT, "Sent"),
+        (FAILED, "Failed"),
+    )
+
+    subscription = models.ForeignKey("AlertSubscription", on_delete=models.CASCADE)
+    earthquake = models.ForeignKey(
+        "FeedEarthquake", on_delete=models.CASCADE, verbose_name="first archived copy"
+    )
+    usgs_id = models.CharField(max_length=5000, verbose_name="USGS ID")
+    updated = models.BigIntegerField(null=True, verbose_name="updated at (UNIX)")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    created_datetime = models.DateTimeField(default=timezone.now, verbose_name="queued at")
+    next_attempt_datetime = models.DateTimeField(default=timezone.now, verbose_name="next attempt at")
+    sent_datetime = models.DateTimeField(null=True, blank=True, verbose_name="sent at")
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ("-created_datetime",)
+        verbose_name = "Alert delivery"
+        verbose_name_plural = "Alert deliveries"
+        constraints = (
+            # Each revision of an earthquake is only sent once to each subscription
+            models.UniqueConstraint(
+                fields=["subscription", "usgs_id", "updated"],
+                name="anss_alert_revision_unique",
+            ),
+        )
+        indexes = (
+            # Serves the delivery worker's queue
+            models.Index(
+                fields=["next_attempt_datetime"],
+                name="anss_alert_pending_idx",
+                condition=models.Q(status="pending"),
+            ),
+        )
+
+    def __str__(self):
+        return f"{self.usgs_id} to {self.subscription}"
+
+
+class IngestWorker(models.Model):
+    """
+    A running archive worker.
+
+    Table includes one row per worker process, refreshed as it runs. Maintained by anss.leases.
+    """
+
+    name = models.CharField(max_length=500, unique=True)
+    started_datetime = models.DateTimeField(default=timezone.now, verbose_name="started at")
+    heartbeat_datetime = models.DateTimeField(default=timezone.now, verbose_name="last seen at")
+
+    class Meta:
+        ordering = ("name",)
+        verbose_name = "Ingest worker"
+
+    def __str__(self):
+        return self.name
+
+
+class IngestLease(models.Model):
+    """
+    The claim of a worker on archiving one type and timeframe of feed.
+
+    Table includes one row per feed archived by workers. Maintained by anss.leases.
+    """
+
+    type = models.CharField(max_length=500, choices=Feed.TYPE_CHOICES)
+    timeframe = models.CharField(max_length=500, choices=Feed.TIMEFRAME_CHOICES)
+    holder = models.CharField(max_length=500, blank=True, help_text="The name of the worker holding the lease.")
+    acquired_datetime = models.DateTimeField(null=True, blank=True, verbose_name="acquired at")
+    expires_datetime = models.DateTimeField(null=True, blank=True, verbose_name="expires at")
+
+    class Meta:
+        ordering = ("type", "timeframe")
+        verbose_name = "Ingest lease"
+        constraints = (models.UniqueConstraint(fields=["type", "timeframe"], name="anss_lease_slot_unique"),)
+
+    def __str__(self):
+        return f"{self.type} {self.timeframe}"
+
+
+class EventDetail(models.Model):
+    """
+    The detail GeoJSON of an earthquake, with the products pulled out of it.
+
+    Table includes one row per earthquake, refreshed when USGS updates the event. Maintained by anss.enrichment.
+    """
+
+    usgs_id = models.CharField(max_length=5000, unique=True, verbose_name="USGS ID")
+    url = models.CharField(max_length=5000, verbose_name="detail GeoJSON URL")
+    updated = models.BigIntegerField(
+        null=True,
+        verbose_name="updated at (UNIX)",
+        help_text="The time the event was updated when its detail was fetched.",
+    )
+    fetched_datetime = models.DateTimeField(verbose_name="fetched at")
+    status = models.IntegerField(null=True, verbose_name="response status")
+    content = models.FileField(blank=True, verbose_name="archived detail GeoJSON")
+
+    # The preferred product of each type, as its properties
+    moment_tensor = models.JSONField(null=True, blank=True)
+    shakemap = models.JSONField(null=True, blank=True, verbose_name="ShakeMap")
+    pager = models.JSONField(null=True, blank=True, verbose_name="PAGER")
+
+    class Meta:
+        ordering = ("-fetched_datetime",)
+        get_latest_by = "fetched_datetime"
+        verbose_name = "Event detail"
+
+    def __str__(self):
+        return self.usgs_id
@@ -0,0 +1,176 @@
+"""
+Overlaps the network, storage and database work of the archive command.
+
+Ingest runs as three stages connected by bounded queues. A fetcher thread pulls feeds from the transport,
+a storage thread decodes them and writes their files, and the calling thread saves them to the database.
+While one feed's earthquakes are inserted, the next is being written and the one after it downloaded.
+The queues hold only a few feeds, so a fast transport waits for a slow database instead of filling memory.
+
+The storage thread borrows the calling thread's database connection to check whether each feed is already
+archived before writing it, so the stages share one connection and transaction and see each other's writes.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+
+from anss import archive
+
+logger = logging.getLogger(__name__)
+
+# How many feeds can wait between each pair of stages
+QUEUE_SIZE = getattr(settings, "ANSS_PIPELINE_QUEUE_SIZE", 2)
+
+# Seconds a stage waits on a queue before checking whether the pipeline was stopped
+POLL_SECONDS = 0.1
+
+StagedFeed = namedtuple(
+    "StagedFeed",
+    ("item", "archived_datetime", "content_name", "geojson", "decode_seconds", "packed", "skipped"),
+    defaults=(None, False),
+)
+
+# Marks the end of a stage's output
+DONE = object()
+
+
+class StageError:
+    """
+    Carries an exception raised in a background stage to the calling thread.
+    """
+
+    def __init__(self, exception):
+        self.exception = exception
+
+
+class Pipeline:
+    """
+    Iterates over the feeds from a transport as StagedFeeds, decoded and saved to storage in the background.
+
+    The get_file_path callable receives a feed's archive time and content and returns where its file goes in storage.
+    Or, when a pack callable is provided, it receives the same and packs the content into a segment instead.
+    Feeds that failed to download are passed through without a file or decoded content.
+
+    The optional skip callable receives each decoded feed and returns whether it needn't be archived. Those feeds
+    are passed through as skipped, without being written to storage.
+    """
+
+    def __init__(
+        self, transport, storage, get_file_path, queue_size=QUEUE_SIZE, pack=None, skip=None, using=DEFAULT_DB_ALIAS
+    ):
+        self.transport = transport
+        self.storage = storage
+        self.get_file_path = get_file_path
+        self.pack = pack
+        self.skip = skip
+        self.connection = connections[using]
+        self.fetched = queue.Queue(maxsize=queue_size)
+        self.stored = queue.Queue(maxsize=queue_size)
+        self.stopped = threading.Event()
+        self.threads = [
+            threading.Thread(target=self.run_stage, args=(self.fetch, self.fetched), daemon=True),
+            threading.Thread(target=self.run_stage, args=(self.store, self.stored), daemon=True),
+        ]
+
+    def __iter__(self):
+        # Open the connection here, so the storage thread never races this one to do it
+        self.connection.ensure_connection()
+        self.connection.inc_thread_sharing()
+        for thread in self.threads:
+            thread.start()
+        try:
+            while (staged := self.get(self.stored)) is not DONE:
+                if isinstance(staged, StageError):
+                    raise staged.exception
+                yield staged
+        finally:
+            self.stop()
+
+    def stop(self):
+        """
+        Tells the stages to quit and waits for them.
+        """
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join()
+        self.connection.dec_thread_sharing()
+
+    def put(self, q, value):
+        """
+        Adds a value to a queue, waiting for room unless the pipeline is stopped. Returns whether it was added.
+        """
+        while not self.stopped.is_set():
+            try:
+                q.put(value, timeout=POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, q):
+        """
+        Takes the next value from a queue, waiting for one unless the pipeline is stopped.
+        """
+        while not self.stopped.is_set():
+            try:
+                return q.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                continue
+        return DONE
+
+    def run_stage(self, stage, output):
+        """
+        Runs a stage, passing any exception it raises down the pipeline, then marks the end of its output.
+        """
+        try:
+            for value in stage():
+                if not self.put(output, value):
+                    return
+        except Exception as e:
+            logger.exception("Ingest pipeline stage failed")
+            self.put(output, StageError(e))
+        self.put(output, DONE)
+
+    def fetch(self):
+        """
+        Pulls each feed from the transport.
+        """
+        for item in self.transport:
+            logger.debug(f"Fetched {item.source}")
+            yield item
+
+    def store(self):
+        """
+        Decodes each fetched feed and writes it to storage, unless it's skipped.
+        """
+        connections[self.connection.alias] = self.connection
+        while (item := self.get(self.fetched)) is not DONE:
+            if isinstance(item, StageError):
+                yield item
+                return
+            archived_datetime = item.archived_datetime or timezone.now()
+            if item.status != 200:
+                yield StagedFeed(item, archived_datetime, "", None, 0)
+                continue
+            start = time.perf_counter()
+            geojson = json.loads(item.content)
+            decode_seconds = time.perf_counter() - start
+            if self.skip is not None and self.skip(geojson):
+                logger.debug(f"Skipped {item.source}")
+                yield StagedFeed(item, archived_datetime, "", geojson, decode_seconds, skipped=True)
+                continue
+            if self.pack is not None:
+                packed = self.pack(archived_datetime, item.content)
+                logger.debug(f"Packed {item.source} into {packed.segment_name}")
+                yield StagedFeed(item, archived_datetime, "", geojson, decode_seconds, packed)
+                continue
+            path = self.get_file_path(archived_datetime, item.content)
+            name = archive.save_content(self.storage, path, item.content)
+            logger.debug(f"Stored {item.source} at {name}")
+            yield StagedFeed(item, archived_datetime, name, geojson, decode_seconds)
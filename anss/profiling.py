@@ -0,0 +1,169 @@
+"""
+A switch that profiles management commands in production without patching code.
+
+Commands that mix in ProfileMixin accept a --profile option naming a directory. Each profiled unit of work,
+like one archived feed, writes there a cProfile stats file, a tracemalloc report and sampled timings.
+
+    $ python manage.py getlatestanssfeed --profile /tmp/profiles
+    $ python -m pstats /tmp/profiles/feed-1234.prof
+"""
+import cProfile
+import json
+import logging
+import os
+import statistics
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from django.core.management.base import CommandError
+
+logger = logging.getLogger(__name__)
+
+# How many of the largest allocation sites the tracemalloc report lists
+MEMORY_REPORT_LINES = 50
+
+
+class Timings:
+    """
+    Collects durations for named stages of work, timing only one of every sample_every calls.
+    """
+
+    def __init__(self, sample_every=100):
+        self.sample_every = sample_every
+        self.calls = {}
+        self.samples = {}
+
+    def time(self, stage, func, *args, **kwargs):
+        """
+        Calls the function, timing it if this call is sampled, and returns its result.
+        """
+        calls = self.calls.get(stage, 0)
+        self.calls[stage] = calls + 1
+        if calls % self.sample_every:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.samples.setdefault(stage, []).append(time.perf_counter() - start)
+        return result
+
+    def add(self, stage, seconds, count=1):
+        """
+        Records a duration measured elsewhere, spread evenly over count items of work.
+        """
+        self.calls[stage] = self.calls.get(stage, 0) + count
+        self.samples.setdefault(stage, []).append(seconds / count)
+
+    def summarize(self):
+        """
+        Returns the calls, samples and distribution of durations for each stage as a dictionary.
+        """
+        summary = {}
+        for stage, samples in self.samples.items():
+            ordered = sorted(samples)
+            summary[stage] = {
+                "calls": self.calls[stage],
+                "samples": len(ordered),
+                "mean_seconds": statistics.fmean(ordered),
+                "median_seconds": statistics.median(ordered),
+                "p95_seconds": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                "max_seconds": ordered[-1],
+            }
+        return summary
+
+
+class ProfileMixin:
+    """
+    Adds profiling options to a management command.
+
+    Call add_profile_arguments in add_arguments and set_profile_options before doing any work.
+    Then wrap each unit of work in the profile context manager and time its steps with self.timings.
+    """
+
+    def add_profile_arguments(self, parser):
+        parser.add_argument(
+            "--profile",
+            metavar="DIRECTORY",
+            help="Profile the run and write the results to this directory.",
+        )
+        parser.add_argument(
+            "--profile-mode",
+            choices=("all", "cprofile", "tracemalloc"),
+            default="all",
+            help="Which profilers to run. Defaults to all of them.",
+        )
+        parser.add_argument(
+            "--profile-sample",
+            type=int,
+            default=100,
+            help="Time one of every this many features. Defaults to 100.",
+        )
+
+    def set_profile_options(self, **options):
+        self.profile_directory = options.get("profile")
+        self.profile_mode = options.get("profile_mode", "all")
+        self.timings = None
+        if self.profile_directory:
+            sample_every = options.get("profile_sample", 100)
+            if sample_every < 1:
+                raise CommandError("--profile-sample must be at least 1")
+            os.makedirs(self.profile_directory, exist_ok=True)
+            self.timings = Timings(sample_every=sample_every)
+
+    def get_run_profile_name(self, prefix):
+        """
+        Returns a name for the profile of a whole run, for commands that profile one unit of work per run.
+        """
+        return f"{prefix}-{time.strftime('%Y%m%dT%H%M%S')}"
+
+    @contextmanager
+    def profile(self, get_name):
+        """
+        Profiles the block, if profiling is on, and writes the results under the name returned by get_name.
+
+        The name is requested after the block finishes, so it can include ids created inside it.
+        """
+        if not self.profile_directory:
+            yield
+            return
+
+        self.timings = Timings(sample_every=self.timings.sample_every)
+        profiler = None
+        if self.profile_mode in ("all", "cprofile"):
+            profiler = cProfile.Profile()
+        trace = self.profile_mode in ("all", "tracemalloc")
+        # Leave tracing started outside the command running when it's done
+        started_tracing = trace and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        elif trace:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+            seconds = time.perf_counter() - start
+            path = os.path.join(self.profile_directory, get_name())
+            summary = {"seconds": seconds, "stages": self.timings.summarize()}
+            if profiler:
+                profiler.dump_stats(f"{path}.prof")
+            if trace:
+                summary["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+                self.write_memory_report(f"{path}-memory.txt", tracemalloc.take_snapshot())
+            if started_tracing:
+                tracemalloc.stop()
+            with open(f"{path}-timings.json", "w") as f:
+                json.dump(summary, f, indent=2)
+            logger.debug(f"Wrote profile to {path}")
+
+    def write_memory_report(self, path, snapshot):
+        """
+        Writes the allocation sites holding the most memory at the end of the run.
+        """
+        with open(path, "w") as f:
+            for stat in snapshot.statistics("lineno")[:MEMORY_REPORT_LINES]:
+                f.write(f"{stat}\n")
@@ -0,0 +1,123 @@
+"""
+Tags archived earthquakes with the regions that contain their epicenters.
+
+The boundaries of every Region are loaded once per process into an STR-tree of prepared Shapely geometries.
+Tagging a batch of earthquakes is then a single vectorized query of the tree, which narrows each epicenter
+to the regions whose bounding boxes hold it before testing it against their exact boundaries. The tree is
+only rebuilt after regions are added, changed or removed.
+
+The ids are stored in the indexed FeedEarthquake.region_ids column, so questions like how many earthquakes
+struck a county become simple filters instead of spatial joins.
+"""
+import itertools
+import logging
+import threading
+
+from django.db.models import Count, Max
+
+from anss.models import FeedEarthquake, Region
+
+try:
+    import numpy as np
+    import shapely
+except ImportError:  # pragma: no cover
+    raise ImportError(
+        "anss.regions requires Shapely. "
+        "Install it with `pip install django-anss-archive[regions]`."
+    )
+
+logger = logging.getLogger(__name__)
+
+# How many earthquakes are tagged and then saved together when retagging
+CHUNK_SIZE = 5000
+
+_lock = threading.Lock()
+_tagger = None
+
+
+class RegionTagger:
+    """
+    Finds the regions containing points with an STR-tree of prepared region boundaries.
+    """
+
+    def __init__(self, regions, version=None):
+        """
+        Accepts a list of (id, GEOSGeometry) pairs.
+        """
+        self.version = version
+        self.ids = np.array([region_id for region_id, _ in regions], dtype=np.int64)
+        geometries = np.array([shapely.from_wkb(bytes(boundary.wkb)) for _, boundary in regions])
+        # Prepared geometries answer repeated point-in-polygon tests much faster
+        shapely.prepare(geometries)
+        self.tree = shapely.STRtree(geometries)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def tag(self, coordinates):
+        """
+        Returns the sorted ids of the regions containing each (longitude, latitude) pair.
+
+        Missing coordinates get no regions.
+        """
+        tags = [[] for _ in coordinates]
+        known = [i for i, c in enumerate(coordinates) if c is not None]
+        if not known or not len(self):
+            return tags
+        points = shapely.points(np.array([coordinates[i] for i in known], dtype=np.float64))
+        # Points on a boundary belong to the regions on both sides
+        point_index, region_index = self.tree.query(points, predicate="intersects")
+        for p, r in zip(point_index, region_index):
+            tags[known[p]].append(int(self.ids[r]))
+        for t in tags:
+            t.sort()
+        return tags
+
+    def tag_earthquakes(self, earthquakes):
+        """
+        Sets region_ids on each of a list of FeedEarthquake objects, without saving them.
+        """
+        coordinates = [(e.point.x, e.point.y) if e.point else None for e in earthquakes]
+        for earthquake, region_ids in zip(earthquakes, self.tag(coordinates)):
+            earthquake.region_ids = region_ids
+
+
+def get_version():
+    """
+    Returns a value that changes whenever regions are added, changed or removed.
+    """
+    summary = Region.objects.aggregate(count=Count("id"), updated=Max("updated_datetime"))
+    return summary["count"], summary["updated"]
+
+
+def get_tagger():
+    """
+    Returns the RegionTagger for this process, rebuilding it if the regions have changed since it was loaded.
+    """
+    global _tagger
+    version = get_version()
+    with _lock:
+        if _tagger is None or _tagger.version != version:
+            regions = list(Region.objects.values_list("id", "boundary"))
+            _tagger = RegionTagger(regions, version=version)
+            logger.debug(f"Loaded {len(_tagger)} regions")
+        return _tagger
+
+
+def retag(queryset=None, chunk_size=CHUNK_SIZE):
+    """
+    Tags every earthquake in the queryset again, after regions have changed. Returns how many were updated.
+    """
+    if queryset is None:
+        queryset = FeedEarthquake.objects.all()
+    tagger = get_tagger()
+    earthquakes = queryset.only("id", "point", "region_ids").order_by().iterator(chunk_size=chunk_size)
+    updated = 0
+    while chunk := list(itertools.islice(earthquakes, chunk_size)):
+        before = [e.region_ids for e in chunk]
+        tagger.tag_earthquakes(chunk)
+        changed = [e for e, region_ids in zip(chunk, before) if e.region_ids != region_ids]
+        FeedEarthquake.objects.bulk_update(changed, ["region_ids"])
+        updated += len(changed)
+        logger.debug(f"Retagged {updated} earthquakes")
+    return updated
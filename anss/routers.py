@@ -0,0 +1,97 @@
+"""
+Sends reads of the archive to a replica database, so large scans don't slow down the archive command.
+
+Reads fall back to the primary for a while after anything in the archive is written, since a replica can
+lag behind it. Only the thread, or the async task, that wrote is pinned to the primary, so it sees its own
+writes while every other process keeps reading from the replica. Reads whose results are kept, like the
+responses stored in the cache, are made from the primary with use_primary, so a lagging replica can't
+leave stale copies behind. Enable the router by adding a replica to your databases.
+
+    DATABASES = {"default": {...}, "replica": {...}}
+    DATABASE_ROUTERS = ["anss.routers.ReplicaRouter"]
+"""
+import math
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# The database that receives writes
+PRIMARY = getattr(settings, "ANSS_PRIMARY_DATABASE", DEFAULT_DB_ALIAS)
+
+# The database that serves reads
+REPLICA = getattr(settings, "ANSS_REPLICA_DATABASE", "replica")
+
+# How long, in seconds, reads go to the primary after a write. It should exceed the replica's usual lag.
+LAG = getattr(settings, "ANSS_REPLICA_LAG", 60)
+
+# When the current thread or task may read from the replica again, on the time.monotonic() clock
+_pinned_until = ContextVar("anss_pinned_until", default=0)
+
+
+def mark_written():
+    """
+    Sends the current thread's, or async task's, reads of the archive to the primary for the next LAG seconds.
+    """
+    _pinned_until.set(time.monotonic() + LAG)
+
+
+def clear_written():
+    """
+    Lets the current thread, or async task, read from the replica again right away.
+    """
+    _pinned_until.set(0)
+
+
+def was_written_recently():
+    """
+    Returns whether the current thread, or async task, wrote to the archive in the last LAG seconds.
+    """
+    return time.monotonic() < _pinned_until.get()
+
+
+@contextmanager
+def use_primary():
+    """
+    Sends the archive's reads inside the block to the primary, whatever was written before it.
+    """
+    token = _pinned_until.set(math.inf)
+    try:
+        yield
+    finally:
+        _pinned_until.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Routes the reads of this app's models to the replica unless it may be stale.
+    """
+
+    def is_archive_model(self, model):
+        return model._meta.app_label == "anss"
+
+    def db_for_read(self, model, **hints):
+        if not self.is_archive_model(model) or REPLICA not in connections.databases:
+            return None
+        if was_written_recently():
+            return PRIMARY
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        if not self.is_archive_model(model):
+            return None
+        mark_written()
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if {obj1._state.db, obj2._state.db} <= {PRIMARY, REPLICA}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # The replica copies the archive's tables from the primary
+        if db == REPLICA and app_label == "anss":
+            return False
+        return None
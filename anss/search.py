@@ -0,0 +1,118 @@
+"""
+Finds archived earthquakes near a point.
+
+Both searches lean on the spatial index on FeedEarthquake.point. Radius searches prefilter with a
+bounding box before measuring exact distances on a sphere. Nearest-neighbor searches rank candidates
+with PostGIS's KNN operator to learn how far to look, then run a radius search that far out, so they
+stay exact across the antimeridian and near the poles. Results include only the latest copy of each
+earthquake.
+"""
+import math
+
+from django.contrib.gis.db import models
+from django.contrib.gis.db.models.functions import Distance
+from django.contrib.gis.geos import MultiPolygon, Polygon
+from django.contrib.gis.measure import D
+
+from anss.functions import KNNDistance
+from anss.models import FeedEarthquake
+
+# Kilometers in a degree of latitude
+KM_PER_DEGREE = 111.32
+
+
+def get_radius_bbox(point, km):
+    """
+    Returns a polygon, in degrees, that contains every point within the provided distance.
+
+    Boxes that cross the antimeridian are split in two.
+    """
+    lat_delta = km / KM_PER_DEGREE
+    south = max(point.y - lat_delta, -90)
+    north = min(point.y + lat_delta, 90)
+    # Longitude degrees shrink toward the poles. Use the widest latitude in the box.
+    widest = max(abs(south), abs(north))
+    if widest >= 90 or km / (KM_PER_DEGREE * math.cos(math.radians(widest))) >= 180:
+        return Polygon.from_bbox((-180, south, 180, north))
+    lng_delta = km / (KM_PER_DEGREE * math.cos(math.radians(widest)))
+    west, east = point.x - lng_delta, point.x + lng_delta
+    if west < -180:
+        return MultiPolygon(
+            Polygon.from_bbox((west + 360, south, 180, north)),
+            Polygon.from_bbox((-180, south, east, north)),
+        )
+    if east > 180:
+        return MultiPolygon(
+            Polygon.from_bbox((west, south, 180, north)),
+            Polygon.from_bbox((-180, south, east - 360, north)),
+        )
+    return Polygon.from_bbox((west, south, east, north))
+
+
+def get_latest_versions(queryset, point):
+    """
+    Returns the latest copy of each earthquake in the queryset, nearest to the point first.
+
+    Any copy in the queryset nominates an earthquake, but it's only returned if its latest copy is in the
+    queryset too, so stale revisions that matched the search are left out. Each earthquake is annotated
+    with its distance from the point.
+    """
+    candidates = queryset.values("usgs_id")
+    latest = FeedEarthquake.objects.filter(usgs_id__in=candidates).latest_versions().values("pk")
+    return (
+        queryset.filter(pk__in=models.Subquery(latest))
+        .annotate(distance=Distance("point", point))
+        .order_by("distance", "-time")
+    )
+
+
+def search_radius(point, km, since=None, limit=None):
+    """
+    Returns the earthquakes within the provided distance, in kilometers, of the point.
+
+    Only earthquakes that occurred after the optional since datetime are included.
+    """
+    bbox = get_radius_bbox(point, km)
+    bbox.srid = 4326
+    queryset = FeedEarthquake.objects.filter(point__bboverlaps=bbox).filter(
+        point__distance_lte=(point, D(km=km))
+    )
+    if since is not None:
+        queryset = queryset.filter(occurred_datetime__gte=since)
+    results = get_latest_versions(queryset, point)
+    if limit is not None:
+        results = results[:limit]
+    return results
+
+
+def search_nearest(point, k=10, since=None):
+    """
+    Returns the k earthquakes nearest to the point.
+
+    Every feed stores a copy of each earthquake, so candidates are ranked with the index and
+    deduplicated until k distinct earthquakes are found. The index ranks by planar degrees, which
+    stretch toward the poles and don't wrap across the antimeridian, so those candidates only bound
+    the search. Every earthquake nearer than the farthest of them is then found with a radius search.
+    """
+    queryset = FeedEarthquake.objects.filter(point__isnull=False)
+    if since is not None:
+        queryset = queryset.filter(occurred_datetime__gte=since)
+    ranked = queryset.order_by(
+        KNNDistance("point", models.Value(point, output_field=models.PointField(srid=4326)))
+    ).values_list("usgs_id", flat=True)
+
+    limit = k * 50
+    while True:
+        ids = list(ranked[:limit])
+        candidates = list(dict.fromkeys(ids))
+        nearest = list(get_latest_versions(queryset.filter(usgs_id__in=candidates), point)[:k])
+        if len(nearest) >= k:
+            break
+        # Fewer than k earthquakes match at all, so every one of them is returned
+        if len(ids) < limit:
+            return get_latest_versions(queryset, point)[:k]
+        limit *= 4
+
+    # Pad the radius so the farthest candidate isn't lost to rounding
+    km = nearest[-1].distance.km * (1 + 1e-9) + 0.001
+    return search_radius(point, km, since=since, limit=k)
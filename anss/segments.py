@@ -0,0 +1,92 @@
+"""
+Packs archived feeds into a few large, append-only segment files instead of one small file each.
+
+Each feed is appended to the current segment for its day as its own gzip member, and its offset and length
+are kept on the Feed, so any one feed can be read back with a single seek. A segment is closed and the next
+one started once it grows past ANSS_ARCHIVE_SEGMENT_SIZE bytes.
+
+    anss/m1/geojson/one-hour/segments/2024/01/20240131-0000.gz
+
+Segments are appended to on local disk, so writing them requires a storage with local paths, like the
+default FileSystemStorage. They are read through a memory map there, or with ranged reads from any other
+storage they have been copied to.
+"""
+import fcntl
+import gzip
+import mmap
+import os
+from collections import namedtuple
+from datetime import timezone
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+# How many bytes a segment holds before the next one is started
+SEGMENT_SIZE = getattr(settings, "ANSS_ARCHIVE_SEGMENT_SIZE", 256 * 1024 * 1024)
+
+Packed = namedtuple("Packed", ("segment_name", "offset", "length"))
+
+
+def get_segment_name(feed_type, feed_format, timeframe, archived_datetime, number):
+    """
+    Returns the name in storage of a segment holding feeds archived on the provided day.
+    """
+    utc = archived_datetime.astimezone(timezone.utc)
+    return f"anss/{feed_type}/{feed_format}/{timeframe}/segments/{utc:%Y/%m}/{utc:%Y%m%d}-{number:04d}.gz"
+
+
+def get_local_path(storage, name):
+    """
+    Returns the path on local disk of a file in the storage, or None when the storage isn't on local disk.
+    """
+    try:
+        return storage.path(name)
+    except NotImplementedError:
+        return None
+
+
+def append(storage, feed_type, feed_format, timeframe, archived_datetime, content, segment_size=SEGMENT_SIZE):
+    """
+    Compresses the content onto the end of the current segment for its day and returns where it went as Packed.
+
+    Writers to the same segment take turns with a lock on the file.
+    """
+    number = 0
+    while True:
+        name = get_segment_name(feed_type, feed_format, timeframe, archived_datetime, number)
+        path = get_local_path(storage, name)
+        if path is None:
+            raise ImproperlyConfigured("Packed archives must be written to a storage with local paths")
+        if not os.path.exists(path) or os.path.getsize(path) < segment_size:
+            break
+        number += 1
+
+    # Each feed is a complete gzip member, so it can be decompressed on its own
+    data = gzip.compress(content, mtime=0)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "ab") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            offset = f.seek(0, os.SEEK_END)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+    return Packed(name, offset, len(data))
+
+
+def read(storage, segment_name, offset, length):
+    """
+    Returns the uncompressed content of the feed packed at the offset of a segment.
+    """
+    path = get_local_path(storage, segment_name)
+    if path is None:
+        with storage.open(segment_name, "rb") as f:
+            f.seek(offset)
+            data = f.read(length)
+    else:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            end = offset + length
+            data = m[offset:end]
+    return gzip.decompress(data)
@@ -0,0 +1,54 @@
+"""
+Records when each earthquake was first archived.
+
+The first feed to include an earthquake is stored on the FirstSighting model, along with how long after
+the event it was pulled, so detection latency can be reported without scanning every copy in the archive.
+"""
+import logging
+
+from django.dispatch import receiver
+
+from anss.models import FeedEarthquake, FirstSighting
+from anss.signals import feed_archived
+
+logger = logging.getLogger(__name__)
+
+
+def record_first_sightings(feed):
+    """
+    Records the earthquakes in the provided feed that were never seen before, or only in later feeds.
+    """
+    rows = (
+        FeedEarthquake.objects.filter(feed=feed)
+        .exclude(usgs_id="")
+        .order_by()
+        .values_list("usgs_id", "occurred_datetime", "net", "mag")
+    )
+    objects = [
+        FirstSighting(
+            usgs_id=usgs_id,
+            feed=feed,
+            first_seen=feed.archived_datetime,
+            occurred_datetime=occurred_datetime,
+            net=net,
+            mag=mag,
+            latency=feed.archived_datetime - occurred_datetime if occurred_datetime else None,
+        )
+        for usgs_id, occurred_datetime, net, mag in rows
+    ]
+    if not objects:
+        return
+    # A feed archived out of order, like one replayed from a backup, can predate the stored sightings
+    FirstSighting.objects.filter(
+        usgs_id__in=[o.usgs_id for o in objects], first_seen__gt=feed.archived_datetime
+    ).delete()
+    FirstSighting.objects.bulk_create(objects, ignore_conflicts=True)
+    logger.debug(f"Recorded first sightings in {feed}")
+
+
+@receiver(feed_archived)
+def refresh(sender, feed, **kwargs):
+    """
+    Records the first sightings in a newly archived feed.
+    """
+    record_first_sightings(feed)
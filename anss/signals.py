@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+# Sent by the getlatestanssfeed command after a feed and all of its earthquakes have been saved.
+# Receivers get the archived Feed as the ``feed`` keyword argument, and ``replay``, which is True when the
+# feed was replayed from a directory or the archive rather than downloaded from the USGS.
+feed_archived = Signal()
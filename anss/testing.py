@@ -0,0 +1,218 @@
+"""
+Synthetic USGS feeds, and a local web server to serve them, for tests and benchmarks.
+
+    >>> from anss import testing
+    >>> with testing.FakeUSGSServer() as server:
+    ...     server.add("/feed.geojson", testing.make_feed(1000))
+    ...     call_command("getlatestanssfeed", url=server.get_url("/feed.geojson"))
+"""
+import json
+import random
+import shutil
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+NETWORKS = ("ak", "ci", "hv", "nc", "nn", "pr", "tx", "us", "uu", "uw")
+
+
+def make_feature(index, generated, rng):
+    """
+    Returns a GeoJSON feature shaped like an earthquake in the USGS real-time feeds.
+
+    The earthquake occurred in the hour before the generated UNIX millisecond time.
+    """
+    net = NETWORKS[index % len(NETWORKS)]
+    code = f"{90000000 + index}"
+    usgs_id = f"{net}{code}"
+    mag = round(rng.uniform(1, 6), 2)
+    longitude = round(rng.uniform(-180, 180), 4)
+    latitude = round(rng.uniform(-70, 70), 4)
+    occurred = generated - rng.randrange(60 * 60 * 1000)
+    return {
+        "type": "Feature",
+        "properties": {
+            "mag": mag,
+            "place": f"{rng.randrange(1, 100)} km N of Somewhere",
+            "time": occurred,
+            "updated": occurred + rng.randrange(60 * 1000, 10 * 60 * 1000),
+            "tz": None,
+            "url": f"https://earthquake.usgs.gov/earthquakes/eventpage/{usgs_id}",
+            "detail": f"https://earthquake.usgs.gov/earthquakes/feed/v1.0/detail/{usgs_id}.geojson",
+            "felt": None,
+            "cdi": None,
+            "mmi": None,
+            "alert": None,
+            "status": "automatic",
+            "tsunami": 0,
+            "sig": int(mag * 50),
+            "net": net,
+            "code": code,
+            "ids": f",{usgs_id},",
+            "sources": f",{net},",
+            "types": ",origin,phase-data,",
+            "nst": rng.randrange(5, 50),
+            "dmin": round(rng.uniform(0, 1), 4),
+            "rms": round(rng.uniform(0, 1), 2),
+            "gap": rng.randrange(30, 300),
+            "magType": "ml",
+            "type": "earthquake",
+            "title": f"M {mag} - {rng.randrange(1, 100)} km N of Somewhere",
+        },
+        "geometry": {
+            "type": "Point",
+            "coordinates": [longitude, latitude, round(rng.uniform(0, 100), 2)],
+        },
+        "id": usgs_id,
+    }
+
+
+def make_detail(feature):
+    """
+    Returns a detail document for a synthetic feature, with a moment tensor, ShakeMap and PAGER product.
+    """
+    properties = feature["properties"]
+    product = {"id": f"{feature['id']}-product", "updateTime": properties["updated"]}
+    return {
+        "type": "Feature",
+        "properties": {
+            **properties,
+            "products": {
+                "moment-tensor": [
+                    {**product, "properties": {"derived-magnitude": str(properties["mag"])}}
+                ],
+                "shakemap": [{**product, "properties": {"maxmmi": "4.2"}}],
+                "losspager": [{**product, "properties": {"alertlevel": "green"}}],
+            },
+        },
+        "geometry": feature["geometry"],
+        "id": feature["id"],
+    }
+
+
+def get_metadata(count, generated):
+    """
+    Returns the metadata block of a synthetic feed.
+    """
+    return {
+        "generated": generated,
+        "url": "https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/1.0_hour.geojson",
+        "title": "USGS Magnitude 1.0+ Earthquakes, Past Hour",
+        "status": 200,
+        "api": "1.10.3",
+        "count": count,
+    }
+
+
+def make_feed(count, generated=None, seed=0):
+    """
+    Returns a synthetic feed with the provided number of earthquakes as a dictionary.
+
+    The same seed always produces the same earthquakes.
+    """
+    if generated is None:
+        generated = int(time.time() * 1000)
+    rng = random.Random(seed)
+    return {
+        "type": "FeatureCollection",
+        "metadata": get_metadata(count, generated),
+        "features": [make_feature(i, generated, rng) for i in range(count)],
+        "bbox": [-180, -70, 0, 180, 70, 100],
+    }
+
+
+def write_feed(f, count, generated=None, seed=0):
+    """
+    Writes a synthetic feed to an open text file one earthquake at a time, so large feeds never sit in memory.
+    """
+    if generated is None:
+        generated = int(time.time() * 1000)
+    rng = random.Random(seed)
+    f.write('{"type": "FeatureCollection", "metadata": ')
+    f.write(json.dumps(get_metadata(count, generated)))
+    f.write(', "features": [')
+    for i in range(count):
+        if i:
+            f.write(", ")
+        f.write(json.dumps(make_feature(i, generated, rng)))
+    f.write('], "bbox": [-180, -70, 0, 180, 70, 100]}')
+
+
+class FakeUSGSServer:
+    """
+    Serves feeds from a background thread on a free local port.
+
+    Add feeds as dictionaries, bytes or paths to files. Any other path returns a 404.
+    It also stands in for webhook receivers, keeping the path and decoded body of each POST in received.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        self.received = []
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self.get_handler())
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join()
+
+    def add(self, path, content=None, file_path=None, status=200):
+        """
+        Serves the provided content, or the file at file_path, at the path.
+        """
+        if isinstance(content, dict):
+            content = json.dumps(content).encode("utf-8")
+        self.routes[path] = (status, content, file_path)
+
+    def get_url(self, path):
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}{path}"
+
+    def get_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append(self.path)
+                if self.path not in server.routes:
+                    self.send_error(404)
+                    return
+                status, content, file_path = server.routes[self.path]
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                if file_path:
+                    with open(file_path, "rb") as f:
+                        f.seek(0, 2)
+                        self.send_header("Content-Length", str(f.tell()))
+                        self.end_headers()
+                        f.seek(0)
+                        shutil.copyfileobj(f, self.wfile)
+                else:
+                    self.send_header("Content-Length", str(len(content)))
+                    self.end_headers()
+                    self.wfile.write(content)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                server.received.append((self.path, json.loads(body)))
+                status = server.routes[self.path][0] if self.path in server.routes else 404
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
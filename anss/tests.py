@@ -1,7 +1,853 @@
-from django.core.management import call_command
-from django.test import TestCase
+import io
+import json
+import os
+import random
+import tempfile
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import addModuleCleanup, mock, skipUnless
 
+import requests
+from asgiref.sync import sync_to_async
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import MultiPolygon, Point, Polygon
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from django.utils import timezone
 
+from anss import (
+    alerts,
+    analytics,
+    archive,
+    cache,
+    changes,
+    clustering,
+    enrichment,
+    leases,
+    locks,
+    parse_unix_datetime,
+    regions,
+    routers,
+    sightings,
+    testing,
+    tiles,
+    transports,
+)
+from anss.admin import cached_choices_filter
+from anss.management.commands import getlatestanssfeed
+from anss.models import (
+    AlertDelivery,
+    AlertSubscription,
+    ArchiveSegment,
+    EventDetail,
+    Feed,
+    FeedChange,
+    FeedEarthquake,
+    FirstSighting,
+    IngestLease,
+    IngestWorker,
+    Region,
+)
+from anss.pipeline import Pipeline
+from anss.transports import FeedItem
+from anss.views import LatestFeedView
+
+urlpatterns = [
+    path("admin/", admin.site.urls),
+    path("", include("anss.urls")),
+]
+
+
+def setUpModule():
+    # Archived files go to a temporary MEDIA_ROOT, so tests leave nothing behind in the working tree
+    media = tempfile.TemporaryDirectory()
+    addModuleCleanup(media.cleanup)
+    media_settings = override_settings(MEDIA_ROOT=media.name)
+    media_settings.enable()
+    addModuleCleanup(media_settings.disable)
+
+
+def create_feed(**kwargs):
+    kwargs.setdefault("archived_datetime", timezone.now())
+    return Feed.objects.create(
+        type="m1",
+        format="geojson",
+        timeframe="one-hour",
+        **kwargs,
+    )
+
+
+def measure(func):
+    """
+    Runs the function and returns how many queries it ran and the peak memory it allocated in bytes.
+    """
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return len(queries), peak
+
+
+@skipUnless(os.environ.get("ANSS_TEST_LIVE"), "Set ANSS_TEST_LIVE to test against the live USGS feed")
 class USGSTest(TestCase):
     def test_command(self):
         call_command("getlatestanssfeed")
+
+
+class SyntheticFeedTest(TestCase):
+    def test_command(self):
+        with testing.FakeUSGSServer() as server:
+            server.add("/feed.geojson", testing.make_feed(25))
+            server.add("/error.geojson", b"", status=500)
+            call_command("getlatestanssfeed", url=server.get_url("/feed.geojson"))
+            with self.assertRaises(CommandError):
+                call_command("getlatestanssfeed", url=server.get_url("/error.geojson"))
+
+        # Requests that never get a response are recorded as failures too
+        item = next(iter(transports.HTTPTransport("http://127.0.0.1:9/feed.geojson", session=requests.Session())))
+        self.assertIsNone(item.status)
+        self.assertTrue(item.error)
+
+        feed = Feed.objects.exclude(content="").get()
+        self.assertEqual(feed.count, 25)
+        self.assertEqual(feed.feedearthquake_set.count(), 25)
+        self.assertEqual(FirstSighting.objects.count(), 25)
+
+    def test_overlap(self):
+        with testing.FakeUSGSServer() as server:
+            server.add("/feed.geojson", testing.make_feed(25))
+            url = server.get_url("/feed.geojson")
+
+            # A run that finds the lock taken by another connection leaves without fetching anything
+            other = connections.create_connection(DEFAULT_DB_ALIAS)
+            try:
+                with other.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT pg_advisory_lock(%s)",
+                        [locks.get_lock_key("anss:getlatestanssfeed:m1:one-hour")],
+                    )
+                call_command("getlatestanssfeed", url=url)
+                self.assertEqual(server.requests, [])
+            finally:
+                other.close()
+
+            # Once the lock is free, a feed USGS has not regenerated is only archived once
+            call_command("getlatestanssfeed", url=url)
+            call_command("getlatestanssfeed", url=url)
+        self.assertEqual(len(server.requests), 2)
+        self.assertEqual(Feed.objects.count(), 1)
+
+    def test_crash(self):
+        with testing.FakeUSGSServer() as server:
+            server.add("/feed.geojson", testing.make_feed(25))
+            url = server.get_url("/feed.geojson")
+            # A run that dies midway leaves no feed behind, so the next one archives it
+            with mock.patch.object(changes, "record_changes", side_effect=RuntimeError):
+                with self.assertRaises(RuntimeError):
+                    call_command("getlatestanssfeed", url=url)
+            self.assertFalse(Feed.objects.exists())
+            self.assertFalse(FeedEarthquake.objects.exists())
+            call_command("getlatestanssfeed", url=url)
+        self.assertEqual(Feed.objects.get().feedearthquake_set.count(), 25)
+
+    def test_profile(self):
+        with testing.FakeUSGSServer() as server, tempfile.TemporaryDirectory() as directory:
+            server.add("/feed.geojson", testing.make_feed(25))
+            call_command(
+                "getlatestanssfeed",
+                url=server.get_url("/feed.geojson"),
+                profile=directory,
+                profile_sample=5,
+            )
+            name = f"feed-{Feed.objects.get().id}"
+            self.assertEqual(
+                sorted(os.listdir(directory)),
+                [f"{name}-memory.txt", f"{name}-timings.json", f"{name}.prof"],
+            )
+            with open(os.path.join(directory, f"{name}-timings.json")) as f:
+                stages = json.load(f)["stages"]
+        self.assertEqual(stages["parse"]["calls"], 25)
+        self.assertEqual(stages["parse"]["samples"], 5)
+
+        # Tracing started outside the command keeps running
+        tracemalloc.start()
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                call_command("buildanssclusters", profile=directory, profile_mode="tracemalloc")
+                self.assertEqual(len(os.listdir(directory)), 2)
+                with self.assertRaises(CommandError):
+                    call_command("buildanssclusters", profile=directory, profile_sample=0)
+            self.assertTrue(tracemalloc.is_tracing())
+        finally:
+            tracemalloc.stop()
+
+    def test_replay(self):
+        archived = [timezone.now() - timedelta(hours=h) for h in (2, 1)]
+        with tempfile.TemporaryDirectory() as directory:
+            for i, archived_datetime in enumerate(archived):
+                path = os.path.join(directory, f"{archived_datetime.isoformat()}.json")
+                with open(path, "w") as f:
+                    testing.write_feed(f, 10, generated=i, seed=i)
+            call_command("getlatestanssfeed", directory=directory, stdout=io.StringIO())
+
+        feeds = Feed.objects.order_by("archived_datetime")
+        self.assertEqual([f.archived_datetime for f in feeds], archived)
+
+        call_command("getlatestanssfeed", replay_archive=True, stdout=io.StringIO())
+        self.assertEqual(Feed.objects.count(), 4)
+        self.assertEqual(FeedEarthquake.objects.count(), 40)
+
+
+class PipelineTest(TestCase):
+    def test_stage_error(self):
+        def transport():
+            yield FeedItem(b"{}", timezone.now(), 200, "first")
+            raise ValueError("Connection lost")
+
+        with tempfile.TemporaryDirectory() as directory:
+            pipeline = Pipeline(
+                transport(),
+                storage=FileSystemStorage(directory),
+                get_file_path=lambda archived_datetime, content: "feed.json",
+            )
+            staged = []
+            with self.assertRaises(ValueError):
+                for s in pipeline:
+                    staged.append(s)
+        self.assertEqual([s.item.source for s in staged], ["first"])
+        self.assertFalse(any(t.is_alive() for t in pipeline.threads))
+
+    def test_skip(self):
+        now = timezone.now()
+        items = [FeedItem(b'{"metadata": {"generated": 1}}', now + timedelta(minutes=i), 200, i) for i in range(2)]
+        seen = []
+
+        def skip(geojson):
+            repeat = geojson in seen
+            seen.append(geojson)
+            return repeat
+
+        with tempfile.TemporaryDirectory() as directory:
+            pipeline = Pipeline(
+                iter(items),
+                storage=FileSystemStorage(directory),
+                get_file_path=lambda archived_datetime, content: f"{archived_datetime:%H%M}.json",
+                skip=skip,
+            )
+            staged = list(pipeline)
+            # The repeat is passed through without being written
+            self.assertEqual([s.skipped for s in staged], [False, True])
+            self.assertEqual(os.listdir(directory), [f"{now:%H%M}.json"])
+
+
+class ArchiveLayoutTest(TestCase):
+    def test_get_file_path(self):
+        archived_datetime = timezone.now()
+        path = archive.get_file_path("m1", "geojson", "one-hour", archived_datetime)
+        self.assertTrue(path.startswith(f"anss/m1/geojson/one-hour/{archived_datetime:%Y/%m/%d}/"))
+        self.assertEqual(archive.parse_file_name(path), archived_datetime)
+
+        path = archive.get_file_path("m1", "geojson", "one-hour", archived_datetime, b"{}", layout="content")
+        self.assertEqual(path, archive.get_file_path("m1", "geojson", "one-hour", None, b"{}", layout="content"))
+
+    def test_relocate(self):
+        content = b'{"type": "FeatureCollection", "features": []}'
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            # Feeds saved with the old flat layout
+            for hours in (2, 1):
+                feed = create_feed(archived_datetime=timezone.now() - timedelta(hours=hours))
+                feed.content.save(f"anss/m1/geojson/one-hour/{feed.archived_datetime}.json", ContentFile(content))
+            old_names = [f.content.name for f in Feed.objects.all()]
+
+            call_command("relocateanssarchive", stdout=io.StringIO())
+            for feed in Feed.objects.all():
+                self.assertEqual(feed.content.name, archive.get_feed_file_path(feed))
+                self.assertEqual(feed.content.read(), content)
+            self.assertFalse(any(os.path.exists(os.path.join(media, n)) for n in old_names))
+
+            # The same content is only kept once when it's addressed by its hash
+            call_command("relocateanssarchive", layout="content", stdout=io.StringIO())
+            self.assertEqual(len(set(Feed.objects.values_list("content", flat=True))), 1)
+            self.assertEqual(Feed.objects.first().content.read(), content)
+
+    def test_skip_shared_content(self):
+        feed = testing.make_feed(3, generated=1)
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            with mock.patch.object(archive, "LAYOUT", "content"), testing.FakeUSGSServer() as server:
+                server.add("/feed.geojson", feed)
+                for _ in range(2):
+                    call_command("getlatestanssfeed", url=server.get_url("/feed.geojson"))
+            # The repeat is skipped without deleting the file it shares with the archived feed
+            archived = Feed.objects.get()
+            self.assertEqual(json.loads(archived.read_content()), feed)
+
+    def test_skip_packed(self):
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            with mock.patch.object(archive, "LAYOUT", "packed"), testing.FakeUSGSServer() as server:
+                server.add("/feed.geojson", testing.make_feed(3, generated=1))
+                call_command("getlatestanssfeed", url=server.get_url("/feed.geojson"))
+                path = os.path.join(media, ArchiveSegment.objects.get().name)
+                size = os.path.getsize(path)
+                call_command("getlatestanssfeed", url=server.get_url("/feed.geojson"))
+            # The repeat isn't appended to the segment
+            self.assertEqual(os.path.getsize(path), size)
+            self.assertEqual(Feed.objects.count(), 1)
+
+    def test_pack(self):
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            for i in range(3):
+                feed = create_feed(archived_datetime=timezone.now() - timedelta(hours=3 - i))
+                content = json.dumps(testing.make_feed(5, generated=i, seed=i)).encode("utf-8")
+                feed.content.save("feed.json", ContentFile(content))
+            contents = {f.id: f.read_content() for f in Feed.objects.all()}
+
+            call_command("relocateanssarchive", layout="packed", stdout=io.StringIO())
+            self.assertEqual(ArchiveSegment.objects.count(), 1)
+            self.assertFalse(Feed.objects.exclude(content="").exists())
+            for feed in Feed.objects.select_related("segment"):
+                self.assertEqual(feed.read_content(), contents[feed.id])
+
+            # Packed feeds are read through the same index by the views and replays
+            latest = Feed.objects.latest()
+            self.assertEqual(LatestFeedView().read_feed(latest), json.loads(contents[latest.id]))
+            call_command("getlatestanssfeed", replay_archive=True, stdout=io.StringIO())
+            self.assertEqual(FeedEarthquake.objects.count(), 15)
+
+
+class CacheTest(TestCase):
+    def setUp(self):
+        cache.get_cache().clear()
+        self.feed = create_feed()
+        self.feed.content.save(
+            "test.json", ContentFile(b'{"type": "FeatureCollection", "features": []}')
+        )
+
+    async def test_warmed_view(self):
+        await sync_to_async(cache.refresh)(sender=None, feed=self.feed)
+        request = RequestFactory().get("/feed/latest.json")
+        with self.assertNumQueries(0):
+            response = await LatestFeedView.as_view()(request)
+        self.assertEqual(json.loads(response.content)["features"], [])
+
+
+class FeedLagTest(TestCase):
+    def test_with_lag(self):
+        feed = create_feed(generated=int(timezone.now().timestamp() * 1000) - 90000)
+        annotated = Feed.objects.with_lag().get(id=feed.id)
+        self.assertEqual(annotated.generated_datetime, feed.get_generated_datetime())
+        self.assertEqual(annotated.lag, feed.get_lag())
+        self.assertTrue(Feed.objects.with_lag().filter(lag__gt=timedelta(minutes=1)).exists())
+
+
+class FilterChoicesTest(TestCase):
+    def test_update_filter_choices(self):
+        cache.get_cache().clear()
+        FeedEarthquake.objects.create(feed=create_feed(), net="ci")
+        self.assertEqual(cache.get_filter_choices("net"), ["ci"])
+
+        feed = create_feed()
+        FeedEarthquake.objects.create(feed=feed, net="ak")
+        with self.assertNumQueries(1):
+            cache.update_filter_choices(feed)
+        with self.assertNumQueries(0):
+            self.assertEqual(cache.get_filter_choices("net"), ["ak", "ci"])
+
+        # Nulls are kept as a choice of their own, last
+        FeedEarthquake.objects.create(feed=feed, net="nc", tsunami=None)
+        FeedEarthquake.objects.create(feed=feed, net="nc", tsunami=1)
+        self.assertEqual(cache.get_filter_choices("tsunami"), [1, None])
+        model_admin = admin.site._registry[FeedEarthquake]
+        tsunami_filter = cached_choices_filter("tsunami")(None, {"tsunami": "__null__"}, FeedEarthquake, model_admin)
+        self.assertIn(("__null__", model_admin.get_empty_value_display()), tsunami_filter.lookups(None, model_admin))
+        self.assertEqual(tsunami_filter.queryset(None, FeedEarthquake.objects.filter(net="nc")).count(), 1)
+
+
+@override_settings(ROOT_URLCONF="anss.tests")
+class OccurredFilterTest(TestCase):
+    def test_invalid_dates(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "test"))
+        url = "/admin/anss/feedearthquake/"
+        self.assertEqual(self.client.get(url, {"occurred": "2023-11"}).status_code, 200)
+        # The admin sends bad lookups back to the unfiltered list instead of failing
+        for value in ("9999", "north", "2023-13", "2023-02-30"):
+            response = self.client.get(url, {"occurred": value})
+            self.assertRedirects(response, f"{url}?e=1", fetch_redirect_response=False)
+
+
+class AnalyticsTest(TestCase):
+    def test_load_catalog(self):
+        for mag in (4.1, 4.4):
+            FeedEarthquake.objects.create(
+                feed=create_feed(),
+                usgs_id="ci1",
+                mag=mag,
+                depth=10,
+                time=1700000000000,
+                occurred_datetime=parse_unix_datetime(1700000000000),
+                point=Point(-118.2, 34.1),
+            )
+        catalog = analytics.load_catalog(chunk_size=1)
+        self.assertEqual(len(catalog), 1)
+        self.assertEqual(catalog.mag[0], 4.4)
+        self.assertEqual(catalog.longitude[0], -118.2)
+        self.assertEqual(len(catalog.within(bbox=(-117, 33, -116, 35))), 0)
+
+        # An earthquake whose latest revision moved out of the region is left out
+        FeedEarthquake.objects.filter(mag=4.4).update(point=Point(-116.5, 34.1))
+        self.assertEqual(len(analytics.load_catalog(bbox=(-119, 33, -118, 35))), 0)
+        self.assertEqual(len(analytics.load_catalog(bbox=(-117, 33, -116, 35))), 1)
+
+
+class RevisionTest(TestCase):
+    def test_revisions(self):
+        for mag in (4.0, 4.0, 4.7):
+            FeedEarthquake.objects.create(
+                feed=create_feed(), usgs_id="ci1", mag=mag, status="automatic"
+            )
+        revisions = list(FeedEarthquake.objects.revisions())
+        self.assertEqual(len(revisions), 2)
+        self.assertEqual(revisions[1].get_changes(), {"mag": (4.0, 4.7)})
+        self.assertEqual(FeedEarthquake.objects.magnitude_revisions().count(), 1)
+
+
+class ClusteringTest(TestCase):
+    def test_decluster(self):
+        day = 24 * 60 * 60 * 1000
+        labels = clustering.decluster(
+            time=[0, day, 2 * day, 3 * day, 900 * day],
+            mag=[6.0, 4.0, 4.5, 3.0, 3.0],
+            longitude=[-118.0, -118.1, -110.0, -118.05, -118.0],
+            latitude=[34.0, 34.1, 34.0, 34.0, 34.0],
+        )
+        # The two nearby aftershocks join the mainshock. The distant and the late quakes stand alone.
+        self.assertEqual(list(labels), [0, 0, 2, 0, 4])
+
+        # Settled mainshocks claim later quakes, but aren't claimed by larger ones
+        labels = clustering.decluster(
+            time=[0, day],
+            mag=[4.0, 6.0],
+            longitude=[-118.0, -118.1],
+            latitude=[34.0, 34.1],
+            foreshock_fraction=1.0,
+            locked=[True, False],
+        )
+        self.assertEqual(list(labels), [0, 1])
+
+        # Only large quakes are old enough to matter to an update, besides the most recent ones
+        reach = clustering.get_reach_filter(900 * day)
+        self.assertIn(("time__gte", 899 * day), reach.children)
+
+
+class FirstSightingTest(TestCase):
+    def test_record_first_sightings(self):
+        occurred = timezone.now() - timedelta(minutes=30)
+        feeds = []
+        for minutes in (20, 10):
+            feed = create_feed()
+            feed.archived_datetime = occurred + timedelta(minutes=minutes)
+            feed.save()
+            FeedEarthquake.objects.create(
+                feed=feed, usgs_id="ci1", net="ci", mag=3.2, occurred_datetime=occurred
+            )
+            sightings.record_first_sightings(feed)
+            feeds.append(feed)
+
+        # The second feed was archived first, so it replaces the sighting recorded from the first
+        sighting = FirstSighting.objects.get()
+        self.assertEqual(sighting.feed, feeds[1])
+        self.assertEqual(sighting.latency, timedelta(minutes=10))
+
+        report = analytics.latency_by_network(analytics.load_latencies())
+        self.assertEqual(list(report.groups), ["ci"])
+        self.assertEqual(report.percentiles[0][0], 600)
+
+
+@override_settings(ROOT_URLCONF="anss.urls")
+class FeedChangeTest(TestCase):
+    def test_changes(self):
+        first = testing.make_feed(3, generated=1)
+        second = testing.make_feed(3, generated=2)
+        second["features"] = first["features"][1:] + [testing.make_feature(5, 2, random.Random(0))]
+        second["features"][0] = {
+            **second["features"][0],
+            "properties": {**second["features"][0]["properties"], "updated": 99},
+        }
+        with testing.FakeUSGSServer() as server:
+            server.add("/first.geojson", first)
+            server.add("/second.geojson", second)
+            call_command("getlatestanssfeed", url=server.get_url("/first.geojson"))
+            call_command("getlatestanssfeed", url=server.get_url("/second.geojson"))
+
+        recorded = self.client.get("/changes.json").json()["changes"]
+        self.assertEqual([c["change"] for c in recorded], ["new"] * 3 + ["updated", "new", "removed"])
+
+        # Consumers pick up where they left off
+        cursor = FeedChange.objects.filter(feed__generated=1).last().id
+        data = self.client.get("/changes.json", {"after": cursor, "limit": 2}).json()
+        self.assertEqual(
+            [(c["usgs_id"], c["change"]) for c in data["changes"]],
+            [(second["features"][0]["id"], "updated"), (second["features"][2]["id"], "new")],
+        )
+        self.assertEqual(data["changes"][0]["updated"], 99)
+        data = self.client.get("/changes.json", {"after": data["cursor"]}).json()
+        self.assertEqual(
+            [(c["usgs_id"], c["change"]) for c in data["changes"]],
+            [(first["features"][0]["id"], "removed")],
+        )
+        self.assertEqual(self.client.get("/changes.json", {"limit": 0}).status_code, 400)
+
+        # Each change says which feed it came from, and consumers can ask for a single kind
+        self.assertEqual({(c["type"], c["timeframe"]) for c in recorded}, {("m1", "one-hour")})
+        self.assertEqual(len(self.client.get("/changes.json", {"type": "m1"}).json()["changes"]), 6)
+        self.assertEqual(self.client.get("/changes.json", {"type": "m4.5"}).json()["changes"], [])
+        self.assertEqual(self.client.get("/changes.json", {"timeframe": "decade"}).status_code, 400)
+
+        # Ids stay in commit order because the lock taken to record them is held until the transaction ends
+        other = connections.create_connection(DEFAULT_DB_ALIAS)
+        try:
+            with other.cursor() as cursor:
+                cursor.execute("SELECT pg_try_advisory_xact_lock(%s)", [locks.get_lock_key(changes.LOCK_NAME)])
+                self.assertFalse(cursor.fetchone()[0])
+        finally:
+            other.close()
+
+
+class AlertTest(TestCase):
+    def test_deliver(self):
+        with testing.FakeUSGSServer() as server:
+            server.add("/feed.geojson", testing.make_feed(10))
+            server.add("/big", status=200)
+            server.add("/down", status=503)
+            big = AlertSubscription.objects.create(name="big", url=server.get_url("/big"), min_mag=3, batch_size=2)
+            down = AlertSubscription.objects.create(name="down", url=server.get_url("/down"), min_sig=0)
+
+            # Ingest only queues the alerts
+            call_command("getlatestanssfeed", url=server.get_url("/feed.geojson"))
+            self.assertEqual(server.received, [])
+            expected = FeedEarthquake.objects.filter(mag__gte=3).count()
+            self.assertEqual(big.alertdelivery_set.count(), expected)
+            self.assertEqual(down.alertdelivery_set.count(), 10)
+
+            # Each revision is only queued once
+            feed = Feed.objects.get()
+            FeedEarthquake.objects.create(feed=feed, usgs_id="xx1", mag=5, sig=500)
+            alerts.enqueue(feed)
+            alerts.enqueue(feed)
+            self.assertEqual(AlertDelivery.objects.count(), expected + 10)
+
+            call_command("deliveranssalerts", concurrency=2)
+
+        sent = [body for path, body in server.received if path == "/big"]
+        self.assertEqual(len(sent), -(-expected // 2))
+        self.assertEqual(sum(len(body["earthquakes"]) for body in sent), expected)
+        self.assertTrue(all(d.status == AlertDelivery.SENT for d in big.alertdelivery_set.all()))
+
+        # Failures wait to be retried
+        failed = down.alertdelivery_set.first()
+        self.assertEqual((failed.status, failed.attempts), (AlertDelivery.PENDING, 1))
+        self.assertGreater(failed.next_attempt_datetime, timezone.now())
+
+    def test_replay(self):
+        AlertSubscription.objects.create(name="all", url="http://localhost/")
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "feed.json"), "w") as f:
+                json.dump(testing.make_feed(5), f)
+            call_command("getlatestanssfeed", directory=directory, stdout=io.StringIO())
+        # Replayed earthquakes are history, not news
+        self.assertEqual(FeedEarthquake.objects.count(), 5)
+        self.assertFalse(AlertDelivery.objects.exists())
+
+
+class LeaseTest(TestCase):
+    def test_balance(self):
+        slots = [("m1", "one-hour"), ("m1", "one-day"), ("m2.5", "one-hour"), ("m2.5", "one-day")]
+        self.assertEqual(len(leases.balance("a", slots)), 4)
+
+        # A new worker waits until the first gives up its extra leases
+        self.assertEqual(leases.balance("b", slots), [])
+        self.assertEqual(len(leases.balance("a", slots)), 2)
+        self.assertEqual(len(leases.balance("b", slots)), 2)
+        self.assertFalse(leases.claim("c", slots[0]))
+
+        # When a worker dies, the others take over its leases once they expire
+        past = timezone.now() - timedelta(seconds=leases.LEASE_SECONDS + 1)
+        IngestLease.objects.filter(holder="a").update(expires_datetime=past)
+        IngestWorker.objects.filter(name="a").update(heartbeat_datetime=past)
+        self.assertCountEqual(leases.balance("b", slots), slots)
+        self.assertEqual(set(IngestLease.objects.values_list("holder", flat=True)), {"b"})
+
+        leases.leave("b", slots)
+        self.assertEqual(set(IngestLease.objects.values_list("holder", flat=True)), {""})
+
+
+class RegionTest(TestCase):
+    def test_retag(self):
+        feed = create_feed()
+        inside = FeedEarthquake.objects.create(feed=feed, usgs_id="ci1", point=Point(-118.3, 34.1, srid=4326))
+        FeedEarthquake.objects.create(feed=feed, usgs_id="ak1", point=Point(-150, 61, srid=4326))
+        FeedEarthquake.objects.create(feed=feed, usgs_id="xx1")
+        square = Polygon.from_bbox((-119, 33, -118, 35))
+        region = Region.objects.create(name="Los Angeles", kind="county", boundary=MultiPolygon(square, srid=4326))
+
+        self.assertEqual(regions.retag(), 1)
+        self.assertEqual(list(FeedEarthquake.objects.in_region(region)), [inside])
+        # Nothing changed, so nothing is saved
+        self.assertEqual(regions.retag(), 0)
+
+    def test_tag_at_ingest(self):
+        world, _ = (
+            Region.objects.create(name=name, boundary=MultiPolygon(Polygon.from_bbox(bbox), srid=4326))
+            for name, bbox in (("World", (-180, -90, 180, 90)), ("Nowhere", (0, 0, 0.001, 0.001)))
+        )
+        with mock.patch.object(getlatestanssfeed, "TAG_REGIONS", True), testing.FakeUSGSServer() as server:
+            server.add("/feed.geojson", testing.make_feed(5))
+            call_command("getlatestanssfeed", url=server.get_url("/feed.geojson"))
+        self.assertEqual(FeedEarthquake.objects.count(), 5)
+        self.assertEqual(FeedEarthquake.objects.in_region(world).count(), 5)
+        self.assertEqual({tuple(e.region_ids) for e in FeedEarthquake.objects.all()}, {(world.id,)})
+
+
+class EnrichmentTest(TestCase):
+    def test_enrich(self):
+        features = testing.make_feed(3)["features"]
+        with testing.FakeUSGSServer() as server, tempfile.TemporaryDirectory() as media:
+            with override_settings(MEDIA_ROOT=media):
+                for feature in features:
+                    server.add(f"/{feature['id']}.geojson", testing.make_detail(feature))
+                    FeedEarthquake.objects.create(
+                        feed=create_feed(),
+                        usgs_id=feature["id"],
+                        updated=feature["properties"]["updated"],
+                        detail=server.get_url(f"/{feature['id']}.geojson"),
+                    )
+                # Failed and unreadable documents are left pending, without stopping the others
+                for usgs_id, status, content in (("xx1", 429, b""), ("xx2", 200, b"<html>")):
+                    server.add(f"/{usgs_id}.geojson", content, status=status)
+                    FeedEarthquake.objects.create(
+                        feed=create_feed(), usgs_id=usgs_id, updated=1, detail=server.get_url(f"/{usgs_id}.geojson")
+                    )
+                self.assertEqual(enrichment.enrich(workers=2), 3)
+                self.assertEqual(len(server.requests), 5)
+                self.assertEqual(enrichment.get_pending().count(), 2)
+                FeedEarthquake.objects.filter(usgs_id__startswith="xx").delete()
+
+                # Nothing is fetched again until USGS updates an earthquake
+                self.assertEqual(enrichment.enrich(workers=2), 0)
+                earthquake = FeedEarthquake.objects.get(usgs_id=features[0]["id"])
+                earthquake.pk = None
+                earthquake.feed = create_feed()
+                earthquake.updated += 1
+                earthquake.save()
+                self.assertEqual(enrichment.enrich(workers=2), 1)
+                self.assertEqual(len(server.requests), 6)
+
+        detail = EventDetail.objects.get(usgs_id=features[0]["id"])
+        self.assertEqual(detail.updated, earthquake.updated)
+        self.assertEqual(detail.pager, {"alertlevel": "green"})
+
+
+@override_settings(DATABASE_ROUTERS=["anss.routers.ReplicaRouter"])
+class ReplicaRouterTest(TestCase):
+    databases = {"default", "replica"}
+
+    def test_routing(self):
+        routers.clear_written()
+        self.assertEqual(Feed.objects.all().db, "replica")
+
+        # Writes go to the primary, and reads follow them there until the replica catches up
+        feed = create_feed()
+        self.assertEqual(feed._state.db, "default")
+        self.assertEqual(Feed.objects.get(), feed)
+
+        # Other threads keep reading from the replica, which is a separate database here and never sees the write
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            self.assertEqual(pool.submit(lambda: Feed.objects.all().db).result(), "replica")
+        routers.clear_written()
+        self.assertFalse(Feed.objects.exists())
+
+        # Anything kept in the cache is read from the primary, even by processes that never wrote
+        cache.get_cache().clear()
+        feed.content.name = "feed.json"
+        feed.save()
+        routers.clear_written()
+        self.assertEqual(cache.get_latest_feed_id(), feed.id)
+        self.assertEqual(cache.get_or_render("test", lambda feed_id: Feed.objects.get(id=feed_id).id), feed.id)
+        with routers.use_primary():
+            self.assertEqual(Feed.objects.all().db, "default")
+        self.assertEqual(Feed.objects.all().db, "replica")
+
+        router = routers.ReplicaRouter()
+        self.assertFalse(router.allow_migrate("replica", "anss"))
+        self.assertIsNone(router.allow_migrate("replica", "auth"))
+
+
+@override_settings(ROOT_URLCONF="anss.urls")
+class SearchTest(TestCase):
+    def test_nearby(self):
+        for feed in (create_feed(), create_feed()):
+            FeedEarthquake.objects.create(
+                feed=feed, usgs_id="ci1", point=Point(-118.3, 34.1, srid=4326)
+            )
+        FeedEarthquake.objects.create(
+            feed=create_feed(), usgs_id="ak1", point=Point(-150, 61, srid=4326)
+        )
+        params = {"lat": 34.05, "lng": -118.25}
+
+        response = self.client.get("/quakes/nearby.json", {**params, "km": 50})
+        features = json.loads(response.content)["features"]
+        self.assertEqual([f["id"] for f in features], ["ci1"])
+
+        response = self.client.get("/quakes/nearby.json", {**params, "k": 2})
+        features = json.loads(response.content)["features"]
+        self.assertEqual([f["id"] for f in features], ["ci1", "ak1"])
+
+        for bad in ({"lat": "north"}, {"lat": "nan", "lng": 0}, {**params, "km": "nan"}, {**params, "days": "inf"}):
+            self.assertEqual(self.client.get("/quakes/nearby.json", bad).status_code, 400)
+
+        # Neighbors are found across the antimeridian, and by distance on the sphere near the poles
+        feed = create_feed()
+        for usgs_id, lng, lat in (("us1", 179.9, -17), ("us2", -179.9, -17), ("us3", 170, -17), ("us4", 30, 80)):
+            FeedEarthquake.objects.create(feed=feed, usgs_id=usgs_id, point=Point(lng, lat, srid=4326))
+        FeedEarthquake.objects.create(feed=feed, usgs_id="us5", point=Point(0, 74, srid=4326))
+        response = self.client.get("/quakes/nearby.json", {"lat": -17, "lng": 179.95, "k": 2})
+        self.assertEqual({f["id"] for f in json.loads(response.content)["features"]}, {"us1", "us2"})
+        response = self.client.get("/quakes/nearby.json", {"lat": 80, "lng": 0, "k": 1})
+        self.assertEqual([f["id"] for f in json.loads(response.content)["features"]], ["us4"])
+
+        # An earthquake whose latest revision moved away no longer matches through its old copies
+        FeedEarthquake.objects.create(feed=create_feed(), usgs_id="ci1", point=Point(-150, 60, srid=4326))
+        response = self.client.get("/quakes/nearby.json", {**params, "km": 50})
+        self.assertEqual(json.loads(response.content)["features"], [])
+
+
+@override_settings(ROOT_URLCONF="anss.urls")
+class TileTest(TestCase):
+    def setUp(self):
+        cache.get_cache().clear()
+
+    def test_tiles(self):
+        feed = create_feed()
+        FeedEarthquake.objects.create(feed=feed, usgs_id="ci1", mag=5.1, point=Point(-118.3, 34.1, srid=4326))
+        FeedEarthquake.objects.create(feed=feed, usgs_id="ci2", mag=1.2, point=Point(-118.2, 34.0, srid=4326))
+        response = self.client.get("/tiles/0/0/0.mvt")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], tiles.CONTENT_TYPE)
+        self.assertEqual(self.client.get("/tiles/1/2/0.mvt").status_code, 404)
+
+        # Only the quake big enough to be drawn at the lowest zoom touches its tile
+        backend = cache.get_cache()
+        self.assertIsNotNone(backend.get(tiles.get_tile_key(0, 0, 0)))
+        backend.set(tiles.get_tile_key(1, 1, 0), b"untouched")
+        FeedChange.objects.create(feed=feed, usgs_id="ci2", change=FeedChange.NEW)
+        tiles.invalidate(feed)
+        self.assertIsNotNone(backend.get(tiles.get_tile_key(0, 0, 0)))
+
+        FeedChange.objects.create(feed=feed, usgs_id="ci1", change=FeedChange.UPDATED)
+        tiles.invalidate(feed)
+        self.assertIsNone(backend.get(tiles.get_tile_key(0, 0, 0)))
+        self.assertEqual(backend.get(tiles.get_tile_key(1, 1, 0)), b"untouched")
+
+    def test_get_tiles(self):
+        # Los Angeles is in the northwest quarter of the map, away from the edges of its tiles
+        self.assertEqual(tiles.get_tiles(-118.25, 34.05, 1), {(0, 0)})
+        self.assertEqual(tiles.get_tiles(0, 0, 1), {(0, 0), (0, 1), (1, 0), (1, 1)})
+        west, south, east, north = tiles.get_tile_bounds(1, 0, 0)
+        self.assertEqual((west, south, east, north), (-180, 0, 0, 90))
+
+
+@override_settings(ROOT_URLCONF="anss.tests")
+class ScalingTest(TestCase):
+    """
+    Guards against per-row queries and runaway memory use as the archive grows.
+    """
+
+    sizes = (10, 100, 1000)
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "test"))
+
+    def assertScales(self, measurements, max_queries, max_bytes_per_item=None, linear=True):
+        """
+        Asserts the (queries, peak memory) measurements taken at each size stay within bounds.
+
+        Query counts may not grow with the size. Peak memory may grow no faster than the size
+        when linear is true, and not at all otherwise.
+        """
+        queries = [q for q, peak in measurements]
+        peaks = [peak for q, peak in measurements]
+        self.assertLessEqual(queries[-1], max_queries, f"Queries at {self.sizes}: {queries}")
+        self.assertLessEqual(queries[-1], queries[0], f"Queries at {self.sizes}: {queries}")
+
+        # Leave room for noise, so only growth beyond the bound fails
+        growth = self.sizes[-1] / self.sizes[-2] if linear else 1
+        self.assertLessEqual(peaks[-1], peaks[-2] * growth * 1.5, f"Peak bytes at {self.sizes}: {peaks}")
+        if max_bytes_per_item is not None:
+            self.assertLessEqual(peaks[-1] / self.sizes[-1], max_bytes_per_item)
+
+    def get(self, url):
+        # Measure rendering rather than the cache
+        cache.get_cache().clear()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_ingest(self):
+        measurements = []
+        with testing.FakeUSGSServer() as server:
+            for size in self.sizes:
+                server.add(f"/{size}.geojson", testing.make_feed(size, generated=size, seed=size))
+                url = server.get_url(f"/{size}.geojson")
+                cache.get_cache().clear()
+                measurements.append(measure(lambda: call_command("getlatestanssfeed", url=url)))
+        self.assertScales(measurements, max_queries=25, max_bytes_per_item=64 * 1024)
+
+    def test_latest_feed_view(self):
+        measurements = []
+        for size in self.sizes:
+            feed = create_feed()
+            feed.content.save("test.json", ContentFile(json.dumps(testing.make_feed(size))))
+            measurements.append(measure(lambda: self.get("/feed/latest.json")))
+        self.assertScales(measurements, max_queries=5, max_bytes_per_item=64 * 1024)
+
+    def test_feed_list_view(self):
+        measurements = []
+        for size in self.sizes:
+            while Feed.objects.count() < size:
+                create_feed()
+            measurements.append(measure(lambda: self.get("/feed/list.json")))
+        # The list is limited to the latest 100 feeds
+        self.assertScales(measurements, max_queries=5, linear=False)
+
+    def test_admin_changelists(self):
+        feed = create_feed(generated=int(timezone.now().timestamp() * 1000))
+        for url in ("/admin/anss/feedearthquake/", "/admin/anss/feed/"):
+            measurements = []
+            for size in self.sizes:
+                FeedEarthquake.objects.bulk_create(
+                    [
+                        FeedEarthquake(
+                            feed=feed,
+                            usgs_id=f"ci{i}",
+                            net="ci",
+                            time=1700000000000 + i,
+                            occurred_datetime=parse_unix_datetime(1700000000000 + i),
+                            point=Point(-118, 34),
+                        )
+                        for i in range(FeedEarthquake.objects.count(), size)
+                    ]
+                )
+                while Feed.objects.count() < size:
+                    create_feed()
+                measurements.append(measure(lambda: self.get(url)))
+            # Changelists show one page of 100 rows
+            with self.subTest(url=url):
+                self.assertScales(measurements, max_queries=20, linear=False)
@@ -0,0 +1,198 @@
+"""
+Renders archived earthquakes as Mapbox vector tiles.
+
+Each tile holds the latest copy of the earthquakes inside it, found with the spatial index on
+FeedEarthquake.point and encoded by PostGIS with ST_AsMVT. Zoomed-out tiles cover much of the world,
+so they only include earthquakes above a minimum magnitude.
+
+Rendered tiles are cached until an ingest touches them. After each feed is archived, only the tiles
+holding the new and updated earthquakes, at their old and new epicenters, are dropped from the cache.
+"""
+import logging
+import math
+
+from django.conf import settings
+from django.contrib.gis.db.models.functions import Transform
+from django.contrib.gis.geos import Polygon
+from django.db import connections, models
+from django.dispatch import receiver
+
+from anss import cache, routers
+from anss.functions import MVTGeom, TileEnvelope
+from anss.models import FeedChange, FeedEarthquake
+from anss.signals import feed_archived
+
+logger = logging.getLogger(__name__)
+
+# The most zoomed-in tile served
+MAX_ZOOM = getattr(settings, "ANSS_TILE_MAX_ZOOM", 14)
+
+# Pairs of (zoom, magnitude). Tiles below each zoom only include earthquakes of at least that magnitude.
+MIN_MAGS = getattr(settings, "ANSS_TILE_MIN_MAGS", ((3, 4.5), (5, 3.0), (7, 2.0)))
+
+# The size of each tile in its own coordinates, and the margin around it, so symbols aren't cut off at edges
+EXTENT = 4096
+BUFFER = 64
+
+LAYER_NAME = "earthquakes"
+CONTENT_TYPE = "application/vnd.mapbox-vector-tile"
+
+# The attributes included with each earthquake
+FIELDS = ("usgs_id", "mag", "time", "updated", "depth", "place", "title", "alert", "tsunami", "sig", "url")
+
+# Web Mercator can't reach the poles
+MAX_LATITUDE = 85.0511287798
+
+
+def is_valid(z, x, y):
+    """
+    Returns whether the tile exists.
+    """
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2**z and 0 <= y < 2**z
+
+
+def get_min_mag(z):
+    """
+    Returns the smallest magnitude included in tiles at the zoom, or None if every earthquake is.
+    """
+    for zoom, mag in sorted(MIN_MAGS):
+        if z < zoom:
+            return mag
+    return None
+
+
+def get_tile_position(lng, lat, z):
+    """
+    Returns the x and y of the point in the grid of tiles at the zoom, with the fraction across the tile.
+    """
+    lat = max(min(lat, MAX_LATITUDE), -MAX_LATITUDE)
+    n = 2**z
+    x = (lng + 180) / 360 * n
+    y = (1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n
+    return x, y
+
+
+def get_tile_bounds(z, x, y, buffer=0):
+    """
+    Returns the tile's (west, south, east, north) bounds in degrees, grown by the buffer in tile coordinates.
+    """
+    n = 2**z
+    margin = buffer / EXTENT
+
+    def get_lng(tx):
+        return tx / n * 360 - 180
+
+    def get_lat(ty):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+
+    # Tiles at the top and bottom of the map reach on to the poles
+    north = 90 if y == 0 else get_lat(y - margin)
+    south = -90 if y == n - 1 else get_lat(y + 1 + margin)
+    return get_lng(x - margin), south, get_lng(x + 1 + margin), north
+
+
+def get_tiles(lng, lat, z):
+    """
+    Returns the (x, y) of every tile at the zoom that draws the point, counting their buffers.
+    """
+    x, y = get_tile_position(lng, lat, z)
+    margin = BUFFER / EXTENT
+    n = 2**z
+    xs = {math.floor(x - margin), math.floor(x), math.floor(x + margin)}
+    ys = {math.floor(y - margin), math.floor(y), math.floor(y + margin)}
+    # Points at the edges of the map have no neighbors past them
+    return {(tx, ty) for tx in xs for ty in ys if 0 <= tx < n and 0 <= ty < n}
+
+
+def get_tile_key(z, x, y):
+    """
+    Returns the key where the tile is stored.
+    """
+    return f"anss:tile:{z}:{x}:{y}"
+
+
+def get_queryset(z, x, y):
+    """
+    Returns the latest copy of each earthquake drawn in the tile.
+    """
+    bbox = Polygon.from_bbox(get_tile_bounds(z, x, y, buffer=BUFFER))
+    bbox.srid = 4326
+    queryset = FeedEarthquake.objects.filter(point__bboverlaps=bbox)
+    min_mag = get_min_mag(z)
+    if min_mag is not None:
+        queryset = queryset.filter(mag__gte=min_mag)
+    # Any copy inside the tile nominates an earthquake. Its latest copy must still be inside to be drawn.
+    candidates = queryset.values("usgs_id")
+    latest = FeedEarthquake.objects.filter(usgs_id__in=candidates).latest_versions().values("pk")
+    return queryset.filter(pk__in=models.Subquery(latest)).order_by()
+
+
+def render_tile(z, x, y):
+    """
+    Returns the encoded tile.
+    """
+    geom = MVTGeom(Transform("point", 3857), TileEnvelope(z, x, y), EXTENT, BUFFER)
+    queryset = get_queryset(z, x, y).values(*FIELDS, geom=geom)
+    sql, params = queryset.query.get_compiler(using=queryset.db).as_sql()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f"SELECT ST_AsMVT(tile, %s, %s, 'geom') FROM ({sql}) AS tile", (LAYER_NAME, EXTENT, *params))
+        content = cursor.fetchone()[0]
+    return bytes(content) if content is not None else b""
+
+
+def get_or_render(z, x, y):
+    """
+    Returns the encoded tile, rendering it on a cache miss.
+    """
+    backend = cache.get_cache()
+    key = get_tile_key(z, x, y)
+    content = backend.get(key)
+    if content is None:
+        # Cached tiles are kept until an ingest touches them, so they're rendered from the primary
+        with routers.use_primary():
+            content = render_tile(z, x, y)
+        backend.set(key, content, cache.TIMEOUT)
+    return content
+
+
+def get_touched_tiles(feed):
+    """
+    Returns the (z, x, y) of every tile the feed changed.
+
+    That's every tile showing the earthquakes the feed added or updated, where any copy of them sits.
+    """
+    usgs_ids = FeedChange.objects.filter(feed=feed).exclude(change=FeedChange.REMOVED).values("usgs_id")
+    qs = FeedEarthquake.objects.filter(usgs_id__in=usgs_ids, point__isnull=False).values_list("point", "mag")
+    # Keep the largest magnitude at each epicenter, which decides how far out it's drawn
+    points = {}
+    for point, mag in qs.iterator():
+        key = (point.x, point.y)
+        known = points.get(key)
+        if key not in points or (mag is not None and (known is None or mag > known)):
+            points[key] = mag
+
+    touched = set()
+    for z in range(MAX_ZOOM + 1):
+        min_mag = get_min_mag(z)
+        for (lng, lat), mag in points.items():
+            if min_mag is not None and (mag is None or mag < min_mag):
+                continue
+            touched.update((z, x, y) for x, y in get_tiles(lng, lat, z))
+    return touched
+
+
+def invalidate(feed):
+    """
+    Drops the cached tiles the feed changed.
+    """
+    keys = [get_tile_key(*t) for t in get_touched_tiles(feed)]
+    cache.get_cache().delete_many(keys)
+    logger.debug(f"Dropped {len(keys)} tiles")
+
+
+@receiver(feed_archived)
+def refresh(sender, feed, **kwargs):
+    """
+    Drops the tiles touched by a newly archived feed.
+    """
+    invalidate(feed)
@@ -0,0 +1,180 @@
+"""
+Sources the archive command can read feeds from.
+
+Each transport yields FeedItems in the order they should be archived. HTTPTransport pulls the live feed from
+the USGS. DirectoryTransport and ArchiveTransport replay feeds captured earlier, which lets the archive command
+run offline and push a long history through ingest for load tests.
+"""
+import logging
+import os
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from anss import archive
+from anss.models import Feed
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait to connect to the USGS and then for each read from it
+TIMEOUT = getattr(settings, "ANSS_HTTP_TIMEOUT", (5, 30))
+
+# How many times to retry failed connections and server errors
+RETRIES = getattr(settings, "ANSS_HTTP_RETRIES", 3)
+
+# How many connections to each host the shared session keeps open
+POOL_SIZE = getattr(settings, "ANSS_HTTP_POOL_SIZE", 10)
+
+# The USGS name for each Feed type and timeframe
+FEED_LEVELS = {
+    "significant": "significant",
+    "m4.5": "4.5",
+    "m2.5": "2.5",
+    "m1": "1.0",
+    "all": "all",
+}
+FEED_PERIODS = {
+    "one-hour": "hour",
+    "one-day": "day",
+    "one-week": "week",
+    "one-month": "month",
+}
+
+# Feeds that couldn't be downloaded at all have no status, and an error explaining why
+FeedItem = namedtuple("FeedItem", ("content", "archived_datetime", "status", "source", "error"), defaults=(None,))
+
+_session = None
+
+
+def get_feed_url(feed_type, timeframe, feed_format="geojson"):
+    """
+    Returns the URL of the USGS summary feed for the provided type and timeframe.
+    """
+    return (
+        "https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/"
+        f"{FEED_LEVELS[feed_type]}_{FEED_PERIODS[timeframe]}.{feed_format}"
+    )
+
+
+def get_session():
+    """
+    Returns a requests session shared by the process, so connections to the USGS are pooled and reused.
+    """
+    global _session
+    if _session is None:
+        retry = Retry(
+            total=RETRIES,
+            backoff_factor=0.5,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=("GET",),
+            # Hand back the last response once retries run out, so the failure is recorded like any other
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_maxsize=POOL_SIZE)
+        _session = requests.Session()
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+    return _session
+
+
+class HTTPTransport:
+    """
+    Fetches a single feed from a URL.
+    """
+
+    def __init__(self, url, timeout=TIMEOUT, session=None):
+        self.url = url
+        self.timeout = timeout
+        self.session = session or get_session()
+
+    def __iter__(self):
+        logger.debug(f"Requesting {self.url}")
+        try:
+            response = self.session.get(self.url, timeout=self.timeout)
+        except requests.RequestException as e:
+            yield FeedItem(content=b"", archived_datetime=None, status=None, source=self.url, error=str(e))
+            return
+        yield FeedItem(
+            content=response.content,
+            archived_datetime=None,
+            status=response.status_code,
+            source=self.url,
+        )
+
+
+class DirectoryTransport:
+    """
+    Replays the feeds saved as files in a directory and its subdirectories, sorted by path.
+
+    Files named for the time they were archived, like those in the MEDIA_ROOT, keep that time.
+    Other files are given the time they were last modified.
+    """
+
+    def __init__(self, path, extensions=(".json", ".geojson")):
+        self.path = path
+        self.extensions = extensions
+
+    def __iter__(self):
+        # Dated archive layouts sort oldest first
+        paths = sorted(
+            os.path.join(root, name)
+            for root, dirs, names in os.walk(self.path)
+            for name in names
+            if name.endswith(self.extensions)
+        )
+        for path in paths:
+            with open(path, "rb") as f:
+                content = f.read()
+            yield FeedItem(
+                content=content,
+                archived_datetime=self.get_archived_datetime(path),
+                status=200,
+                source=path,
+            )
+
+    def get_archived_datetime(self, path):
+        """
+        Returns the time the file at the path was archived.
+        """
+        archived_datetime = archive.parse_file_name(path)
+        if archived_datetime is not None:
+            return archived_datetime
+        stem = os.path.splitext(os.path.basename(path))[0]
+        try:
+            archived_datetime = datetime.fromisoformat(stem)
+        except ValueError:
+            return datetime.fromtimestamp(os.path.getmtime(path), tz=timezone.utc)
+        if archived_datetime.tzinfo is None:
+            archived_datetime = archived_datetime.replace(tzinfo=timezone.utc)
+        return archived_datetime
+
+
+class ArchiveTransport:
+    """
+    Replays the content of feeds already in the archive, oldest first, with their original archive times.
+    """
+
+    def __init__(self, start=None, end=None, queryset=None):
+        if queryset is None:
+            queryset = Feed.objects.all()
+        queryset = queryset.archived().select_related("segment")
+        if start is not None:
+            queryset = queryset.filter(archived_datetime__gte=start)
+        if end is not None:
+            queryset = queryset.filter(archived_datetime__lt=end)
+        # Loaded here, on the calling thread, since the pipeline reads the transport from a thread that
+        # can't use the database. Loading up front also skips the feeds replayed into the same table.
+        self.feeds = list(queryset.order_by("archived_datetime"))
+
+    def __iter__(self):
+        for feed in self.feeds:
+            yield FeedItem(
+                content=feed.read_content(),
+                archived_datetime=feed.archived_datetime,
+                status=200,
+                source=feed.content.name or f"{feed.segment.name}@{feed.segment_offset}",
+            )
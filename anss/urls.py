@@ -5,4 +5,7 @@ from anss import views
 urlpatterns = [
     path("feed/latest.json", views.LatestFeedView.as_view()),
     path("feed/list.json", views.FeedListView.as_view()),
+    path("changes.json", views.FeedChangeListView.as_view()),
+    path("quakes/nearby.json", views.NearbyEarthquakesView.as_view()),
+    path("tiles/<int:z>/<int:x>/<int:y>.mvt", views.TileView.as_view()),
 ]
@@ -1,31 +1,259 @@
 import json
+import math
+from datetime import timedelta
 
+from asgiref.sync import sync_to_async
+from django.contrib.gis.geos import Point
 from django.core import serializers
-from django.http import HttpResponse
-from django.views.generic import TemplateView
+from django.core.exceptions import BadRequest
+from django.db import models
+from django.http import Http404, HttpResponse
+from django.utils import timezone
+from django.views import View
 
-from anss.models import Feed
+from anss import cache, search, tiles
+from anss.models import Feed, FeedChange
 
 
-class BaseJsonView(TemplateView):
+class BaseJsonView(View):
+    """
+    An asynchronous view that returns JSON.
+
+    Subclasses override get_context_data, and optionally its async twin aget_context_data
+    and get_content to turn the context into JSON.
+    """
+
+    # The name responses are cached under. Views without one hit the database on every request.
+    cache_name = None
+
+    async def get(self, request, *args, **kwargs):
+        if self.cache_name is None:
+            content = await self.arender_content()
+        else:
+            content = await cache.aget_or_render(self.cache_name, self.arender_content)
+        return self.to_json_response(content)
+
+    def render_content(self, feed_id=None):
+        """
+        Returns the JSON the view responds with when the provided feed is the latest one.
+        """
+        return self.get_content(self.get_context_data(feed_id=feed_id))
+
+    async def arender_content(self, feed_id=None):
+        """
+        Returns the JSON the view responds with when the provided feed is the latest one, without blocking.
+        """
+        return self.get_content(await self.aget_context_data(feed_id=feed_id))
+
+    def get_context_data(self, **kwargs):
+        """
+        Returns what the view responds with. Subclasses override it.
+        """
+        return None
+
+    async def aget_context_data(self, **kwargs):
+        """
+        Returns the same as get_context_data without blocking.
+
+        By default, get_context_data runs in a thread, so any queries it makes share it rather than each
+        being awaited. Subclasses that make a single query can override it to use the async ORM.
+        """
+        return await sync_to_async(self.get_context_data)(**kwargs)
+
+    def get_content(self, context):
+        """
+        Returns the context as JSON. Subclasses override it to shape their response.
+        """
+        return json.dumps(context, indent=4)
+
     def to_json_response(self, content, **response_kwargs):
         return HttpResponse(content, content_type="application/json", **response_kwargs)
 
 
 class LatestFeedView(BaseJsonView):
-    def get_context_data(self, **kwargs):
-        return Feed.objects.latest()
+    cache_name = "latest-feed"
 
-    def render_to_response(self, context, **response_kwargs):
-        f = json.load(context.content)
-        d = json.dumps(f, indent=4)
-        return self.to_json_response(d)
+    def get_context_data(self, feed_id=None, **kwargs):
+        if feed_id is not None:
+            feed = Feed.objects.select_related("segment").get(id=feed_id)
+        else:
+            feed = Feed.objects.select_related("segment").latest()
+        return self.read_feed(feed)
+
+    async def aget_context_data(self, feed_id=None, **kwargs):
+        if feed_id is not None:
+            feed = await Feed.objects.select_related("segment").aget(id=feed_id)
+        else:
+            feed = await Feed.objects.select_related("segment").alatest()
+        # Read the file in a worker thread so slow storage doesn't hold up the event loop
+        return await sync_to_async(self.read_feed, thread_sensitive=False)(feed)
+
+    def read_feed(self, feed):
+        """
+        Returns the archived GeoJSON of the provided feed as a Python dictionary.
+        """
+        return json.loads(feed.read_content())
 
 
 class FeedListView(BaseJsonView):
-    def get_context_data(self, **kwargs):
+    cache_name = "feed-list"
+
+    def get_queryset(self):
         return Feed.objects.all()[:100]
 
-    def render_to_response(self, context, **response_kwargs):
-        object_list = serializers.serialize("json", context, indent=4)
-        return self.to_json_response(object_list)
+    def get_context_data(self, **kwargs):
+        return list(self.get_queryset())
+
+    async def aget_context_data(self, **kwargs):
+        return [f async for f in self.get_queryset()]
+
+    def get_content(self, context):
+        return serializers.serialize("json", context, indent=4)
+
+
+class FeedChangeListView(BaseJsonView):
+    """
+    Returns the earthquakes added, updated or dropped by archived feeds, oldest first.
+
+    Pass the cursor from the previous response as after to get the changes since then, and limit to
+    set how many are returned, up to max_results. Pass type or timeframe to only get the changes in those feeds.
+    """
+
+    default_results = 1000
+    max_results = 10000
+
+    def get_int_param(self, name, default):
+        value = self.request.GET.get(name, default)
+        try:
+            return int(value)
+        except ValueError:
+            raise BadRequest(f"The {name} parameter must be an integer")
+
+    def get_choice_filters(self):
+        """
+        Returns filters on the feed's type and timeframe from the request.
+        """
+        filters = {}
+        for name, choices in (("type", Feed.TYPE_CHOICES), ("timeframe", Feed.TIMEFRAME_CHOICES)):
+            value = self.request.GET.get(name)
+            if value is None:
+                continue
+            if value not in {c[0] for c in choices}:
+                raise BadRequest(f"The {name} parameter must be one of {', '.join(c[0] for c in choices)}")
+            filters[f"feed__{name}"] = value
+        return filters
+
+    def get_queryset(self):
+        after = self.get_int_param("after", 0)
+        limit = self.get_int_param("limit", self.default_results)
+        if not 0 < limit <= self.max_results:
+            raise BadRequest(f"The limit parameter must be between 1 and {self.max_results}")
+        return (
+            FeedChange.objects.filter(id__gt=after, **self.get_choice_filters())
+            .order_by("id")
+            .values(
+                "id",
+                "feed_id",
+                "usgs_id",
+                "change",
+                "updated",
+                type=models.F("feed__type"),
+                timeframe=models.F("feed__timeframe"),
+            )[:limit]
+        )
+
+    def get_context_data(self, **kwargs):
+        return self.paginate(list(self.get_queryset()))
+
+    async def aget_context_data(self, **kwargs):
+        return self.paginate([c async for c in self.get_queryset()])
+
+    def paginate(self, changes):
+        """
+        Returns the changes along with the cursor to request the next ones with.
+        """
+        cursor = changes[-1]["id"] if changes else self.get_int_param("after", 0)
+        return {"changes": changes, "cursor": cursor}
+
+
+class NearbyEarthquakesView(BaseJsonView):
+    """
+    Returns the latest copy of the archived earthquakes near a point as GeoJSON.
+
+    Requires lat and lng parameters. Pass km for every earthquake within that radius, which defaults to 50,
+    or k for the k nearest earthquakes. Pass days to only include earthquakes from that many recent days.
+    """
+
+    max_results = 1000
+
+    def get_float_param(self, name, default=None):
+        value = self.request.GET.get(name, default)
+        if value is None:
+            raise BadRequest(f"The {name} parameter is required")
+        try:
+            value = float(value)
+        except ValueError:
+            raise BadRequest(f"The {name} parameter must be a number")
+        # float() also accepts nan and inf, which the database can't search with
+        if not math.isfinite(value):
+            raise BadRequest(f"The {name} parameter must be a finite number")
+        return value
+
+    def get_context_data(self, **kwargs):
+        lat = self.get_float_param("lat")
+        lng = self.get_float_param("lng")
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise BadRequest("The lat and lng parameters must be valid coordinates")
+        point = Point(lng, lat, srid=4326)
+
+        since = None
+        if "days" in self.request.GET:
+            since = timezone.now() - timedelta(days=self.get_float_param("days"))
+
+        if "k" in self.request.GET:
+            k = int(self.get_float_param("k"))
+            if not 0 < k <= self.max_results:
+                raise BadRequest(f"The k parameter must be between 1 and {self.max_results}")
+            return list(search.search_nearest(point, k=k, since=since))
+
+        km = self.get_float_param("km", 50)
+        if not 0 < km <= 20000:
+            raise BadRequest("The km parameter must be between 0 and 20000")
+        return list(search.search_radius(point, km, since=since, limit=self.max_results))
+
+    def get_content(self, context):
+        features = [
+            {
+                "type": "Feature",
+                "id": obj.usgs_id,
+                "geometry": {
+                    "type": "Point",
+                    "coordinates": [obj.point.x, obj.point.y, obj.depth],
+                },
+                "properties": {
+                    "title": obj.title,
+                    "mag": obj.mag,
+                    "place": obj.place,
+                    "time": obj.time,
+                    "updated": obj.updated,
+                    "url": obj.url,
+                    "distance_km": round(obj.distance.km, 3),
+                },
+            }
+            for obj in context
+        ]
+        return json.dumps({"type": "FeatureCollection", "features": features}, indent=4)
+
+
+class TileView(View):
+    """
+    Returns a Mapbox vector tile of the latest copy of the archived earthquakes inside it.
+
+    Tiles zoomed out past the settings in ANSS_TILE_MIN_MAGS only include larger earthquakes.
+    """
+
+    async def get(self, request, z, x, y):
+        if not tiles.is_valid(z, x, y):
+            raise Http404(f"There is no tile {z}/{x}/{y}")
+        content = await sync_to_async(tiles.get_or_render)(z, x, y)
+        return HttpResponse(content, content_type=tiles.CONTENT_TYPE)
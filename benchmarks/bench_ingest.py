@@ -0,0 +1,79 @@
+import os
+import tempfile
+import time
+import tracemalloc
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from anss import testing
+from anss.models import Feed, FeedEarthquake
+
+from .results import count_queries, record
+
+# The feed sizes to archive. Add 1000000 for the largest feeds, which take a long time.
+SIZES = [int(s) for s in os.environ.get("ANSS_BENCHMARK_FEED_SIZES", "10,1000,100000").split(",")]
+
+
+class IngestBenchmark(TestCase):
+    """
+    Measures the throughput, query count and peak memory of the archive command
+    on synthetic feeds served from a local web server.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.media = override_settings(MEDIA_ROOT=cls.directory.name)
+        cls.media.enable()
+        cls.server = testing.FakeUSGSServer()
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        cls.media.disable()
+        cls.directory.cleanup()
+        super().tearDownClass()
+
+    def add_feed(self, size):
+        """
+        Writes a synthetic feed of the provided size to disk and serves it. Returns its URL and size in bytes.
+        """
+        path = os.path.join(self.directory.name, f"{size}.geojson")
+        with open(path, "w") as f:
+            testing.write_feed(f, size, generated=size)
+        self.server.add(f"/{size}.geojson", file_path=path)
+        return self.server.get_url(f"/{size}.geojson"), os.path.getsize(path)
+
+    def test_ingest(self):
+        for size in SIZES:
+            with self.subTest(size=size):
+                url, feed_bytes = self.add_feed(size)
+
+                with count_queries() as queries:
+                    start = time.perf_counter()
+                    call_command("getlatestanssfeed", url=url)
+                    seconds = time.perf_counter() - start
+                self.assertEqual(FeedEarthquake.objects.count(), size)
+                Feed.objects.all().delete()
+
+                # Measure memory in a second run, since tracing slows everything down
+                tracemalloc.start()
+                call_command("getlatestanssfeed", url=url)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                Feed.objects.all().delete()
+
+                record(
+                    "ingest",
+                    features=size,
+                    feed_bytes=feed_bytes,
+                    seconds=seconds,
+                    features_per_second=size / seconds,
+                    queries=queries.count,
+                    queries_per_feature=queries.count / size,
+                    peak_memory_bytes=peak,
+                    peak_memory_bytes_per_feature=peak / size,
+                )
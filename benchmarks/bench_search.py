@@ -0,0 +1,109 @@
+import os
+
+from django.contrib.gis.db import models
+from django.contrib.gis.geos import Point
+from django.contrib.gis.measure import D
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from anss import search
+from anss.functions import KNNDistance
+from anss.models import Feed, FeedEarthquake
+
+from .results import median_time, record
+
+
+def get_point_index():
+    """
+    Returns the name of the spatial index on FeedEarthquake.point, which Django generates with a hash.
+    """
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, FeedEarthquake._meta.db_table)
+    return next(name for name, c in constraints.items() if c["index"] and c["columns"] == ["point"])
+
+
+class SpatialSearchBenchmark(TestCase):
+    """
+    Measures radius and nearest-neighbor searches against a large synthetic archive
+    and checks that the database answers them with the spatial index.
+    """
+
+    rows = int(os.environ.get("ANSS_BENCHMARK_ROWS", 200000))
+    # How many feeds include each earthquake
+    copies = 20
+    point = Point(-118.25, 34.05, srid=4326)
+
+    @classmethod
+    def setUpTestData(cls):
+        feeds = Feed.objects.bulk_create(
+            [
+                Feed(archived_datetime=timezone.now(), type="m1", format="geojson", timeframe="one-hour")
+                for i in range(cls.copies)
+            ]
+        )
+        # Scatter the earthquakes across Southern California, repeating each one in every feed
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO anss_feedearthquake (
+                    feed_id, usgs_id, net, sources, code, ids, title, type, "magType", alert,
+                    place, url, detail, status, types, region_ids, mag, depth, time, occurred_datetime, point
+                )
+                SELECT
+                    (%(feeds)s::int[])[1 + i %% %(copies)s],
+                    'bench' || e, 'ci', '', '', '', '', 'earthquake', 'ml', '', '', '', '', 'automatic', '', '{}',
+                    1 + (e %% 40) / 10.0,
+                    (e %% 30)::float,
+                    t,
+                    to_timestamp(t / 1000.0),
+                    ST_SetSRID(
+                        ST_MakePoint(
+                            -125 + (e * 7919 %% 11000) / 1000.0,
+                            32 + (e * 104729 %% 10000) / 1000.0
+                        ),
+                        4326
+                    )
+                FROM generate_series(0, %(rows)s - 1) i,
+                LATERAL (SELECT i / %(copies)s AS e) events,
+                LATERAL (SELECT (1700000000000 + e * 60000)::bigint AS t) times
+                """,
+                {"feeds": [f.id for f in feeds], "copies": cls.copies, "rows": cls.rows},
+            )
+            cursor.execute("ANALYZE anss_feedearthquake")
+
+    def test_radius_search(self):
+        queryset = search.search_radius(self.point, 50)
+        self.assertIn(get_point_index(), queryset.explain())
+
+        indexed = median_time(lambda: list(search.search_radius(self.point, 50)))
+        # The same search written as a plain distance filter, which can't use the index
+        unindexed = median_time(
+            lambda: list(
+                FeedEarthquake.objects.filter(point__distance_lte=(self.point, D(km=50))).latest_versions()
+            )
+        )
+        record(
+            "radius_search",
+            rows=self.rows,
+            km=50,
+            results=queryset.count(),
+            indexed_seconds=indexed,
+            unindexed_seconds=unindexed,
+        )
+
+    def test_nearest_search(self):
+        target = models.Value(self.point, output_field=models.PointField(srid=4326))
+        ranked = FeedEarthquake.objects.order_by(KNNDistance("point", target))[:100]
+        self.assertIn(get_point_index(), ranked.explain())
+
+        results = list(search.search_nearest(self.point, k=10))
+        self.assertEqual(len(results), 10)
+        self.assertEqual(len({r.usgs_id for r in results}), 10)
+
+        record(
+            "nearest_search",
+            rows=self.rows,
+            k=10,
+            seconds=median_time(lambda: list(search.search_nearest(self.point, k=10))),
+        )
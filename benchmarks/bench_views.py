@@ -0,0 +1,83 @@
+import os
+import tempfile
+
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from anss import cache, testing
+from anss.models import Feed
+from anss.views import FeedListView, LatestFeedView
+
+from .results import count_queries, median_time, record
+
+# The number of earthquakes in the latest feed
+FEATURES = int(os.environ.get("ANSS_BENCHMARK_VIEW_FEATURES", 10000))
+
+# The number of older feeds in the archive
+FEEDS = int(os.environ.get("ANSS_BENCHMARK_VIEW_FEEDS", 1000))
+
+
+class ViewBenchmark(TestCase):
+    """
+    Measures the latency of the JSON views, with the cache cleared and with it warmed by the archive command.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.media = override_settings(MEDIA_ROOT=cls.directory.name)
+        cls.media.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media.disable()
+        cls.directory.cleanup()
+
+    @classmethod
+    def setUpTestData(cls):
+        Feed.objects.bulk_create(
+            [
+                Feed(archived_datetime=timezone.now(), type="m1", format="geojson", timeframe="one-hour")
+                for i in range(FEEDS)
+            ]
+        )
+        with testing.FakeUSGSServer() as server:
+            server.add("/feed.geojson", testing.make_feed(FEATURES))
+            call_command("getlatestanssfeed", url=server.get_url("/feed.geojson"))
+
+    def get(self, view, path):
+        response = async_to_sync(view.as_view())(RequestFactory().get(path))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def measure(self, name, view, path):
+        def cold():
+            cache.get_cache().clear()
+            self.get(view, path)
+
+        cache.get_cache().clear()
+        with count_queries() as cold_queries:
+            self.get(view, path)
+        with count_queries() as warm_queries:
+            self.get(view, path)
+
+        record(
+            name,
+            features=FEATURES,
+            feeds=FEEDS + 1,
+            cold_seconds=median_time(cold),
+            warm_seconds=median_time(lambda: self.get(view, path)),
+            cold_queries=cold_queries.count,
+            warm_queries=warm_queries.count,
+            response_bytes=len(self.get(view, path).content),
+        )
+
+    def test_latest_feed(self):
+        self.measure("latest_feed_view", LatestFeedView, "/feed/latest.json")
+
+    def test_feed_list(self):
+        self.measure("feed_list_view", FeedListView, "/feed/list.json")
@@ -0,0 +1,87 @@
+"""
+Collects benchmark measurements in a JSON file so releases can be compared.
+
+Results go to benchmark-results.json in the working directory, or the path in the
+ANSS_BENCHMARK_OUTPUT environment variable. Each run appends to the file.
+"""
+import json
+import os
+import platform
+import statistics
+import time
+from contextlib import contextmanager
+
+import django
+from django.db import connection
+from django.utils import timezone
+
+OUTPUT = os.environ.get("ANSS_BENCHMARK_OUTPUT", "benchmark-results.json")
+
+
+def get_environment():
+    """
+    Returns a description of the software the benchmarks ran on.
+    """
+    return {
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": connection.vendor,
+        "database_version": connection.pg_version if connection.vendor == "postgresql" else None,
+        "platform": platform.platform(),
+    }
+
+
+def record(benchmark, **metrics):
+    """
+    Appends a measurement to the results file.
+    """
+    try:
+        with open(OUTPUT) as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        data = {"runs": []}
+    data["runs"].append(
+        {
+            "benchmark": benchmark,
+            "recorded": timezone.now().isoformat(),
+            "environment": get_environment(),
+            "metrics": metrics,
+        }
+    )
+    with open(OUTPUT, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def median_time(func, repeat=5):
+    """
+    Calls the function several times and returns the median duration in seconds.
+    """
+    durations = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+class QueryCounter:
+    """
+    Counts the database queries run while it is installed, without storing them.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def count_queries():
+    """
+    Yields a QueryCounter that counts the queries run inside the block.
+    """
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        yield counter
@@ -38,6 +38,8 @@ def local_version(version):
 
 class TestCommand(Command):
     user_options = []
+    test_label = "anss"
+    pattern = "test*.py"
 
     def initialize_options(self):
         pass
@@ -59,12 +61,56 @@ class TestCommand(Command):
                     "USER": "postgres",
                     "ENGINE": "django.contrib.gis.db.backends.postgis",
                 },
+                # A second database for testing anss.routers. It isn't a real replica.
+                "replica": {
+                    "HOST": "localhost",
+                    "PORT": 5432,
+                    "NAME": "replica",
+                    "USER": "postgres",
+                    "ENGINE": "django.contrib.gis.db.backends.postgis",
+                },
             },
             MEDIA_ROOT="media",
-            INSTALLED_APPS=("anss",),
+            INSTALLED_APPS=(
+                "django.contrib.admin",
+                "django.contrib.auth",
+                "django.contrib.contenttypes",
+                "django.contrib.sessions",
+                "django.contrib.messages",
+                "anss",
+            ),
+            MIDDLEWARE=(
+                "django.contrib.sessions.middleware.SessionMiddleware",
+                "django.contrib.auth.middleware.AuthenticationMiddleware",
+                "django.contrib.messages.middleware.MessageMiddleware",
+            ),
+            TEMPLATES=[
+                {
+                    "BACKEND": "django.template.backends.django.DjangoTemplates",
+                    "APP_DIRS": True,
+                    "OPTIONS": {
+                        "context_processors": [
+                            "django.template.context_processors.request",
+                            "django.contrib.auth.context_processors.auth",
+                            "django.contrib.messages.context_processors.messages",
+                        ],
+                    },
+                },
+            ],
+            ROOT_URLCONF="anss.urls",
+            USE_TZ=True,
         )
         django.setup()
-        call_command("test", "anss")
+        call_command("test", self.test_label, pattern=self.pattern)
+
+
+class BenchmarkCommand(TestCommand):
+    """
+    Runs the performance benchmarks in the benchmarks directory against a test database.
+    """
+
+    test_label = "benchmarks"
+    pattern = "bench*.py"
 
 
 setup(
@@ -85,8 +131,13 @@ setup(
         "anss.management",
         "anss.management.commands",
     ),
-    cmdclass={"test": TestCommand},
-    install_requires=("requests", "pytz",),
+    cmdclass={"test": TestCommand, "benchmark": BenchmarkCommand},
+    install_requires=("django>=4.2", "requests", "pytz",),
+    extras_require={
+        "analytics": ("numpy",),
+        "clustering": ("numpy", "scipy"),
+        "regions": ("numpy", "shapely>=2.0"),
+    },
     classifiers=[
         "Development Status :: 5 - Production/Stable",
         "Programming Language :: Python",